@@ -0,0 +1,180 @@
+import argparse
+import difflib
+import importlib.util
+import io
+import os
+import re
+import sys
+import time
+
+from PIL import Image
+import PyPDF2
+
+# O organizador tem hífen no nome do arquivo: importado pelo caminho
+ORGANIZADOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "organizador_arquivos_contabeis-fiscais.py")
+
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp')
+
+
+def carregar_organizador():
+    """
+    Importa o script organizador como módulo
+    """
+    spec = importlib.util.spec_from_file_location("organizador", ORGANIZADOR_PATH)
+    modulo = importlib.util.module_from_spec(spec)
+    # Registrado antes da execução para que as regras compiladas possam ser guardadas em cache (pickle)
+    sys.modules[spec.name] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def normalizar(texto: str) -> str:
+    """
+    Normaliza espaços e caixa para a comparação com o texto de referência
+    """
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+def carregar_paginas(caminho: str):
+    """
+    Retorna as imagens de páginas de uma amostra (imagem ou PDF escaneado)
+    """
+    if caminho.lower().endswith('.pdf'):
+        paginas = []
+        with open(caminho, 'rb') as f:
+            for pagina in PyPDF2.PdfReader(f).pages:
+                for imagem in pagina.images:
+                    paginas.append(Image.open(io.BytesIO(imagem.data)))
+        return paginas
+    return [Image.open(caminho)]
+
+
+def listar_amostras(pasta: str):
+    """
+    Lista as amostras que possuem texto de referência (mesmo nome, extensão .txt)
+    """
+    amostras = []
+    for nome in sorted(os.listdir(pasta)):
+        base, ext = os.path.splitext(nome)
+        referencia = os.path.join(pasta, base + '.txt')
+        if ext.lower() in EXTENSOES_IMAGEM + ('.pdf',) and os.path.exists(referencia):
+            with open(referencia, 'r', encoding='utf-8', errors='ignore') as f:
+                amostras.append((os.path.join(pasta, nome), normalizar(f.read())))
+    return amostras
+
+
+def medir_configuracao(organizador, amostras, preprocessar: bool, dpi: int):
+    """
+    Executa o OCR de todas as amostras com uma configuração e retorna (s/página, precisão média)
+    """
+    organizador.OCR_PREPROCESS = preprocessar
+    organizador.OCR_TARGET_DPI = dpi
+    servico = organizador.get_ocr_service()
+
+    total_paginas = 0
+    total_segundos = 0.0
+    precisoes = []
+    for caminho, referencia in amostras:
+        paginas = carregar_paginas(caminho)
+        inicio = time.perf_counter()
+        textos = [servico.ocr_image(pagina) for pagina in paginas]
+        total_segundos += time.perf_counter() - inicio
+        total_paginas += len(paginas)
+        precisoes.append(difflib.SequenceMatcher(None, normalizar("\n".join(textos)), referencia).ratio())
+
+    segundos_por_pagina = total_segundos / total_paginas if total_paginas else 0.0
+    precisao = sum(precisoes) / len(precisoes) if precisoes else 0.0
+    return segundos_por_pagina, precisao
+
+
+def benchmark_ocr(args):
+    """
+    Compara tempo por página e precisão do OCR com e sem pré-processamento, em várias resoluções
+    """
+    amostras = listar_amostras(args.pasta)
+    if not amostras:
+        print(f"✗ Nenhuma amostra com texto de referência (.txt) encontrada em: {args.pasta}")
+        return 1
+
+    organizador = carregar_organizador()
+    # Um único motor: o tempo medido é o custo por página, sem paralelismo
+    organizador.OCR_ENGINES = 1
+
+    print(f"Amostras: {len(amostras)}")
+    print(f"{'Configuração':<28}{'s/página':>10}{'Precisão':>10}")
+    print("-" * 48)
+
+    configuracoes = [("Sem pré-processamento", False, organizador.OCR_TARGET_DPI)]
+    configuracoes += [(f"Pré-processamento {dpi} dpi", True, dpi) for dpi in args.dpi]
+    for descricao, preprocessar, dpi in configuracoes:
+        segundos_por_pagina, precisao = medir_configuracao(organizador, amostras, preprocessar, dpi)
+        print(f"{descricao:<28}{segundos_por_pagina:>10.2f}{precisao:>10.1%}")
+
+    return 0
+
+
+def benchmark_pdf(args):
+    """
+    Compara as bibliotecas de leitura de PDF instaladas (sem OCR) nos PDFs de uma pasta
+    """
+    pdfs = [os.path.join(args.pasta, nome) for nome in sorted(os.listdir(args.pasta)) if nome.lower().endswith('.pdf')]
+    if not pdfs:
+        print(f"✗ Nenhum PDF encontrado em: {args.pasta}")
+        return 1
+
+    organizador = carregar_organizador()
+    backends = [nome for nome, classe in organizador.PDF_BACKENDS.items() if classe is not None]
+    print(f"PDFs: {len(pdfs)}")
+    print(f"Bibliotecas instaladas: {', '.join(backends)}")
+    print(f"{'Biblioteca':<14}{'Páginas':>9}{'Segundos':>10}{'Páginas/s':>11}{'Caracteres':>12}")
+    print("-" * 56)
+
+    for nome in backends:
+        total_paginas = 0
+        total_caracteres = 0
+        inicio = time.perf_counter()
+        for caminho in pdfs:
+            try:
+                with open(caminho, 'rb') as f:
+                    backend = organizador.open_pdf_backend(f, nome)
+                    try:
+                        # Apenas o texto: as imagens para OCR não são carregadas
+                        for texto, _ in backend.iter_pages():
+                            total_paginas += 1
+                            total_caracteres += len(texto)
+                    finally:
+                        backend.close()
+            except Exception as e:
+                print(f"⚠ {nome}: erro ao ler {os.path.basename(caminho)}: {e}")
+        segundos = time.perf_counter() - inicio
+        paginas_por_segundo = total_paginas / segundos if segundos else 0.0
+        print(f"{nome:<14}{total_paginas:>9}{segundos:>10.2f}{paginas_por_segundo:>11.1f}{total_caracteres:>12}")
+
+    return 0
+
+
+def main():
+    """
+    Benchmarks da extração: OCR (tempo por página x precisão) e bibliotecas de PDF
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks da extração de texto")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    parser_ocr = subparsers.add_parser("ocr", help="Segundos por página x precisão do OCR, com e sem pré-processamento")
+    parser_ocr.add_argument("pasta", help="Pasta com amostras (imagens/PDFs escaneados) e o texto de referência em .txt de mesmo nome")
+    parser_ocr.add_argument("--dpi", type=int, nargs="+", default=[150, 200, 300, 400],
+                            help="Resoluções alvo a comparar (padrão: %(default)s)")
+    parser_ocr.set_defaults(funcao=benchmark_ocr)
+
+    parser_pdf = subparsers.add_parser("pdf", help="Compara as bibliotecas de leitura de PDF (ex.: extratos grandes)")
+    parser_pdf.add_argument("pasta", help="Pasta com os PDFs a comparar")
+    parser_pdf.set_defaults(funcao=benchmark_pdf)
+
+    args = parser.parse_args()
+    return args.funcao(args)
+
+
+if __name__ == "__main__":
+    exit_code = main()
+
+    print(f"\nBenchmark finalizado (código: {exit_code})")
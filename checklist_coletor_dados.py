@@ -1,11 +1,367 @@
 import requests
+from requests.adapters import HTTPAdapter
+import csv
+import glob
+import hashlib
 import json
 import os
+import re
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Callable
 
-class PendenciasExtractor:
+try:
+    # Opcional: leitura incremental do JSON (modo streaming)
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    # Opcional: saída em Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Modo streaming: lê a resposta aos poucos com ijson e grava os registros direto em disco,
+# mantendo a memória constante mesmo em respostas muito grandes (ex.: CTB). Requer ijson
+STREAMING_JSON = True
+
+# Formato de saída: 'json' (um documento por serviço/período, como antes), ou 'ndjson', 'csv' e 'parquet',
+# particionados em dados_extraidos/servico=XX/ano=AAAA/mes=MM/ com os metadados em metadados.json ao lado
+FORMATO_SAIDA = 'json'
+
+# Arquivo de metadados das partições; gravado por último, marca a partição como concluída
+ARQUIVO_METADADOS = 'metadados.json'
+
+# Registros por grupo de linhas (row group) nos arquivos Parquet
+TAMANHO_LOTE_PARQUET = 50000
+
+# Cache local das respostas da API, por URL (corpo + ETag/Last-Modified)
+PASTA_CACHE_HTTP = "cache_http"
+
+# Até esta idade, a resposta em cache é reutilizada sem consultar a API; depois disso, é revalidada
+# com uma requisição condicional (If-None-Match/If-Modified-Since), quando o servidor suporta
+CACHE_TTL_HORAS = 6
+
+# Com uma resposta em cache disponível, tentativas antes de usá-la (marcada como desatualizada)
+# em vez de esperar pelos timeouts de todas as tentativas
+TENTATIVAS_COM_CACHE = 1
+
+# Chaves em que a lista de itens pode estar quando a resposta é um objeto
+CHAVES_ITENS = ['items', 'data', 'pendencias', 'resultados', 'registros']
+
+# Tamanho dos blocos lidos da resposta no modo streaming
+TAMANHO_BLOCO_STREAMING = 64 * 1024
+
+# Erros de JSON inválido na leitura em streaming
+ERROS_JSON_STREAMING = (ijson.JSONError,) if ijson is not None else ()
+
+# Número máximo de requisições simultâneas (serviços x períodos)
+MAX_CONCORRENCIA = 4
+
+# Nome dos arquivos salvos no formato json: pendencias_{servico}_{ano}_{mes}_{timestamp}.json
+# (dados desatualizados, lidos do cache sem resposta da API, recebem o sufixo SUFIXO_DESATUALIZADO e não
+# correspondem ao padrão, para que o período seja consultado novamente ao retomar)
+SUFIXO_DESATUALIZADO = '_desatualizado'
+ARQUIVO_PENDENCIAS_PATTERN = re.compile(r'^pendencias_(.+)_(\d{4})_(\d{2})_\d{8}_\d{6}\.json$')
+
+# Partições dos demais formatos: servico={servico}/ano={ano}/mes={mes}
+PARTICAO_PATTERN = re.compile(r'^servico=(.+)$'), re.compile(r'^ano=(\d{4})$'), re.compile(r'^mes=(\d{2})$')
+
+class EstatisticasPendencias:
+    """
+    Estatísticas do resumo de um serviço, acumuladas registro a registro (sem manter os registros)
+    """
     def __init__(self):
+        self.clientes_unicos = set()
+        self.tipos_unicos = set()
+        self.obrigacoes_com_descricao = 0
+        self.primeiro = None
+        self.exemplo = None  # Primeiro registro com obrigacaoDescricao
+    
+    def adicionar(self, registro: Dict[str, Any]):
+        if self.primeiro is None:
+            self.primeiro = registro
+        if registro.get('idCliente'):
+            self.clientes_unicos.add(registro['idCliente'])
+        if registro.get('tipo'):
+            self.tipos_unicos.add(registro['tipo'])
+        if registro.get('obrigacaoDescricao'):
+            self.obrigacoes_com_descricao += 1
+            if self.exemplo is None:
+                self.exemplo = registro
+
+def _valor_texto(valor: Any) -> Any:
+    """
+    Converte um valor para as colunas de texto do CSV/Parquet (objetos e listas viram JSON)
+    """
+    if valor is None or isinstance(valor, str):
+        return valor
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+    return str(valor)
+
+class EscritorPendencias:
+    """
+    Base dos formatos de saída: grava os registros em disco à medida que são recebidos.
+    O arquivo é escrito com a extensão .parcial e só recebe o nome final ao concluir.
+    Nos formatos particionados, os metadados são gravados ao lado, em ARQUIVO_METADADOS
+    """
+    extensao = ''
+    particionado = True
+    
+    def __init__(self, filepath: str, colunas: List[str]):
+        self.filepath = filepath
+        self.caminho_parcial = filepath + '.parcial'
+        self.colunas = colunas
+        self.total = 0
+        self._abrir()
+    
+    def escrever(self, registro: Dict[str, Any]):
+        self._escrever(registro)
+        self.total += 1
+    
+    def concluir(self, metadados: Dict[str, Any]) -> str:
+        self._finalizar(metadados)
+        self._fechar()
+        if not self.particionado:
+            os.replace(self.caminho_parcial, self.filepath)
+            return self.filepath
+        
+        # Sem metadados a partição conta como não concluída: removidos antes de substituir os dados
+        caminho_metadados = os.path.join(os.path.dirname(self.filepath), ARQUIVO_METADADOS)
+        if os.path.exists(caminho_metadados):
+            os.remove(caminho_metadados)
+        os.replace(self.caminho_parcial, self.filepath)
+        with open(caminho_metadados + '.parcial', 'w', encoding='utf-8') as f:
+            json.dump({**metadados, 'formato': self.extensao, 'arquivo': os.path.basename(self.filepath)},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(caminho_metadados + '.parcial', caminho_metadados)
+        return self.filepath
+    
+    def descartar(self):
+        self._fechar()
+        if os.path.exists(self.caminho_parcial):
+            os.remove(self.caminho_parcial)
+    
+    def _abrir(self):
+        raise NotImplementedError
+    
+    def _escrever(self, registro: Dict[str, Any]):
+        raise NotImplementedError
+    
+    def _finalizar(self, metadados: Dict[str, Any]):
+        pass
+    
+    def _fechar(self):
+        self._arquivo.close()
+
+class EscritorPendenciasJSON(EscritorPendencias):
+    """
+    Um documento por serviço/período: {"dados": [...], "metadados": {...}}
+    """
+    extensao = 'json'
+    particionado = False
+    
+    def _abrir(self):
+        self._arquivo = open(self.caminho_parcial, 'w', encoding='utf-8')
+        self._arquivo.write('{\n  "dados": [')
+    
+    def _escrever(self, registro: Dict[str, Any]):
+        separador = ',' if self.total else ''
+        self._arquivo.write(f'{separador}\n    {json.dumps(registro, ensure_ascii=False)}')
+    
+    def _finalizar(self, metadados: Dict[str, Any]):
+        metadados_json = json.dumps(metadados, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+        self._arquivo.write(f'\n  ],\n  "metadados": {metadados_json}\n}}\n')
+
+class EscritorPendenciasNDJSON(EscritorPendencias):
+    """
+    Um registro JSON por linha: pode ser lido em streaming ou concatenado
+    """
+    extensao = 'ndjson'
+    
+    def _abrir(self):
+        self._arquivo = open(self.caminho_parcial, 'w', encoding='utf-8')
+    
+    def _escrever(self, registro: Dict[str, Any]):
+        self._arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+class EscritorPendenciasCSV(EscritorPendencias):
+    """
+    CSV separado por ';' (abre direto no Excel), uma coluna por campo extraído
+    """
+    extensao = 'csv'
+    
+    def _abrir(self):
+        self._arquivo = open(self.caminho_parcial, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._arquivo, delimiter=';')
+        self._writer.writerow(self.colunas)
+    
+    def _escrever(self, registro: Dict[str, Any]):
+        self._writer.writerow([_valor_texto(registro.get(coluna)) for coluna in self.colunas])
+
+class EscritorPendenciasParquet(EscritorPendencias):
+    """
+    Parquet com todas as colunas como texto (os tipos da API variam), gravado em grupos de
+    TAMANHO_LOTE_PARQUET registros para manter a memória limitada. Requer pyarrow
+    """
+    extensao = 'parquet'
+    
+    def _abrir(self):
+        self._schema = pa.schema([(coluna, pa.string()) for coluna in self.colunas])
+        self._writer = pq.ParquetWriter(self.caminho_parcial, self._schema)
+        self._lote = []
+    
+    def _escrever(self, registro: Dict[str, Any]):
+        self._lote.append({coluna: _valor_texto(registro.get(coluna)) for coluna in self.colunas})
+        if len(self._lote) >= TAMANHO_LOTE_PARQUET:
+            self._gravar_lote()
+    
+    def _gravar_lote(self):
+        if self._lote:
+            self._writer.write_table(pa.Table.from_pylist(self._lote, schema=self._schema))
+            self._lote = []
+    
+    def _finalizar(self, metadados: Dict[str, Any]):
+        self._gravar_lote()
+    
+    def _fechar(self):
+        self._writer.close()
+
+FORMATOS_SAIDA = {
+    'json': EscritorPendenciasJSON,
+    'ndjson': EscritorPendenciasNDJSON,
+    'csv': EscritorPendenciasCSV,
+    'parquet': EscritorPendenciasParquet,
+}
+
+class LeitorResposta:
+    """
+    Adapta response.iter_content a um objeto de arquivo (read) para o ijson/json.load. Erros de rede
+    durante a leitura continuam chegando como exceções do requests (e são tratados pelas novas tentativas).
+    Com copia, cada bloco lido também é gravado nela (ex.: cache das respostas)
+    """
+    def __init__(self, response: requests.Response, tamanho_bloco: int = TAMANHO_BLOCO_STREAMING, copia=None):
+        self._blocos = response.iter_content(tamanho_bloco)
+        self._buffer = bytearray()
+        self._copia = copia
+        self.bytes_lidos = 0
+    
+    def read(self, tamanho: int = -1) -> bytes:
+        while tamanho < 0 or len(self._buffer) < tamanho:
+            bloco = next(self._blocos, None)
+            if bloco is None:
+                break
+            self._buffer += bloco
+            self.bytes_lidos += len(bloco)
+            if self._copia is not None:
+                self._copia.write(bloco)
+        if tamanho < 0:
+            tamanho = len(self._buffer)
+        dados = bytes(self._buffer[:tamanho])
+        del self._buffer[:tamanho]
+        return dados
+
+class GravacaoCache:
+    """
+    Grava o corpo de uma resposta no cache enquanto ela é lida; só substitui a entrada anterior ao concluir
+    """
+    def __init__(self, cache: 'CacheRespostas', url: str, response: requests.Response):
+        self._cache = cache
+        self._url = url
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+        self._caminho_indice, self._caminho_corpo = cache.caminhos(url)
+        self._arquivo = open(self._caminho_corpo + '.parcial', 'wb')
+    
+    def write(self, bloco: bytes):
+        self._arquivo.write(bloco)
+    
+    def concluir(self):
+        self._arquivo.close()
+        os.replace(self._caminho_corpo + '.parcial', self._caminho_corpo)
+        self._cache.salvar_entrada(self._url, {
+            'url': self._url,
+            'etag': self._etag,
+            'last_modified': self._last_modified,
+            'data_resposta': datetime.now().isoformat(),
+        })
+    
+    def descartar(self):
+        self._arquivo.close()
+        if os.path.exists(self._caminho_corpo + '.parcial'):
+            os.remove(self._caminho_corpo + '.parcial')
+
+class CacheRespostas:
+    """
+    Cache local das respostas HTTP, por URL: o corpo em <hash>.body e, em <hash>.json, o ETag/Last-Modified
+    e a data da resposta (usada para o TTL)
+    """
+    def __init__(self, pasta: str = PASTA_CACHE_HTTP, ttl_horas: float = CACHE_TTL_HORAS):
+        self.pasta = pasta
+        self.ttl_segundos = ttl_horas * 3600
+        os.makedirs(self.pasta, exist_ok=True)
+    
+    def caminhos(self, url: str) -> Tuple[str, str]:
+        chave = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.pasta, chave + '.json'), os.path.join(self.pasta, chave + '.body')
+    
+    def consultar(self, url: str) -> Dict[str, Any]:
+        """
+        Retorna a entrada em cache da URL, ou None
+        """
+        caminho_indice, caminho_corpo = self.caminhos(url)
+        if not (os.path.exists(caminho_indice) and os.path.exists(caminho_corpo)):
+            return None
+        try:
+            with open(caminho_indice, 'r', encoding='utf-8') as f:
+                entrada = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return entrada if entrada.get('url') == url else None
+    
+    def idade(self, entrada: Dict[str, Any]) -> float:
+        return (datetime.now() - datetime.fromisoformat(entrada['data_resposta'])).total_seconds()
+    
+    def valida(self, entrada: Dict[str, Any]) -> bool:
+        return self.idade(entrada) < self.ttl_segundos
+    
+    def cabecalhos_condicionais(self, entrada: Dict[str, Any]) -> Dict[str, str]:
+        cabecalhos = {}
+        if entrada.get('etag'):
+            cabecalhos['If-None-Match'] = entrada['etag']
+        if entrada.get('last_modified'):
+            cabecalhos['If-Modified-Since'] = entrada['last_modified']
+        return cabecalhos
+    
+    def abrir(self, url: str):
+        return open(self.caminhos(url)[1], 'rb')
+    
+    def gravar(self, url: str, response: requests.Response) -> GravacaoCache:
+        return GravacaoCache(self, url, response)
+    
+    def renovar(self, url: str, entrada: Dict[str, Any], response: requests.Response):
+        """
+        Resposta 304: a entrada continua válida a partir de agora
+        """
+        entrada['etag'] = response.headers.get('ETag') or entrada.get('etag')
+        entrada['last_modified'] = response.headers.get('Last-Modified') or entrada.get('last_modified')
+        entrada['data_resposta'] = datetime.now().isoformat()
+        self.salvar_entrada(url, entrada)
+    
+    def salvar_entrada(self, url: str, entrada: Dict[str, Any]):
+        caminho_indice = self.caminhos(url)[0]
+        with open(caminho_indice + '.parcial', 'w', encoding='utf-8') as f:
+            json.dump(entrada, f, ensure_ascii=False, indent=2)
+        os.replace(caminho_indice + '.parcial', caminho_indice)
+
+class PendenciasExtractor:
+    def __init__(self, max_concorrencia: int = MAX_CONCORRENCIA, streaming: bool = STREAMING_JSON,
+                 formato: str = FORMATO_SAIDA, cache: bool = True, cache_ttl_horas: float = CACHE_TTL_HORAS):
         self.base_url = "http://intranet:xxxx/services/checklist/api/pendencias/ListarPendencias"
         self.campos_extrair = [
             'obrigacaoDescricao',
@@ -13,8 +369,28 @@ class PendenciasExtractor:
             'tipo'
         ]
         self.pasta_dados = "dados_extraidos"
+        self.max_concorrencia = max_concorrencia
+        if streaming and ijson is None:
+            print("⚠ ijson não instalado: modo streaming desativado (a resposta será lida inteira na memória)")
+        self.streaming = streaming and ijson is not None
+        if formato == 'parquet' and pa is None:
+            print("⚠ pyarrow não instalado: os dados serão salvos em CSV em vez de Parquet")
+            formato = 'csv'
+        self.formato = formato
+        self.cache = CacheRespostas(PASTA_CACHE_HTTP, cache_ttl_horas) if cache else None
+        self.session = self._criar_sessao()
         self._criar_pasta_dados()
     
+    def _criar_sessao(self) -> requests.Session:
+        """
+        Cria a sessão HTTP compartilhada, com um pool de conexões do tamanho da concorrência
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_concorrencia, pool_maxsize=self.max_concorrencia)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
     def _criar_pasta_dados(self):
         """
         Cria a pasta dados_extraidos se não existir
@@ -25,11 +401,27 @@ class PendenciasExtractor:
         else:
             print(f"Pasta '{self.pasta_dados}' já existe.")
     
-    def fazer_requisicao(self, url: str, tentativas: int = 3) -> Dict[str, Any]:
+    def fazer_requisicao(self, url: str, tentativas: int = 3, ao_receber: Callable[[Any], Any] = None,
+                         metadados: Dict[str, Any] = None) -> Dict[str, Any]:
         """
-        Faz requisição HTTP e retorna dados JSON com múltiplas tentativas
+        Faz requisição HTTP e retorna dados JSON com múltiplas tentativas.
+        Com ao_receber, o corpo é lido em streaming e o retorno é o de ao_receber(fluxo), sendo fluxo
+        um objeto de arquivo binário (da rede ou do cache).
+        Com o cache ativo, reutiliza a resposta em cache dentro do TTL, revalida-a com uma requisição
+        condicional depois disso e, se a API não responder, usa a última resposta obtida.
+        A origem da resposta (e se está desatualizada) é registrada em metadados
         """
         timeouts = [300, 450, 600]  # Timeouts: 5min, 7.5min, 10min
+        ler = ao_receber or json.load
+        
+        entrada = self.cache.consultar(url) if self.cache else None
+        if entrada is not None:
+            idade = _formatar_duracao(self.cache.idade(entrada))
+            if self.cache.valida(entrada):
+                print(f"✓ Resposta em cache reutilizada (obtida há {idade}): {url}")
+                return self._ler_cache(url, entrada, ler, metadados, desatualizado=False)
+            # Com a resposta anterior como alternativa, não espera pelos timeouts de todas as tentativas
+            tentativas = min(tentativas, TENTATIVAS_COM_CACHE)
         
         for tentativa in range(tentativas):
             timeout_atual = timeouts[min(tentativa, len(timeouts)-1)]
@@ -41,13 +433,30 @@ class PendenciasExtractor:
                 print(f"Tentativa {tentativa + 1}/{tentativas} - Timeout: {timeout_min}min {timeout_seg}s")
                 print(f"⏱ Aguardando resposta... (pode demorar)")
                 
-                response = requests.get(url, timeout=timeout_atual)
-                response.raise_for_status()
-                
-                print(f"✓ Requisição bem-sucedida - Status: {response.status_code}")
-                print(f"✓ Tamanho da resposta: {len(response.content)} bytes")
-                
-                return response.json()
+                cabecalhos = self.cache.cabecalhos_condicionais(entrada) if entrada is not None else {}
+                with self.session.get(url, timeout=timeout_atual, stream=True, headers=cabecalhos) as response:
+                    if response.status_code == 304 and entrada is not None:
+                        print(f"✓ Resposta não modificada (304): usando o cache")
+                        self.cache.renovar(url, entrada, response)
+                        return self._ler_cache(url, entrada, ler, metadados, desatualizado=False)
+                    response.raise_for_status()
+                    
+                    print(f"✓ Requisição bem-sucedida - Status: {response.status_code}")
+                    _registrar_origem(metadados, 'api', datetime.now().isoformat(), desatualizado=False)
+                    # O corpo é gravado no cache enquanto é lido; a entrada só é substituída se a leitura terminar
+                    gravacao = self.cache.gravar(url, response) if self.cache else None
+                    leitor = LeitorResposta(response, copia=gravacao)
+                    try:
+                        dados = ler(leitor)
+                    except BaseException:
+                        if gravacao is not None:
+                            gravacao.descartar()
+                        raise
+                    if gravacao is not None:
+                        gravacao.concluir()
+                    print(f"✓ Tamanho da resposta: {leitor.bytes_lidos} bytes")
+                    
+                    return dados
                 
             except requests.exceptions.ReadTimeout as e:
                 print(f"⚠ Timeout na tentativa {tentativa + 1}: {timeout_min}min {timeout_seg}s")
@@ -63,12 +472,28 @@ class PendenciasExtractor:
                 else:
                     print(f"✗ Todas as tentativas falharam: {e}")
                     
-            except json.JSONDecodeError as e:
+            except (json.JSONDecodeError, *ERROS_JSON_STREAMING) as e:
                 print(f"✗ Erro ao decodificar JSON: {e}")
                 return {}
         
+        if entrada is not None:
+            print(f"⚠ API sem resposta: usando a última resposta em cache, DESATUALIZADA (obtida há {idade})")
+            return self._ler_cache(url, entrada, ler, metadados, desatualizado=True)
         return {}
     
+    def _ler_cache(self, url: str, entrada: Dict[str, Any], ler: Callable[[Any], Any],
+                   metadados: Dict[str, Any], desatualizado: bool) -> Any:
+        """
+        Lê a resposta em cache de uma URL com a mesma função usada para a resposta da rede
+        """
+        _registrar_origem(metadados, 'cache', entrada['data_resposta'], desatualizado)
+        try:
+            with self.cache.abrir(url) as fluxo:
+                return ler(fluxo)
+        except (json.JSONDecodeError, *ERROS_JSON_STREAMING) as e:
+            print(f"✗ Erro ao decodificar JSON do cache: {e}")
+            return {}
+    
     def extrair_campos(self, dados: Any, tipo_servico: str) -> List[Dict[str, Any]]:
         """
         Extrai os campos especificados dos dados JSON
@@ -85,10 +510,9 @@ class PendenciasExtractor:
         elif isinstance(dados, dict):
             # Tenta encontrar a lista de itens dentro do dicionário
             # Procura por várias possíveis chaves que podem conter os dados
-            chaves_possiveis = ['items', 'data', 'pendencias', 'resultados', 'registros']
             itens = None
             
-            for chave in chaves_possiveis:
+            for chave in CHAVES_ITENS:
                 if chave in dados:
                     itens = dados[chave]
                     print(f"Dados encontrados na chave '{chave}'")
@@ -136,6 +560,92 @@ class PendenciasExtractor:
         print(f"Total de registros extraídos de {tipo_servico}: {len(registros_extraidos)}")
         return registros_extraidos
     
+    def extrair_campos_streaming(self, fluxo, tipo_servico: str,
+                                 ao_registro: Callable[[Dict[str, Any]], None]) -> int:
+        """
+        Versão incremental de extrair_campos: percorre os eventos do ijson sem montar o JSON na memória,
+        projeta apenas campos_extrair e entrega cada registro a ao_registro. Retorna o total de registros.
+        Se a resposta tiver mais de uma chave de CHAVES_ITENS, vale a primeira que aparecer no documento
+        """
+        prefixo_itens = None   # 'item' (lista na raiz), '<chave>.item' (lista na chave) ou '<chave>' (objeto único)
+        campos_item = {}       # Prefixo ijson -> campo, dentro de um item
+        chave_itens = None     # Chave de CHAVES_ITENS encontrada, aguardando o início do seu valor
+        campos_raiz = None     # Campos do próprio objeto raiz, usados se nenhuma chave de CHAVES_ITENS existir
+        registro = None
+        construtor = None      # Monta valores compostos (objetos/listas) de um campo extraído
+        nivel = 0
+        ignorados = 0
+        total = 0
+        
+        for prefixo, evento, valor in ijson.parse(fluxo, use_float=True):
+            if construtor is not None:
+                construtor.event(evento, valor)
+                if evento in ('start_map', 'start_array'):
+                    nivel += 1
+                elif evento in ('end_map', 'end_array'):
+                    nivel -= 1
+                    if nivel == 0:
+                        destino[campo] = construtor.value
+                        construtor = None
+                continue
+            
+            if prefixo == '':
+                if evento == 'start_array':
+                    prefixo_itens = 'item'
+                    print(f"Dados são uma lista (leitura em streaming)")
+                elif evento == 'start_map':
+                    campos_raiz = {}
+                elif evento == 'map_key' and prefixo_itens is None and valor in CHAVES_ITENS:
+                    chave_itens = valor
+                    print(f"Dados encontrados na chave '{valor}'")
+                continue
+            
+            if chave_itens is not None and prefixo == chave_itens:
+                # Primeiro evento do valor da chave: lista de itens ou um objeto como item único
+                prefixo_itens = f'{chave_itens}.item' if evento == 'start_array' else chave_itens
+                chave_itens = None
+                if evento == 'start_array':
+                    continue
+            
+            if prefixo_itens is not None and prefixo == prefixo_itens:
+                if evento == 'start_map':
+                    registro = dict.fromkeys(self.campos_extrair)
+                    campos_item = {f'{prefixo_itens}.{campo}': campo for campo in self.campos_extrair}
+                elif evento == 'end_map':
+                    registro['tipoServico'] = tipo_servico
+                    ao_registro(registro)
+                    total += 1
+                    registro = None
+                elif evento != 'map_key' and evento != 'end_array':
+                    ignorados += 1
+                continue
+            
+            if registro is not None and prefixo in campos_item:
+                destino, campo = registro, campos_item[prefixo]
+            elif campos_raiz is not None and prefixo_itens is None and prefixo in self.campos_extrair:
+                destino, campo = campos_raiz, prefixo
+            else:
+                continue
+            
+            if evento in ('start_map', 'start_array'):
+                construtor = ijson.ObjectBuilder()
+                construtor.event(evento, valor)
+                nivel = 1
+            elif evento != 'map_key':
+                destino[campo] = valor
+        
+        if prefixo_itens is None and campos_raiz is not None:
+            print(f"Usando o próprio dicionário como item único")
+            registro = {campo: campos_raiz.get(campo) for campo in self.campos_extrair}
+            registro['tipoServico'] = tipo_servico
+            ao_registro(registro)
+            total += 1
+        
+        if ignorados:
+            print(f"{ignorados} item(ns) de {tipo_servico} não são dicionários e foram ignorados")
+        print(f"Total de registros extraídos de {tipo_servico}: {total}")
+        return total
+    
     def processar_servico(self, tipo_servico: str, mes: int = 6, ano: int = 2025) -> Dict[str, Any]:
         """
         Processa dados de um serviço específico
@@ -158,7 +668,7 @@ class PendenciasExtractor:
         print(f"\nProcessando dados de {tipo_servico}...")
         
         # Faz requisição com múltiplas tentativas
-        dados = self.fazer_requisicao(url, tentativas=3)
+        dados = self.fazer_requisicao(url, tentativas=3, metadados=resultado['metadados'])
         
         if dados:
             # Extrai campos
@@ -173,21 +683,209 @@ class PendenciasExtractor:
         
         return resultado
     
+    def processar_servico_streaming(self, tipo_servico: str, mes: int = 6, ano: int = 2025) -> Tuple[Dict[str, Any], str]:
+        """
+        Processa dados de um serviço em streaming: os registros são gravados em disco enquanto a resposta
+        é lida, e apenas as estatísticas do resumo ficam na memória. Retorna o resultado e o arquivo salvo
+        """
+        url = f"{self.base_url}/{tipo_servico}?mes={mes}&ano={ano}"
+        
+        resultado = {
+            'metadados': {
+                'data_extracao': datetime.now().isoformat(),
+                'tipo_servico': tipo_servico,
+                'mes': mes,
+                'ano': ano,
+                'url': url,
+                'total_registros': 0,
+                'status': 'erro'
+            },
+            'dados': [],
+            'estatisticas': EstatisticasPendencias()
+        }
+        
+        print(f"\nProcessando dados de {tipo_servico} (streaming)...")
+        
+        def ao_receber(fluxo) -> str:
+            # Recomeça do zero a cada tentativa: descarta o arquivo parcial se a leitura falhar
+            # A origem da resposta (rede ou cache desatualizado) já está registrada nos metadados
+            escritor = self._criar_escritor(tipo_servico, mes, ano, resultado['metadados'].get('desatualizado', False))
+            estatisticas = EstatisticasPendencias()
+            
+            def ao_registro(registro: Dict[str, Any]):
+                escritor.escrever(registro)
+                estatisticas.adicionar(registro)
+            
+            try:
+                self.extrair_campos_streaming(fluxo, tipo_servico, ao_registro)
+            except BaseException:
+                escritor.descartar()
+                raise
+            
+            resultado['metadados']['total_registros'] = escritor.total
+            resultado['metadados']['status'] = 'sucesso'
+            resultado['estatisticas'] = estatisticas
+            return escritor.concluir(resultado['metadados'])
+        
+        # Faz requisição com múltiplas tentativas
+        filepath = self.fazer_requisicao(url, tentativas=3, ao_receber=ao_receber, metadados=resultado['metadados'])
+        
+        if filepath:
+            print(f"✓ {resultado['metadados']['total_registros']} registros extraídos de {tipo_servico}")
+            print(f"✓ Dados de {tipo_servico} salvos em: {filepath}")
+        else:
+            filepath = None
+            print(f"✗ Nenhum dado obtido de {tipo_servico}")
+        
+        return resultado, filepath
+    
+    def periodos_concluidos(self) -> set:
+        """
+        Retorna os (servico, mes, ano) já extraídos com sucesso na pasta de dados, em qualquer formato.
+        Períodos salvos com dados desatualizados (do cache, sem resposta da API) não contam como concluídos
+        """
+        concluidos = set()
+        for nome in os.listdir(self.pasta_dados):
+            match = ARQUIVO_PENDENCIAS_PATTERN.match(nome)
+            if match:
+                tipo_servico, ano, mes = match.groups()
+                concluidos.add((tipo_servico, int(mes), int(ano)))
+        
+        # Partições concluídas: as que já têm o arquivo de metadados
+        for caminho in glob.glob(os.path.join(self.pasta_dados, 'servico=*', 'ano=*', 'mes=*', ARQUIVO_METADADOS)):
+            partes = os.path.relpath(os.path.dirname(caminho), self.pasta_dados).split(os.sep)
+            matches = [pattern.match(parte) for pattern, parte in zip(PARTICAO_PATTERN, partes)]
+            if len(partes) == len(PARTICAO_PATTERN) and all(matches):
+                try:
+                    with open(caminho, 'r', encoding='utf-8') as f:
+                        desatualizado = json.load(f).get('desatualizado', False)
+                except (OSError, json.JSONDecodeError):
+                    continue
+                if desatualizado:
+                    continue
+                tipo_servico, ano, mes = (match.group(1) for match in matches)
+                concluidos.add((tipo_servico, int(mes), int(ano)))
+        return concluidos
+    
+    def _executar_tarefa(self, tipo_servico: str, mes: int, ano: int) -> Tuple[Dict[str, Any], str, float]:
+        """
+        Processa um serviço/período e salva o resultado assim que concluído (permite retomar a execução)
+        """
+        inicio = time.perf_counter()
+        if self.streaming:
+            # Os registros já são gravados durante a leitura da resposta
+            resultado, filepath = self.processar_servico_streaming(tipo_servico, mes, ano)
+            return resultado, filepath, time.perf_counter() - inicio
+        
+        resultado = self.processar_servico(tipo_servico, mes, ano)
+        filepath = None
+        # Salva também períodos sem pendências, para que não sejam consultados novamente ao retomar
+        if resultado['metadados']['status'] == 'sucesso':
+            filepath = self.salvar_dados(resultado, tipo_servico, mes, ano)
+        return resultado, filepath, time.perf_counter() - inicio
+    
+    def processar_periodos(self, servicos: List[str], periodos: List[Tuple[int, int]],
+                           pular_concluidos: bool = False) -> Tuple[Dict[Tuple[str, int, int], Dict[str, Any]], List[str]]:
+        """
+        Processa todos os serviços e períodos (mes, ano) em uma fila limitada a max_concorrencia requisições,
+        salvando cada resultado ao concluir. Retorna os resultados e os arquivos salvos
+        """
+        tarefas = [(tipo_servico, mes, ano) for mes, ano in periodos for tipo_servico in servicos]
+        if pular_concluidos:
+            concluidos = self.periodos_concluidos()
+            pulados = [tarefa for tarefa in tarefas if tarefa in concluidos]
+            tarefas = [tarefa for tarefa in tarefas if tarefa not in concluidos]
+            if pulados:
+                print(f"↷ {len(pulados)} período(s) já extraído(s) em '{self.pasta_dados}' serão pulados")
+        print(f"Tarefas a executar: {len(tarefas)}")
+        
+        resultados = {}
+        arquivos_salvos = []
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_concorrencia) as executor:
+            futuros = {executor.submit(self._executar_tarefa, *tarefa): tarefa for tarefa in tarefas}
+            for concluidas, futuro in enumerate(as_completed(futuros), 1):
+                tipo_servico, mes, ano = futuros[futuro]
+                try:
+                    resultado, filepath, latencia = futuro.result()
+                except Exception as e:
+                    print(f"✗ Erro ao processar {tipo_servico} {mes:02d}/{ano}: {e}")
+                    continue
+                resultados[(tipo_servico, mes, ano)] = resultado
+                if filepath:
+                    arquivos_salvos.append(filepath)
+                
+                # Latência da tarefa e estimativa para as restantes, pelo ritmo médio até aqui
+                decorrido = time.perf_counter() - inicio
+                eta = decorrido / concluidas * (len(tarefas) - concluidas)
+                print(f"⏱ [{concluidas}/{len(tarefas)}] {tipo_servico} {mes:02d}/{ano}: "
+                      f"{resultado['metadados']['status']} em {_formatar_duracao(latencia)} - ETA: {_formatar_duracao(eta)}")
+        return resultados, arquivos_salvos
+    
+    def _caminho_arquivo(self, tipo_servico: str, mes: int, ano: int, desatualizado: bool = False) -> str:
+        """
+        Caminho do arquivo de um serviço/período: nome com timestamp no formato json
+        (ver ARQUIVO_PENDENCIAS_PATTERN), ou a partição servico=/ano=/mes= nos demais formatos
+        """
+        escritor = FORMATOS_SAIDA[self.formato]
+        if not escritor.particionado:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            sufixo = SUFIXO_DESATUALIZADO if desatualizado else ''
+            filename = f'pendencias_{tipo_servico}_{ano}_{mes:02d}_{timestamp}{sufixo}.json'
+            return os.path.join(self.pasta_dados, filename)
+        
+        pasta = os.path.join(self.pasta_dados, f'servico={tipo_servico}', f'ano={ano}', f'mes={mes:02d}')
+        os.makedirs(pasta, exist_ok=True)
+        return os.path.join(pasta, f'pendencias.{escritor.extensao}')
+    
+    def _criar_escritor(self, tipo_servico: str, mes: int, ano: int, desatualizado: bool = False) -> EscritorPendencias:
+        """
+        Abre o arquivo de saída de um serviço/período no formato configurado
+        """
+        filepath = self._caminho_arquivo(tipo_servico, mes, ano, desatualizado)
+        return FORMATOS_SAIDA[self.formato](filepath, self.campos_extrair + ['tipoServico'])
+    
+    def salvar_dados(self, dados: Dict[str, Any], tipo_servico: str, mes: int, ano: int) -> str:
+        """
+        Salva os dados extraídos no formato configurado, acumulando as estatísticas do resumo na mesma passada
+        """
+        if self.formato == 'json':
+            return self.salvar_dados_json(dados, tipo_servico, mes, ano)
+        
+        escritor = self._criar_escritor(tipo_servico, mes, ano, dados['metadados'].get('desatualizado', False))
+        estatisticas = EstatisticasPendencias()
+        try:
+            for registro in dados['dados']:
+                escritor.escrever(registro)
+                estatisticas.adicionar(registro)
+            filepath = escritor.concluir(dados['metadados'])
+        except Exception as e:
+            escritor.descartar()
+            print(f"✗ Erro ao salvar arquivo {self.formato.upper()} para {tipo_servico}: {e}")
+            return None
+        
+        dados['estatisticas'] = estatisticas
+        print(f"✓ Dados de {tipo_servico} salvos em: {filepath}")
+        return filepath
+    
     def salvar_dados_json(self, dados: Dict[str, Any], tipo_servico: str, mes: int, ano: int) -> str:
         """
-        Salva os dados extraídos em formato JSON
+        Salva os dados extraídos em formato JSON.
+        O arquivo é escrito com a extensão .parcial e só recebe o nome final ao concluir
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f'pendencias_{tipo_servico}_{ano}_{mes:02d}_{timestamp}.json'
-        filepath = os.path.join(self.pasta_dados, filename)
+        filepath = self._caminho_arquivo(tipo_servico, mes, ano, dados['metadados'].get('desatualizado', False))
+        caminho_parcial = filepath + '.parcial'
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
+            with open(caminho_parcial, 'w', encoding='utf-8') as f:
                 json.dump(dados, f, ensure_ascii=False, indent=2)
+            os.replace(caminho_parcial, filepath)
             print(f"✓ Dados de {tipo_servico} salvos em: {filepath}")
             return filepath
         except Exception as e:
             print(f"✗ Erro ao salvar arquivo JSON para {tipo_servico}: {e}")
+            if os.path.exists(caminho_parcial):
+                os.remove(caminho_parcial)
             return None
     
     def exibir_resumo_servico(self, dados: Dict[str, Any]):
@@ -201,27 +899,25 @@ class PendenciasExtractor:
         print(f"\n--- RESUMO: {tipo_servico} ---")
         print(f"Status: {metadados['status']}")
         print(f"Registros extraídos: {metadados['total_registros']}")
+        if metadados.get('desatualizado'):
+            print(f"⚠ Dados DESATUALIZADOS: API sem resposta, usada a resposta em cache de {metadados['data_resposta']}")
+        elif metadados.get('origem_resposta') == 'cache':
+            print(f"Origem: cache (resposta de {metadados['data_resposta']})")
         
-        if registros and metadados['status'] == 'sucesso':
-            # Estatísticas dos dados
-            clientes_unicos = set()
-            tipos_unicos = set()
-            obrigacoes_com_descricao = 0
-            
+        # Estatísticas dos dados: já acumuladas durante a leitura no modo streaming
+        estatisticas = dados.get('estatisticas')
+        if estatisticas is None:
+            estatisticas = EstatisticasPendencias()
             for registro in registros:
-                if registro.get('idCliente'):
-                    clientes_unicos.add(registro['idCliente'])
-                if registro.get('tipo'):
-                    tipos_unicos.add(registro['tipo'])
-                if registro.get('obrigacaoDescricao'):
-                    obrigacoes_com_descricao += 1
-            
-            print(f"Clientes únicos: {len(clientes_unicos)}")
-            print(f"Tipos únicos: {len(tipos_unicos)}")
-            print(f"Registros com obrigacaoDescricao: {obrigacoes_com_descricao}")
+                estatisticas.adicionar(registro)
+        
+        if metadados['total_registros'] and metadados['status'] == 'sucesso':
+            print(f"Clientes únicos: {len(estatisticas.clientes_unicos)}")
+            print(f"Tipos únicos: {len(estatisticas.tipos_unicos)}")
+            print(f"Registros com obrigacaoDescricao: {estatisticas.obrigacoes_com_descricao}")
             
             # Exemplo de registro (primeiro com obrigacaoDescricao)
-            exemplo = next((r for r in registros if r.get('obrigacaoDescricao')), registros[0] if registros else None)
+            exemplo = estatisticas.exemplo or estatisticas.primeiro
             if exemplo:
                 print(f"Exemplo de registro:")
                 for campo in self.campos_extrair:
@@ -229,43 +925,112 @@ class PendenciasExtractor:
                     valor_str = str(valor)[:50] + "..." if len(str(valor)) > 50 else str(valor)
                     print(f"  {campo}: {valor_str}")
 
+def _registrar_origem(metadados: Dict[str, Any], origem: str, data_resposta: str, desatualizado: bool):
+    """
+    Registra nos metadados de onde veio a resposta ('api' ou 'cache'), quando foi obtida e se está desatualizada
+    """
+    if metadados is not None:
+        metadados.update(origem_resposta=origem, data_resposta=data_resposta, desatualizado=desatualizado)
+
+def _formatar_duracao(segundos: float) -> str:
+    """
+    Formata uma duração em segundos como 1h02min, 3min05s ou 12.3s
+    """
+    if segundos >= 3600:
+        return f"{int(segundos // 3600)}h{int(segundos % 3600 // 60):02d}min"
+    if segundos >= 60:
+        return f"{int(segundos // 60)}min{int(segundos % 60):02d}s"
+    return f"{segundos:.1f}s"
+
+def _intervalo_periodos(inicio: Tuple[int, int], fim: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """
+    Lista os períodos (mes, ano) de inicio a fim, inclusive
+    """
+    periodos = []
+    mes, ano = inicio
+    while (ano, mes) <= (fim[1], fim[0]):
+        periodos.append((mes, ano))
+        mes, ano = (1, ano + 1) if mes == 12 else (mes + 1, ano)
+    return periodos
+
+def _periodo(valor: str) -> Tuple[int, int]:
+    """
+    Converte um período no formato MM/AAAA em (mes, ano)
+    """
+    try:
+        mes, ano = (int(parte) for parte in valor.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"período inválido (use MM/AAAA): {valor}")
+    if not 1 <= mes <= 12:
+        raise argparse.ArgumentTypeError(f"mês inválido: {valor}")
+    return mes, ano
+
 def main():
     """
     Função principal - execução automática
     """
+    parser = argparse.ArgumentParser(description="Extrator de dados de pendências do checklist")
+    parser.add_argument("--servicos", nargs="+", default=['EF', 'CTB'],
+                        help="Serviços a consultar (padrão: %(default)s)")
+    parser.add_argument("--periodos", nargs="+", type=_periodo, default=[(6, 2025)], metavar="MM/AAAA",
+                        help="Períodos a consultar (padrão: 06/2025)")
+    parser.add_argument("--inicio", type=_periodo, metavar="MM/AAAA",
+                        help="Backfill: primeiro período do intervalo (substitui --periodos)")
+    parser.add_argument("--fim", type=_periodo, metavar="MM/AAAA",
+                        help="Backfill: último período do intervalo (padrão: mês atual)")
+    parser.add_argument("--forcar", action="store_true",
+                        help="Backfill: consulta novamente períodos já extraídos em dados_extraidos")
+    parser.add_argument("--formato", choices=sorted(FORMATOS_SAIDA), default=FORMATO_SAIDA,
+                        help="Formato de saída; ndjson, csv e parquet são particionados por servico=/ano=/mes= "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--sem-streaming", action="store_true",
+                        help="Lê cada resposta inteira na memória em vez de gravar os registros durante a leitura")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL_HORAS, metavar="HORAS",
+                        help="Idade máxima (horas) para reutilizar uma resposta em cache sem consultar a API; "
+                             "0 revalida sempre (padrão: %(default)s)")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="Não usa nem grava o cache local das respostas da API")
+    parser.add_argument("--concorrencia", type=int, default=MAX_CONCORRENCIA,
+                        help="Número máximo de requisições simultâneas (padrão: %(default)s)")
+    args = parser.parse_args()
+
     print("EXTRATOR AUTOMÁTICO DE DADOS DE PENDÊNCIAS")
     print("=" * 60)
     
-    # Parâmetros fixos para extração automática
-    mes = 6
-    ano = 2025
-    servicos = ['EF', 'CTB']
+    # Parâmetros para extração automática
+    periodos = args.periodos
+    servicos = args.servicos
+    # Backfill: todos os meses do intervalo, pulando (e assim retomando) os períodos já extraídos
+    backfill = args.inicio is not None
+    if backfill:
+        hoje = datetime.now()
+        periodos = _intervalo_periodos(args.inicio, args.fim or (hoje.month, hoje.year))
+        print(f"Modo backfill: {len(periodos)} mês(es) x {len(servicos)} serviço(s)")
     
-    print(f"Configuração: mês={mes}, ano={ano}")
+    print(f"Períodos: {', '.join(f'{mes:02d}/{ano}' for mes, ano in periodos)}")
     print(f"Serviços: {', '.join(servicos)}")
+    print(f"Requisições simultâneas: até {args.concorrencia}")
+    print(f"Formato de saída: {args.formato}")
+    if args.sem_cache:
+        print(f"Cache de respostas: desativado")
+    else:
+        print(f"Cache de respostas: '{PASTA_CACHE_HTTP}' (reutilizado por até {args.cache_ttl:g}h; "
+              f"sem resposta da API, usa a última resposta marcada como desatualizada)")
     print(f"⚠ Nota: O serviço CTB pode demorar mais para responder")
     print(f"Timeouts configurados: 5min, 7.5min, 10min (3 tentativas)")
     print(f"⏱ Tempo máximo total por serviço: até 22.5 minutos")
     print()
     
     # Inicializa o extrator
-    extractor = PendenciasExtractor()
-    
-    resultados = {}
-    arquivos_salvos = []
+    extractor = PendenciasExtractor(max_concorrencia=args.concorrencia, streaming=STREAMING_JSON and not args.sem_streaming,
+                                    formato=args.formato, cache=not args.sem_cache, cache_ttl_horas=args.cache_ttl)
     
     try:
-        # Processa cada serviço separadamente
-        for tipo_servico in servicos:
-            resultado = extractor.processar_servico(tipo_servico, mes, ano)
-            resultados[tipo_servico] = resultado
-            
-            # Salva os dados em JSON separado
-            if resultado['dados']:
-                filepath = extractor.salvar_dados_json(resultado, tipo_servico, mes, ano)
-                if filepath:
-                    arquivos_salvos.append(filepath)
-            
+        # Processa todos os serviços e períodos em paralelo (cada resultado é salvo ao concluir)
+        resultados, arquivos_salvos = extractor.processar_periodos(
+            servicos, periodos, pular_concluidos=backfill and not args.forcar)
+        
+        for (tipo_servico, mes, ano), resultado in sorted(resultados.items()):
             # Exibe resumo do serviço
             extractor.exibir_resumo_servico(resultado)
         
@@ -278,11 +1043,14 @@ def main():
         servicos_sucesso = sum(1 for r in resultados.values() if r['metadados']['status'] == 'sucesso')
         
         print(f"Total de registros extraídos: {total_registros}")
-        print(f"Serviços processados com sucesso: {servicos_sucesso}/{len(servicos)}")
+        print(f"Serviços processados com sucesso: {servicos_sucesso}/{len(resultados)}")
+        desatualizados = sum(1 for r in resultados.values() if r['metadados'].get('desatualizado'))
+        if desatualizados:
+            print(f"⚠ Serviços com dados desatualizados (cache): {desatualizados}")
         print(f"Arquivos salvos: {len(arquivos_salvos)}")
         
         for arquivo in arquivos_salvos:
-            print(f"  ✓ {os.path.basename(arquivo)}")
+            print(f"  ✓ {os.path.relpath(arquivo, extractor.pasta_dados)}")
         
         if total_registros > 0:
             print(f"\n✓ Extração concluída com sucesso!")
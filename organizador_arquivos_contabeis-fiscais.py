@@ -1,6 +1,8 @@
 import os
 import re
+import sys
 import shutil
+import stat
 import zipfile
 import rarfile
 import datetime
@@ -11,13 +13,60 @@ import PyPDF2
 import textract
 import docx2txt
 import pytesseract
-from PIL import Image
+from PIL import Image, ImageOps
+import numpy as np
 import logging
 import mimetypes
 import magic
+import io
 import time
+import tempfile
+import contextlib
+import json
+import csv
+import hashlib
+import sqlite3
+import pickle
+import argparse
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dateutil.parser import parse
 
+try:
+    # Opcional: mantém o modelo do Tesseract carregado entre as páginas (sem iniciar um processo por imagem)
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    # Opcional: leitura de PDF mais rápida (PDFium) e renderização das páginas escaneadas para o OCR
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+try:
+    # Leitura de planilhas .xlsx em modo streaming (read_only), sem montar um DataFrame
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    # Opcional: leitura de planilhas .xls sob demanda (on_demand)
+    import xlrd
+except ImportError:
+    xlrd = None
+
+try:
+    # Opcional: extração de texto de PDF pelo pdfminer.six
+    from pdfminer.high_level import extract_pages as pdfminer_extract_pages
+    from pdfminer.layout import LTTextContainer
+except ImportError:
+    pdfminer_extract_pages = None
+
 # Configuração de log
 logging.basicConfig(
     level=logging.INFO,
@@ -32,128 +81,1868 @@ logger = logging.getLogger()
 # Caminho base para processamento
 BASE_PATH = r"C:\Users\lauro\Desktop\amostragem"
 
+# Tabela de regras de classificação e estrutura de pastas (compilada e guardada em cache no arquivo .pickle)
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regras_classificacao.json")
+RULES_CACHE_PATH = RULES_PATH + ".pickle"
+
+# Número de processos para extração/classificação (1 = processamento sequencial)
+NUM_WORKERS = 1
+
+# Cache persistente do texto extraído (chave: hash SHA-256 do conteúdo do arquivo)
+EXTRACTION_CACHE_ENABLED = True
+EXTRACTION_CACHE_PATH = "extraction_cache.db"  # Ao lado de document_classifier.log
+EXTRACTION_CACHE_MAX_MB = 2048
+# Versão do extrator: altere sempre que a lógica de extract_text mudar para invalidar o cache
+EXTRACTOR_VERSION = "3"
+
+# Extração progressiva: classificar pelo nome e pelas primeiras páginas antes de extrair/OCR o documento inteiro
+LAZY_EXTRACTION = True
+
+# OCR: motores Tesseract de longa duração, com o modelo do idioma carregado uma única vez por motor
+OCR_LANG = 'por'
+# Número de motores por processo (None = núcleos disponíveis divididos entre os processos de trabalho)
+OCR_ENGINES = None
+# Intervalo (em páginas) entre os registros de métricas do OCR no log
+OCR_METRICS_INTERVAL = 100
+# Pré-processamento das páginas antes do OCR: redução para a resolução alvo, binarização,
+# correção de inclinação e corte das margens em branco (ver benchmark_extracao.py)
+OCR_PREPROCESS = True
+OCR_TARGET_DPI = 300
+OCR_BINARIZE = True
+OCR_DESKEW_MAX_ANGLE = 5.0
+
+# Planilhas: apenas as primeiras linhas são lidas para contar as colunas e obter o texto das palavras-chave
+EXCEL_SNIFF_ROWS = 200
+
+# Biblioteca de leitura de PDF: 'auto' (pypdfium2, se instalado, senão PyPDF2),
+# 'pypdfium2', 'pdfminer' ou 'pypdf2' (comparação: python benchmark_extracao.py pdf <pasta>)
+PDF_BACKEND = 'auto'
+
+# Manifesto dos arquivos já processados (caminho, tamanho, mtime, hash, classificação e destino)
+MANIFEST_ENABLED = True
+MANIFEST_PATH = "document_manifest.db"
+# Modo incremental: um arquivo com o mesmo caminho, tamanho e mtime de um registro do manifesto não é lido
+# para calcular o hash, e o texto de um conteúdo já processado vem do cache de extração (sem nova extração/OCR).
+# A classificação e o destino são sempre calculados para o cliente atual
+INCREMENTAL = True
+
+# Diário de operações (JSON Lines, somente acréscimo): cada movimentação/deleção é gravada como planejada
+# antes de ser executada e como concluída depois. Permite retomar uma execução interrompida (--resume)
+# sem nova varredura nem extração, e desfazer a última execução (--undo)
+JOURNAL_ENABLED = True
+JOURNAL_PATH = "operations_journal.jsonl"  # Ao lado de document_classifier.log
+JOURNAL_RESUME = False
+# Execuções mantidas no diário para --undo; ao iniciar uma nova execução, as desfeitas e as mais antigas
+# são removidas e as demais (exceto a última) ficam só com as operações concluídas (ver OperationJournal.compact)
+JOURNAL_KEEP_RUNS = 20
+
+# Plano de movimentação: com MOVE_DRY_RUN, nada é movido e o plano é apenas exportado
+MOVE_DRY_RUN = False
+# Relatório CSV do plano (origem -> destino); None desativa a exportação fora do modo simulação
+MOVE_PLAN_REPORT_PATH = None
+DEFAULT_MOVE_PLAN_REPORT_PATH = "move_plan.csv"
+
+# Layout final em uma única passada: cada arquivo é movido direto para [2025]/[FISCAL|CONTABIL]/[TIPO]/[SUBTIPO]
+# (conforme pastas_fiscal/pastas_contabil das regras) ou [2025]/[TIPO], como [2025]/[REVISÃO MANUAL].
+# As etapas seguintes do script (reorganização e limpeza) não são executadas
+FINAL_LAYOUT = False
+FINAL_YEAR_FOLDER = "[2025]"
+FINAL_FISCAL_FOLDER = "[FISCAL]"
+FINAL_CONTABIL_FOLDER = "[CONTABIL]"
+
+# Arquivos compactados: os membros são lidos em memória (sem pasta temporária) e gravados apenas no destino
+ARCHIVE_EXTENSIONS = ('.zip', '.rar')
+# Membros maiores que o limite não são processados (ficam apenas no arquivo compactado, em REVISÃO MANUAL)
+ARCHIVE_MEMBER_MAX_MB = 256
+# Limite de conteúdo descompactado por arquivo compactado, incluindo os aninhados (proteção contra "zip bombs")
+ARCHIVE_MAX_TOTAL_MB = 2048
+# Profundidade máxima de arquivos compactados dentro de arquivos compactados
+ARCHIVE_MAX_DEPTH = 3
+# Conteúdo de membros mantido em memória (e enviado aos processos de trabalho) antes de gravar um lote do plano
+ARCHIVE_BATCH_MB = 256
+
+# Campos de NF-e/CT-e lidos do XML: nome da tag -> chave em metadados['xml']
+XML_FIELD_TAGS = {
+    'tpNF': 'tpNF',
+    'mod': 'modelo',
+    'dhEmi': 'data_emissao',
+    'dEmi': 'data_emissao',
+    'chNFe': 'chave',
+    'chCTe': 'chave',
+}
+XML_KEY_ELEMENTS = ('infNFe', 'infCte')
+NFE_MODELS = ('55', '65')
+XML_ENCODING_PATTERN = re.compile(rb'<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)["\']')
+
+# Função para ler os campos principais de um XML de NF-e/CT-e
+def parse_xml_fields(source):
+    """Lê em streaming (iterparse) tpNF, modelo, CNPJ do emitente/destinatário, data de emissão e chave
+    de acesso, parando assim que todos forem encontrados e liberando os elementos já lidos."""
+    fields = {}
+    inside = {'emit': 0, 'dest': 0}
+    closed = set()
+    try:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            local_name = elem.tag.rsplit('}', 1)[-1]
+            local_lower = local_name.lower()
+            party = 'emit' if local_lower.endswith('emit') else 'dest' if local_lower == 'dest' else None
+
+            if event == 'start':
+                if party:
+                    inside[party] += 1
+                elif local_name in XML_KEY_ELEMENTS and 'chave' not in fields and elem.get('Id'):
+                    fields['chave'] = re.sub(r'\D', '', elem.get('Id'))
+                continue
+
+            text = (elem.text or "").strip()
+            if local_lower.endswith('cnpj') and text:
+                for owner in ('emit', 'dest'):
+                    if inside[owner] and f'{owner}_cnpj' not in fields:
+                        fields[f'{owner}_cnpj'] = text.replace(".", "").replace("/", "").replace("-", "")
+                        break
+            elif local_name in XML_FIELD_TAGS and text and XML_FIELD_TAGS[local_name] not in fields:
+                fields[XML_FIELD_TAGS[local_name]] = text
+            elif party:
+                inside[party] -= 1
+                closed.add(party)
+            elem.clear()
+
+            # Parar assim que todos os campos necessários forem conhecidos (evita ler os itens da nota)
+            if ('modelo' in fields and 'data_emissao' in fields and 'chave' in fields
+                    and ('tpNF' in fields or fields['modelo'] not in NFE_MODELS)
+                    and ('emit_cnpj' in fields or 'emit' in closed)
+                    and ('dest_cnpj' in fields or 'dest' in closed)):
+                break
+    except ET.ParseError as e:
+        logger.warning(f"XML inválido ou incompleto, campos lidos até o erro: {e}")
+    return fields
+
+# Funções para ler arquivos em disco ou membros de arquivos compactados já em memória
+def open_source(file_path, data=None):
+    """Abre o arquivo para leitura binária; com data (membro de arquivo compactado), lê da memória."""
+    return io.BytesIO(data) if data is not None else open(file_path, 'rb')
+
+@contextlib.contextmanager
+def materialized_path(file_path, data=None):
+    """Caminho em disco para bibliotecas que só aceitam caminhos (textract); conteúdo em memória vai para um temporário."""
+    if data is None:
+        yield file_path
+        return
+    fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(file_path)[1])
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+# Função para extrair texto e campos de um XML
+def extract_xml(file_path, data=None):
+    """Lê o XML uma única vez, retornando o texto e os campos de NF-e/CT-e."""
+    if data is None:
+        with open(file_path, 'rb') as file:
+            data = file.read()
+    match = XML_ENCODING_PATTERN.search(data[:200])
+    encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        text = data.decode(encoding, errors='ignore')
+    except LookupError:
+        text = data.decode('utf-8', errors='ignore')
+    return text, parse_xml_fields(io.BytesIO(data))
+
 # Função para extrair texto de diferentes tipos de arquivos
-def extract_text(file_path):
+def extract_text(file_path, data=None):
     """Extrai texto de diferentes tipos de arquivos."""
+    return extract_content(file_path, data)[0]
+
+# Extensões cujo extrator é escolhido diretamente, sem inspecionar o conteúdo
+TRUSTED_EXTENSIONS = frozenset({
+    '.pdf', '.xml', '.html', '.xlsx', '.xls', '.docx', '.csv', '.ofx', '.ofc',
+    '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp',
+})
+SNIFF_BYTES = 2048
+# Assinaturas no início do arquivo -> extensão do extrator correspondente
+FILE_SIGNATURES = (
+    (b'%PDF', '.pdf'),
+    (b'\x89PNG', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+)
+# Tipos MIME do libmagic -> extensão do extrator correspondente (verificados em ordem)
+MIME_EXTENSIONS = (
+    ('pdf', '.pdf'),
+    ('wordprocessingml', '.docx'),
+    ('spreadsheetml', '.xlsx'),
+    ('ms-excel', '.xls'),
+    ('html', '.html'),
+    ('xml', '.xml'),
+    ('image/png', '.png'),
+    ('image/jpeg', '.jpg'),
+    ('image/tiff', '.tif'),
+    ('image/bmp', '.bmp'),
+    ('text/', '.txt'),
+)
+
+# Identificador de tipos do libmagic do processo atual (criado sob demanda, uma vez por processo)
+_magic = None
+_magic_pid = None
+
+def get_magic():
+    """Retorna o identificador de tipo MIME (libmagic) do processo atual."""
+    global _magic, _magic_pid
+    if _magic_pid != os.getpid():
+        _magic = magic.Magic(mime=True)
+        _magic_pid = os.getpid()
+    return _magic
+
+def _sniff_header(header):
+    """Identifica o tipo pelos primeiros bytes do conteúdo, sem o libmagic."""
+    for signature, extension in FILE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header.startswith(b'PK\x03\x04'):
+        # Pacotes do Office: o primeiro diretório interno aparece logo no início
+        if b'word/' in header:
+            return '.docx'
+        if b'xl/' in header:
+            return '.xlsx'
+        return None
+    text = header.lstrip(b'\xef\xbb\xbf \t\r\n').upper()
+    if b'OFXHEADER' in text or b'<OFX>' in text:
+        return '.ofx'
+    if text.startswith(b'<?XML'):
+        return '.html' if b'<HTML' in text else '.xml'
+    if text.startswith(b'<!DOCTYPE HTML') or text.startswith(b'<HTML'):
+        return '.html'
+    return None
+
+# Função para identificar o extrator adequado a um arquivo
+def detect_file_type(file_path, data=None):
+    """Retorna a extensão que define o extrator: a do nome, quando confiável, ou a identificada pelo
+    conteúdo (assinatura dos primeiros bytes e, se necessário, libmagic) em .txt, arquivos sem extensão
+    ou de extensão desconhecida (ex.: um .txt que é um OFX, um PDF sem extensão)."""
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension in TRUSTED_EXTENSIONS:
+        return file_extension
+
+    if data is not None:
+        header = data[:SNIFF_BYTES]
+    else:
+        with open(file_path, 'rb') as file:
+            header = file.read(SNIFF_BYTES)
+    detected = _sniff_header(header)
+    if detected is None and file_extension != '.txt':
+        try:
+            mime_type = get_magic().from_buffer(header)
+        except Exception as e:
+            logger.warning(f"Não foi possível identificar o tipo de {file_path}: {e}")
+            mime_type = ""
+        detected = next((extension for marker, extension in MIME_EXTENSIONS if marker in mime_type), None)
+        # Texto genérico em arquivos de extensão desconhecida: manter o extrator padrão (textract)
+        if detected == '.txt' and file_extension:
+            detected = None
+
+    if detected and detected != file_extension:
+        logger.info(f"Tipo identificado pelo conteúdo ({detected}): {file_path}")
+        return detected
+    return file_extension
+
+# Função para extrair texto e metadados de diferentes tipos de arquivos
+def extract_content(file_path, data=None):
+    """Extrai texto e metadados (número de colunas, campos do XML) de diferentes tipos de arquivos.
+
+    Com data, o conteúdo (membro de um arquivo compactado) é lido da memória e file_path é o caminho virtual.
+    """
     try:
-        file_extension = os.path.splitext(file_path)[1].lower()
-        mime = magic.Magic(mime=True)
-        mime_type = mime.from_file(file_path)
+        # Extensão efetiva: a do nome, ou a identificada pelo conteúdo em arquivos sem extensão confiável
+        file_extension = detect_file_type(file_path, data)
         
         # PDF
-        if file_extension == '.pdf' or 'pdf' in mime_type:
+        if file_extension == '.pdf':
             try:
-                text = ""
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for page_num in range(len(pdf_reader.pages)):
-                        text += pdf_reader.pages[page_num].extract_text() + "\n"
-                
-                # Se o PDF não tiver texto extraível (scan), usar OCR
+                # Texto página a página; apenas as páginas sem texto (escaneadas) vão para o OCR
+                text = "".join(page_text + "\n" for page_text in extract_pdf_pages(file_path, data))
+
+                # PDFs sem imagens legíveis para o OCR: OCR do documento renderizado (textract)
                 if not text.strip():
-                    text = textract.process(file_path, method='tesseract').decode('utf-8')
-                return text
+                    with materialized_path(file_path, data) as path:
+                        text = textract.process(path, method='tesseract').decode('utf-8')
+                return text, {}
             except Exception as e:
                 logger.error(f"Erro ao extrair texto do PDF {file_path}: {e}")
-                return ""
+                return "", {}
         
         # XML
         elif file_extension == '.xml':
             try:
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-                return ET.tostring(root, encoding='utf-8').decode('utf-8')
+                text, fields = extract_xml(file_path, data)
+                return text, {'xml': fields}
             except Exception as e:
                 logger.error(f"Erro ao extrair texto do XML {file_path}: {e}")
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                    return file.read()
+                return "", {}
         # HTML
         elif file_extension == '.html':
             try:
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-                return ET.tostring(root, encoding='utf-8').decode('utf-8')
+                with open_source(file_path, data) as file:
+                    root = ET.parse(file).getroot()
+                return ET.tostring(root, encoding='utf-8').decode('utf-8'), {}
             except Exception as e:
                 logger.error(f"Erro ao extrair texto do HTML {file_path}: {e}")
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                    return file.read()
+                return _read_plain_text(file_path, data), {}
         
         # Excel
         elif file_extension in ['.xlsx', '.xls']:
             try:
-                df = pd.read_excel(file_path)
-                # Contar colunas
-                num_columns = len(df.columns)
-                # Converter DataFrame para string
-                text = df.to_string()
+                num_columns, text = extract_excel(file_path, data)
                 # Adicionar informação sobre número de colunas
                 text = f"NUM_COLUMNS: {num_columns}\n" + text
-                return text
+                return text, {'num_columns': num_columns}
             except Exception as e:
                 logger.error(f"Erro ao extrair texto do Excel {file_path}: {e}")
-                return ""
+                return "", {}
         
         # Texto plano
         elif file_extension in ['.txt', '.csv', '.html', '.xml']:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                return file.read()
+            return _read_plain_text(file_path, data), {}
         
         # OFX/OFC (arquivos de extrato bancário)
         elif file_extension in ['.ofx', '.ofc']:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                return file.read()
+            return _read_plain_text(file_path, data), {}
         
         # Imagens
         elif file_extension in ['.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp']:
             try:
-                return pytesseract.image_to_string(Image.open(file_path), lang='por')
+                with open_source(file_path, data) as file:
+                    return get_ocr_service().ocr_image(Image.open(file)), {}
             except Exception as e:
                 logger.error(f"Erro ao extrair texto da imagem {file_path}: {e}")
-                return ""
+                return "", {}
         
         # DOCX
         elif file_extension == '.docx':
-            return docx2txt.process(file_path)
+            with open_source(file_path, data) as file:
+                return docx2txt.process(file), {}
         
         # Outros tipos
         else:
             try:
-                return textract.process(file_path).decode('utf-8')
+                with materialized_path(file_path, data) as path:
+                    return textract.process(path).decode('utf-8'), {}
             except:
                 logger.warning(f"Não foi possível extrair texto de {file_path}")
-                return ""
+                return "", {}
     except Exception as e:
         logger.error(f"Erro ao processar arquivo {file_path}: {e}")
-        return ""
+        return "", {}
+
+def _iter_excel_rows(file_path, data=None, max_rows=None):
+    """Gera as primeiras linhas (tuplas de valores) da primeira aba da planilha, sem carregar o arquivo inteiro."""
+    max_rows = max_rows or EXCEL_SNIFF_ROWS
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.xlsx' and openpyxl is not None:
+        workbook = openpyxl.load_workbook(io.BytesIO(data) if data is not None else file_path,
+                                          read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(max_row=max_rows, values_only=True)
+        finally:
+            workbook.close()
+    elif file_extension == '.xls' and xlrd is not None:
+        if data is not None:
+            book = xlrd.open_workbook(file_contents=data, on_demand=True)
+        else:
+            book = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            for row in range(min(sheet.nrows, max_rows)):
+                yield tuple(sheet.row_values(row))
+        finally:
+            book.release_resources()
+    else:
+        # Sem openpyxl/xlrd: pandas limitado às primeiras linhas (a primeira linha é o cabeçalho)
+        df = pd.read_excel(io.BytesIO(data) if data is not None else file_path, header=None, nrows=max_rows)
+        for row in df.itertuples(index=False):
+            yield tuple(None if pd.isna(value) else value for value in row)
+
+# Função para extrair o número de colunas e o texto inicial de uma planilha
+def extract_excel(file_path, data=None):
+    """Lê apenas as primeiras EXCEL_SNIFF_ROWS linhas da primeira aba: retorna (número de colunas, texto)."""
+    num_columns = 0
+    lines = []
+    for row in _iter_excel_rows(file_path, data):
+        cells = ["" if value is None else str(value) for value in row]
+        # Como no pandas, a largura da planilha vai até a última célula preenchida em qualquer linha
+        while cells and not cells[-1].strip():
+            cells.pop()
+        if not cells:
+            continue
+        num_columns = max(num_columns, len(cells))
+        lines.append("\t".join(cells))
+    return num_columns, "\n".join(lines)
+
+def _read_plain_text(file_path, data=None):
+    """Lê um arquivo de texto (UTF-8, ignorando bytes inválidos)."""
+    if data is not None:
+        return data.decode('utf-8', errors='ignore')
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+        return file.read()
 
-# Função para descompactar arquivos
-def extract_compressed_files(file_path, extract_dir):
-    """Descompacta arquivos ZIP e RAR."""
+# Padrões para identificar a data do documento (aplicados apenas ao início do texto, já em minúsculas)
+DATE_SEARCH_CHARS = 20000
+COMPETENCIA_PATTERN = re.compile(r'compet[êe]ncia\s*[:\-]?\s*(\d{1,2})\s*[/.\-]\s*(\d{4})')
+PERIODO_PATTERN = re.compile(r'per[íi]odo\s*[:\-]?\s*(?:de\s*)?(\d{1,2})/(\d{1,2})/(\d{4})\s*(?:a|at[ée]|-)\s*\d{1,2}/\d{1,2}/\d{4}')
+EMISSAO_PATTERN = re.compile(r'(?:data\s*(?:de\s*|da\s*)?)?emiss[ãa]o\s*[:\-]?\s*(\d{1,2})/(\d{1,2})/(\d{4})')
+MONTH_YEAR_PATTERN = re.compile(r'\b(janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)\s*(?:de\s*|/\s*)(\d{4})\b')
+GENERIC_DATE_PATTERN = re.compile(r'\b\d{1,2}[/.\-]\d{1,2}[/.\-](?:\d{4}|\d{2})\b')
+MONTH_NUMBERS = {name: number for number, name in enumerate(
+    ("janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"), 1)}
+
+def _valid_document_date(year, month, day=1):
+    """Monta a data, descartando valores impossíveis ou fora da faixa esperada."""
     try:
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == '.zip':
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-            logger.info(f"Arquivo ZIP extraído: {file_path}")
+        date = datetime.datetime(int(year), int(month), int(day))
+    except (ValueError, TypeError):
+        return None
+    if date.year < 2000 or date > datetime.datetime.now() + datetime.timedelta(days=31):
+        return None
+    return date
+
+# Função para identificar a data do documento
+def extract_document_date(file_content, xml_fields=None):
+    """Identifica a data do documento: emissão do XML, competência, período do extrato, data de emissão,
+    mês por extenso ou, por último, a primeira data do texto (interpretada com dateutil)."""
+    if xml_fields and xml_fields.get('data_emissao'):
+        try:
+            date = datetime.datetime.fromisoformat(xml_fields['data_emissao'].strip()[:10])
+            date = _valid_document_date(date.year, date.month, date.day)
+            if date:
+                return date
+        except ValueError:
+            pass
+
+    head = (file_content or "")[:DATE_SEARCH_CHARS].lower()
+    if not head:
+        return None
+
+    if "compet" in head:
+        for month, year in COMPETENCIA_PATTERN.findall(head):
+            date = _valid_document_date(year, month)
+            if date:
+                return date
+    if "odo" in head:
+        for day, month, year in PERIODO_PATTERN.findall(head):
+            date = _valid_document_date(year, month, day)
+            if date:
+                return date
+    if "emiss" in head:
+        for day, month, year in EMISSAO_PATTERN.findall(head):
+            date = _valid_document_date(year, month, day)
+            if date:
+                return date
+    for month_name, year in MONTH_YEAR_PATTERN.findall(head):
+        date = _valid_document_date(year, MONTH_NUMBERS[month_name])
+        if date:
+            return date
+    for candidate in GENERIC_DATE_PATTERN.findall(head):
+        try:
+            parsed = parse(candidate, dayfirst=True)
+        except (ValueError, OverflowError):
+            continue
+        date = _valid_document_date(parsed.year, parsed.month, parsed.day)
+        if date:
+            return date
+    return None
+
+def document_date(file_content, metadata):
+    """Data do documento, calculada uma única vez e guardada nos metadados (que vão para o cache de extração)."""
+    if 'data_documento' not in metadata:
+        date = extract_document_date(file_content, metadata.get('xml'))
+        metadata['data_documento'] = date.isoformat() if date else None
+    value = metadata['data_documento']
+    return datetime.datetime.fromisoformat(value) if value else None
+
+# Função para calcular o hash do conteúdo de um arquivo
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """Calcula o hash SHA-256 do conteúdo do arquivo."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """Cache em SQLite do texto extraído, com limite de tamanho e descarte LRU."""
+
+    # Frequência (em gravações) da verificação do limite de tamanho
+    EVICT_INTERVAL = 100
+
+    def __init__(self, db_path, max_bytes, version):
+        self.max_bytes = max_bytes
+        self.version = version
+        self._writes = 0
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS extracao ("
+            "hash TEXT PRIMARY KEY, versao TEXT NOT NULL, texto TEXT NOT NULL, "
+            "metadados TEXT NOT NULL, tamanho INTEGER NOT NULL, ultimo_acesso REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_extracao_acesso ON extracao (ultimo_acesso)")
+        # Entradas geradas por outra versão do extrator não são mais válidas
+        removed = self.conn.execute("DELETE FROM extracao WHERE versao != ?", (version,)).rowcount
+        self.conn.commit()
+        if removed:
+            logger.info(f"Cache de extração: {removed} entradas de versões anteriores do extrator removidas")
+        self._evict()
+
+    def get(self, content_hash):
+        """Retorna (texto, metadados) do cache ou None."""
+        try:
+            row = self.conn.execute(
+                "SELECT texto, metadados FROM extracao WHERE hash = ? AND versao = ?",
+                (content_hash, self.version)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE extracao SET ultimo_acesso = ? WHERE hash = ?", (time.time(), content_hash))
+            self.conn.commit()
+            return row[0], json.loads(row[1])
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao consultar cache de extração: {e}")
+            return None
+
+    def put(self, content_hash, text, metadata):
+        """Grava o texto extraído e seus metadados no cache."""
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extracao (hash, versao, texto, metadados, tamanho, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, self.version, text, json.dumps(metadata), size, time.time())
+            )
+            self.conn.commit()
+            self._writes += 1
+            if self._writes % self.EVICT_INTERVAL == 0:
+                self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao gravar no cache de extração: {e}")
+
+    def _evict(self):
+        """Remove as entradas menos usadas recentemente até respeitar o limite de tamanho."""
+        total = self.conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM extracao").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_delete = []
+        for content_hash, size in self.conn.execute("SELECT hash, tamanho FROM extracao ORDER BY ultimo_acesso"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((content_hash,))
+            total -= size
+        self.conn.executemany("DELETE FROM extracao WHERE hash = ?", to_delete)
+        self.conn.commit()
+        logger.info(f"Cache de extração: {len(to_delete)} entradas antigas descartadas (limite de {self.max_bytes // (1024 * 1024)} MB)")
+
+# Cache de extração do processo atual (cada processo de trabalho abre sua própria conexão)
+_extraction_cache = None
+_extraction_cache_pid = None
+
+def get_extraction_cache():
+    """Retorna o cache de extração do processo atual, abrindo-o sob demanda."""
+    global _extraction_cache, _extraction_cache_pid
+    if _extraction_cache_pid != os.getpid():
+        _extraction_cache = None
+        _extraction_cache_pid = os.getpid()
+        if EXTRACTION_CACHE_ENABLED:
+            try:
+                _extraction_cache = ExtractionCache(EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_MB * 1024 * 1024, EXTRACTOR_VERSION)
+            except Exception as e:
+                logger.warning(f"Cache de extração indisponível ({EXTRACTION_CACHE_PATH}): {e}")
+    return _extraction_cache
+
+# Função para extrair texto reaproveitando o cache persistente
+def extract_content_cached(file_path, content_hash=None, data=None):
+    """Extrai texto e metadados do arquivo, reaproveitando o cache quando o conteúdo já foi processado."""
+    cache = get_extraction_cache()
+    if cache is None:
+        return extract_content(file_path, data)
+
+    if content_hash is None:
+        try:
+            content_hash = hashlib.sha256(data).hexdigest() if data is not None else compute_file_hash(file_path)
+        except OSError as e:
+            logger.warning(f"Não foi possível calcular o hash de {file_path}: {e}")
+            return extract_content(file_path)
+
+    cached = cache.get(content_hash)
+    # Textos parciais da extração progressiva não servem como extração completa
+    if cached is not None and cached[1].get('completo', True):
+        logger.info(f"Texto obtido do cache de extração: {file_path}")
+        return cached
+
+    text, metadata = extract_content(file_path, data)
+    # Textos vazios não são guardados: podem ser resultado de uma falha temporária
+    if text:
+        document_date(text, metadata)
+        cache.put(content_hash, text, metadata)
+    return text, metadata
+
+def _image_dpi(image):
+    """Resolução da imagem: a declarada ou, se maior, a estimada supondo uma página A4 (lado maior de 11,69")."""
+    declared = image.info.get('dpi', (0,))[0] or 0
+    estimated = max(image.size) / 11.69
+    return max(float(declared), estimated)
+
+def _otsu_threshold(gray):
+    """Limiar de binarização de Otsu calculado sobre o histograma da imagem em tons de cinza."""
+    hist = np.asarray(gray.histogram()[:256], dtype=np.float64)
+    total = hist.sum()
+    if not total:
+        return 127
+    weight_background = np.cumsum(hist)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_background = cumulative_mean / weight_background
+        mean_foreground = (cumulative_mean[-1] - cumulative_mean) / weight_foreground
+        between_variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(np.nan_to_num(between_variance)))
+
+def _estimate_skew(binary):
+    """Ângulo de inclinação pelo perfil de projeção horizontal: as linhas de texto alinhadas
+    produzem a maior variância da soma de pixels escuros por linha."""
+    small = binary.copy()
+    small.thumbnail((800, 800))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-OCR_DESKEW_MAX_ANGLE, OCR_DESKEW_MAX_ANGLE + 0.25, 0.5):
+        rotated = small.rotate(float(angle), resample=Image.NEAREST, fillcolor=255)
+        profile = (np.asarray(rotated, dtype=np.uint8) < 128).sum(axis=1)
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+# Função para preparar uma imagem de página para o OCR
+def preprocess_for_ocr(image, target_dpi=None):
+    """Reduz a imagem para a resolução alvo, converte para tons de cinza, corrige a inclinação,
+    corta as margens em branco e binariza (Otsu). Menos pixels por página = OCR mais rápido."""
+    target_dpi = target_dpi or OCR_TARGET_DPI
+    image = ImageOps.exif_transpose(image)
+    dpi = _image_dpi(image)
+    gray = image.convert('L')
+    if dpi > target_dpi * 1.1:
+        scale = target_dpi / dpi
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))), Image.LANCZOS)
+        dpi = target_dpi
+
+    threshold = _otsu_threshold(gray)
+    lookup = [0] * (threshold + 1) + [255] * (255 - threshold)
+    binary = gray.point(lookup)
+
+    if OCR_DESKEW_MAX_ANGLE:
+        angle = _estimate_skew(binary)
+        if abs(angle) >= 0.25:
+            gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+            binary = gray.point(lookup)
+
+    # Margens em branco: recorte pela área com tinta, mantendo uma pequena borda
+    bbox = ImageOps.invert(binary).getbbox()
+    if bbox:
+        pad = max(4, round(dpi / 20))
+        bbox = (max(0, bbox[0] - pad), max(0, bbox[1] - pad),
+                min(gray.width, bbox[2] + pad), min(gray.height, bbox[3] + pad))
+        gray, binary = gray.crop(bbox), binary.crop(bbox)
+
+    result = binary if OCR_BINARIZE else gray
+    result.info['dpi'] = (dpi, dpi)
+    return result
+
+class OcrService:
+    """Serviço de OCR: motores Tesseract de longa duração (threads) consumindo uma fila de páginas.
+
+    Com tesserocr, cada motor mantém uma instância da API com o modelo do idioma já carregado;
+    sem ele, cada página é enviada ao pytesseract (um processo por página, como antes).
+    """
+
+    def __init__(self, engines, lang=OCR_LANG):
+        self.engines = engines
+        self.lang = lang
+        self.backend = "tesserocr" if tesserocr is not None else "pytesseract"
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.ocr_seconds = 0.0
+        self.started = time.time()
+        for index in range(engines):
+            threading.Thread(target=self._run_engine, name=f"ocr-{index}", daemon=True).start()
+        logger.info(f"Serviço de OCR iniciado: {engines} motor(es) {self.backend}, idioma '{lang}'")
+
+    def _create_api(self):
+        if tesserocr is None:
+            return None
+        try:
+            return tesserocr.PyTessBaseAPI(lang=self.lang)
+        except Exception as e:
+            logger.warning(f"Não foi possível iniciar o tesserocr, usando pytesseract: {e}")
+            return None
+
+    def _run_engine(self):
+        api = self._create_api()
+        while True:
+            image, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                if OCR_PREPROCESS:
+                    try:
+                        image = preprocess_for_ocr(image)
+                    except Exception as e:
+                        logger.warning(f"Falha no pré-processamento da página, usando a imagem original: {e}")
+                dpi = int(_image_dpi(image))
+                if api is not None:
+                    api.SetImage(image)
+                    api.SetSourceResolution(dpi)
+                    text = api.GetUTF8Text()
+                else:
+                    text = pytesseract.image_to_string(image, lang=self.lang, config=f"--dpi {dpi}")
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(text)
+            self._record(time.perf_counter() - started)
+
+    def _record(self, seconds):
+        with self._lock:
+            self.pages += 1
+            self.ocr_seconds += seconds
+            log_now = self.pages % OCR_METRICS_INTERVAL == 0
+        if log_now:
+            self.log_metrics()
+
+    def submit(self, image):
+        """Enfileira uma imagem de página e retorna um Future com o texto."""
+        image.load()
+        if image.mode not in ('1', 'L', 'RGB'):
+            image = image.convert('RGB')
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def ocr_image(self, image):
+        """Aplica OCR em uma imagem, aguardando o resultado."""
+        return self.submit(image).result()
+
+    def ocr_pages(self, images):
+        """Aplica OCR em um lote de páginas, distribuídas entre os motores, e retorna o texto de cada uma."""
+        futures = [self.submit(image) for image in images]
+        texts = []
+        for future in futures:
+            try:
+                texts.append(future.result())
+            except Exception as e:
+                logger.warning(f"Erro no OCR de página: {e}")
+                texts.append("")
+        return texts
+
+    def metrics(self):
+        """Páginas processadas, vazão (páginas/s), tempo médio por página e profundidade da fila."""
+        with self._lock:
+            pages, ocr_seconds = self.pages, self.ocr_seconds
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            'paginas': pages,
+            'paginas_por_segundo': pages / elapsed,
+            'segundos_por_pagina': ocr_seconds / pages if pages else 0.0,
+            'fila': self._queue.qsize(),
+            'motores': self.engines,
+        }
+
+    def log_metrics(self):
+        m = self.metrics()
+        logger.info(f"OCR: {m['paginas']} páginas, {m['paginas_por_segundo']:.2f} páginas/s, "
+                    f"{m['segundos_por_pagina']:.2f} s/página, fila: {m['fila']}, motores: {m['motores']}")
+
+# Serviço de OCR do processo atual (iniciado sob demanda)
+_ocr_service = None
+_ocr_service_pid = None
+
+def get_ocr_service():
+    """Retorna o serviço de OCR do processo atual, iniciando os motores na primeira página."""
+    global _ocr_service, _ocr_service_pid
+    if _ocr_service_pid != os.getpid():
+        _ocr_service = OcrService(OCR_ENGINES or os.cpu_count() or 1)
+        _ocr_service_pid = os.getpid()
+    return _ocr_service
+
+def _pdf_page_images(page):
+    """Imagens embutidas em uma página de PDF (em PDFs escaneados, uma imagem por página)."""
+    images = []
+    try:
+        for image_file in page.images:
+            images.append(Image.open(io.BytesIO(image_file.data)))
+    except Exception as e:
+        logger.warning(f"Erro ao ler imagens de página do PDF: {e}")
+    return images
+
+class PyPDF2Backend:
+    """Leitura de PDF pelo PyPDF2; o OCR usa as imagens embutidas na página."""
+
+    name = 'pypdf2'
+
+    def __init__(self, file):
+        self.reader = PyPDF2.PdfReader(file)
+
+    def iter_pages(self):
+        for page in self.reader.pages:
+            yield page.extract_text() or "", lambda page=page: _pdf_page_images(page)
+
+    def close(self):
+        pass
+
+class PdfiumBackend:
+    """Leitura de PDF pelo PDFium (pypdfium2); o OCR usa a página renderizada na resolução alvo."""
+
+    name = 'pypdfium2'
+
+    def __init__(self, file):
+        self.document = pypdfium2.PdfDocument(file)
+
+    def _render(self, index):
+        page = self.document[index]
+        try:
+            image = page.render(scale=OCR_TARGET_DPI / 72).to_pil()
+        finally:
+            page.close()
+        image.info['dpi'] = (OCR_TARGET_DPI, OCR_TARGET_DPI)
+        return [image]
+
+    def iter_pages(self):
+        for index in range(len(self.document)):
+            page = self.document[index]
+            try:
+                text_page = page.get_textpage()
+                text = text_page.get_text_range().replace("\r\n", "\n")
+                text_page.close()
+            finally:
+                page.close()
+            yield text, lambda index=index: self._render(index)
+
+    def close(self):
+        self.document.close()
+
+class PdfminerBackend:
+    """Leitura de PDF pelo pdfminer.six; o OCR usa as imagens embutidas (lidas pelo PyPDF2)."""
+
+    name = 'pdfminer'
+
+    def __init__(self, file):
+        self.file = file
+        self._reader = None
+
+    def _images(self, index):
+        if self._reader is None:
+            self._reader = PyPDF2.PdfReader(self.file)
+        return _pdf_page_images(self._reader.pages[index])
+
+    def iter_pages(self):
+        for index, layout in enumerate(pdfminer_extract_pages(self.file)):
+            text = "".join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+            yield text, lambda index=index: self._images(index)
+
+    def close(self):
+        pass
+
+# Bibliotecas de PDF na ordem de preferência do modo 'auto' (None = não instalada). O pdfminer
+# fica por último: em extratos grandes foi cerca de 10x mais lento que o PyPDF2 (benchmark_extracao.py pdf)
+PDF_BACKENDS = {
+    'pypdfium2': PdfiumBackend if pypdfium2 is not None else None,
+    'pypdf2': PyPDF2Backend,
+    'pdfminer': PdfminerBackend if pdfminer_extract_pages is not None else None,
+}
+
+def open_pdf_backend(file, backend=None):
+    """Abre o PDF com a biblioteca configurada (ou a primeira instalada, no modo 'auto')."""
+    backend = backend or PDF_BACKEND
+    if backend == 'auto':
+        backend_class = next(cls for cls in PDF_BACKENDS.values() if cls is not None)
+    else:
+        backend_class = PDF_BACKENDS.get(backend)
+        if backend_class is None:
+            logger.warning(f"Biblioteca de PDF '{backend}' indisponível, usando PyPDF2")
+            backend_class = PyPDF2Backend
+    return backend_class(file)
+
+def _collect_ocr(futures):
+    """Aguarda o OCR das imagens de uma página e junta o texto."""
+    texts = []
+    for future in futures:
+        try:
+            texts.append(future.result())
+        except Exception as e:
+            logger.warning(f"Erro no OCR de página do PDF: {e}")
+    return "\n".join(texts)
+
+# Função para extrair o texto de um PDF página a página
+def iter_pdf_pages(file_path, data=None):
+    """Gera o texto de cada página do PDF, aplicando OCR apenas nas páginas sem texto extraível."""
+    with open_source(file_path, data) as file:
+        backend = open_pdf_backend(file)
+        try:
+            for text, page_images in backend.iter_pages():
+                if not text.strip():
+                    images = page_images()
+                    text = _collect_ocr([get_ocr_service().submit(image) for image in images]) if images else ""
+                yield text
+        finally:
+            backend.close()
+
+# Função para extrair o texto de todas as páginas de um PDF
+def extract_pdf_pages(file_path, data=None):
+    """Retorna o texto de cada página do PDF. As páginas sem texto vão para a fila de OCR sem
+    interromper a leitura das seguintes (limitado a duas páginas em espera por motor de OCR)."""
+    pages = []
+    waiting = []  # índices em pages de páginas aguardando o OCR
+    service = None
+    with open_source(file_path, data) as file:
+        backend = open_pdf_backend(file)
+        try:
+            for text, page_images in backend.iter_pages():
+                if text.strip():
+                    pages.append(text)
+                    continue
+                images = page_images()
+                if not images:
+                    pages.append("")
+                    continue
+                service = service or get_ocr_service()
+                waiting.append(len(pages))
+                pages.append([service.submit(image) for image in images])
+                # Limita as imagens de páginas em memória enquanto o OCR não as consome
+                while len(waiting) > 2 * service.engines:
+                    index = waiting.pop(0)
+                    pages[index] = _collect_ocr(pages[index])
+        finally:
+            backend.close()
+    for index in waiting:
+        pages[index] = _collect_ocr(pages[index])
+    return pages
+
+# Função para classificar um PDF extraindo as páginas por estágios
+def _classify_pdf_progressively(file_path, file_name, content_hash, data=None):
+    """Extrai o PDF por estágios de páginas até que o restante não possa mudar a classificação.
+
+    Retorna (doc_type, doc_subtype, texto extraído, metadados).
+    """
+    rules = get_rules()
+
+    cache = get_extraction_cache() if content_hash else None
+    cached = cache.get(content_hash) if cache is not None else None
+    if cached is not None:
+        if cached[1].get('completo', True):
+            logger.info(f"Texto obtido do cache de extração: {file_path}")
+            doc_type, doc_subtype = classify_document(file_path, cached[0], file_name, data=data)
+            return doc_type, doc_subtype, cached[0], cached[1]
+        decision = classify_partial(file_path, cached[0], file_name, data=data)
+        if decision is not None:
+            logger.info(f"Texto obtido do cache de extração: {file_path}")
+            return decision + (cached[0], cached[1])
+
+    pages = []
+    complete = False
+    decision = None
+    text = ""
+    try:
+        page_iter = iter_pdf_pages(file_path, data)
+        for limit in rules.page_stages + (None,):
+            while limit is None or len(pages) < limit:
+                page_text = next(page_iter, None)
+                if page_text is None:
+                    complete = True
+                    break
+                pages.append(page_text)
+            text = "".join(page_text + "\n" for page_text in pages)
+            if complete:
+                break
+            decision = classify_partial(file_path, text, file_name, data=data)
+            if decision is not None:
+                break
+    except Exception as e:
+        logger.error(f"Erro ao extrair texto do PDF {file_path} por páginas: {e}")
+        text = ""
+        decision = None
+
+    # Sem texto (falha ou OCR por página sem resultado): extração completa, com OCR do documento inteiro
+    if not text.strip():
+        text = extract_text(file_path, data)
+        complete = True
+    elif not complete:
+        logger.info(f"PDF classificado após {len(pages)} página(s), sem extrair o restante: {file_name}")
+    if decision is not None and not complete:
+        doc_type, doc_subtype = decision
+    else:
+        doc_type, doc_subtype = classify_document(file_path, text, file_name, data=data)
+
+    metadata = {'paginas': len(pages), 'completo': complete}
+    if text:
+        document_date(text, metadata)
+        if cache is not None:
+            cache.put(content_hash, text, metadata)
+    return doc_type, doc_subtype, text, metadata
+
+# Função para extrair e classificar de forma progressiva
+def classify_lazily(file_path, file_name, content_hash, data=None):
+    """Classifica pelo nome do arquivo, depois pelas primeiras páginas, extraindo mais só se necessário.
+
+    Só decide antes da extração completa quando o restante do conteúdo não pode mudar o resultado
+    (ver classify_partial); a classificação é a mesma de classify_document com o texto completo.
+    Retorna (doc_type, doc_subtype, texto extraído, metadados).
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    # XMLs são lidos em streaming (os campos do subclassificador saem da própria extração)
+    if file_extension != '.xml':
+        decision = classify_partial(file_path, "", file_name, data=data)
+        if decision is not None:
+            logger.info(f"Classificado pelo nome/extensão do arquivo, sem extração: {file_name}")
+            return decision + ("", {})
+
+    if file_extension == '.pdf':
+        return _classify_pdf_progressively(file_path, file_name, content_hash, data)
+
+    # Demais formatos: extração completa (o custo de OCR está concentrado nos PDFs)
+    file_content, metadata = extract_content_cached(file_path, content_hash, data)
+    doc_type, doc_subtype = classify_document(file_path, file_content, file_name, metadata.get('xml'), data)
+    return doc_type, doc_subtype, file_content, metadata
+
+class FileManifest:
+    """Manifesto em SQLite de todos os arquivos já processados e seus destinos."""
+
+    # Frequência (em registros) de gravação em disco
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, db_path):
+        self._pending = 0
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS arquivos ("
+            "origem TEXT PRIMARY KEY, nome TEXT NOT NULL, tamanho INTEGER NOT NULL, mtime REAL NOT NULL, "
+            "hash TEXT, doc_type TEXT NOT NULL, doc_subtype TEXT, destino TEXT NOT NULL, processado_em REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_nome ON arquivos (nome)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_hash ON arquivos (hash)")
+        self.conn.commit()
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def find_hash(self, file_path, file_stat):
+        """Hash registrado para o arquivo, se o caminho, o tamanho e o mtime não mudaram (None caso contrário)."""
+        row = self.conn.execute(
+            "SELECT hash FROM arquivos WHERE origem = ? AND tamanho = ? AND mtime = ?",
+            (self._key(file_path), file_stat.st_size, file_stat.st_mtime)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_by_hash(self, content_hash):
+        """Último processamento de um conteúdo: (doc_type, doc_subtype, destino) ou None."""
+        return self.conn.execute(
+            "SELECT doc_type, doc_subtype, destino FROM arquivos WHERE hash = ? ORDER BY processado_em DESC LIMIT 1",
+            (content_hash,)
+        ).fetchone()
+
+    def record(self, file_path, file_stat, content_hash, doc_type, doc_subtype, destination):
+        """Registra o resultado do processamento de um arquivo."""
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO arquivos "
+                "(origem, nome, tamanho, mtime, hash, doc_type, doc_subtype, destino, processado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(file_path), os.path.basename(file_path).lower(), file_stat.st_size,
+                 file_stat.st_mtime, content_hash, doc_type, doc_subtype, destination, time.time())
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self.flush()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao registrar {file_path} no manifesto: {e}")
+
+    def flush(self):
+        """Grava em disco os registros pendentes."""
+        if self._pending:
+            self.conn.commit()
+            self._pending = 0
+
+    def find(self, file_ref):
+        """Localiza um arquivo pelo caminho de origem, nome ou hash do conteúdo."""
+        return self.conn.execute(
+            "SELECT origem, doc_type, doc_subtype, destino, processado_em FROM arquivos "
+            "WHERE origem = ? OR nome = ? OR hash = ? ORDER BY processado_em",
+            (self._key(file_ref), os.path.basename(file_ref).lower(), file_ref.lower())
+        ).fetchall()
+
+    def forget(self, file_path):
+        """Remove o registro de um arquivo (ex.: movimentação desfeita), para que volte a ser processado."""
+        try:
+            self.conn.execute("DELETE FROM arquivos WHERE origem = ?", (self._key(file_path),))
+            self._pending += 1
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao remover {file_path} do manifesto: {e}")
+
+# Manifesto do processo coordenador (aberto sob demanda)
+_manifest = None
+
+def get_manifest():
+    """Retorna o manifesto de arquivos processados, abrindo-o sob demanda."""
+    global _manifest
+    if _manifest is None:
+        _manifest = False
+        if MANIFEST_ENABLED:
+            try:
+                _manifest = FileManifest(MANIFEST_PATH)
+            except Exception as e:
+                logger.warning(f"Manifesto indisponível ({MANIFEST_PATH}): {e}")
+    return _manifest or None
+
+class OperationJournal:
+    """Diário de operações em JSON Lines (somente acréscimo), compartilhado pelas etapas do script.
+
+    Cada registro tem o identificador da execução ("execucao") e um "evento". As operações ("move",
+    "extract" e "delete") são gravadas como "planejado" antes de executadas e, depois, como "concluido",
+    "ignorado" ou "erro". Um plano gravado por inteiro (plan_batch) termina com "plano_completo" e cada
+    grupo processado (diretório, arquivo compactado ou pasta de CNPJ) com "grupo_concluido".
+    Um plano começa com "plano_inicio"; o que ficou sem "plano_completo" não chegou a ser executado.
+    Um plano gravado em lotes (arquivos compactados) tem "parcial" no "plano_completo" dos lotes
+    intermediários; os lotes de um mesmo grupo se acumulam até o último.
+
+    Com resume, a última execução do diário continua: etapas e grupos concluídos são ignorados e os
+    planos completos são terminados a partir do diário (pending_plan), sem varrer nem extrair de novo.
+    """
+
+    def __init__(self, path, resume=False, run_id=None):
+        self.path = path
+        self.run_id = run_id
+        self.stage = None
+        self._lock = threading.Lock()
+        self._next_id = 1
+        # Estado da execução retomada
+        self._stages_finished = set()
+        self._groups_done = set()
+        self._plans = {}      # (etapa, grupo) -> operações do plano completo
+        self._partial_plans = {}  # (etapa, grupo) -> operações dos lotes gravados de um plano interrompido
+        self._finished = set()
+
+        if resume or run_id is not None:
+            records = list(self.read(path))
+            if run_id is None and records and not any(
+                    r.get('evento') == "execucao_desfeita" and r.get('execucao') == records[-1].get('execucao') for r in records):
+                self.run_id = records[-1].get('execucao')
+            if self.run_id is not None:
+                self._load(record for record in records if record.get('execucao') == self.run_id)
+                logger.info(f"Diário de operações: execução {self.run_id} retomada")
+        if self.run_id is None:
+            self.run_id = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+            try:
+                removed = self.compact(path)
+                if removed:
+                    logger.info(f"Diário de operações compactado: {removed} registro(s) removido(s)")
+            except OSError as e:
+                logger.warning(f"Não foi possível compactar o diário de operações {path}: {e}")
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def read(path):
+        """Lê os registros do diário (uma linha incompleta, de uma gravação interrompida, é ignorada)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    @classmethod
+    def compact(cls, path, keep_runs=None):
+        """Reescreve o diário com o necessário para desfazer as execuções (--undo) e retomar a última.
+
+        As execuções desfeitas e as além das keep_runs mais recentes (padrão: JOURNAL_KEEP_RUNS) são
+        removidas; das demais, exceto a última, ficam só os registros "planejado" e "concluido" das
+        operações concluídas e ainda não desfeitas. Retorna o número de registros removidos.
+        """
+        records = list(cls.read(path))
+        if not records:
+            return 0
+        runs = {}  # execução -> registros, na ordem do diário
+        for record in records:
+            runs.setdefault(record.get('execucao'), []).append(record)
+        undone_runs = {record.get('execucao') for record in records if record.get('evento') == "execucao_desfeita"}
+        kept_runs = [run_id for run_id in runs if run_id not in undone_runs][-(keep_runs or JOURNAL_KEEP_RUNS):]
+        last_run = records[-1].get('execucao')
+
+        kept = []
+        for run_id in kept_runs:
+            run_records = runs[run_id]
+            if run_id == last_run:
+                kept.extend(run_records)
+                continue
+            completed = ({record['id'] for record in run_records if record.get('evento') == "concluido"}
+                         - {record['id'] for record in run_records if record.get('evento') == "desfeito"})
+            kept.extend(record for record in run_records
+                        if record.get('evento') in ("planejado", "concluido") and record.get('id') in completed)
+        if len(kept) == len(records):
+            return 0
+
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for record in kept:
+                file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        return len(records) - len(kept)
+
+    @staticmethod
+    def _key(group):
+        return os.path.normcase(os.path.abspath(group))
+
+    def _load(self, records):
+        planned = {}  # (etapa, grupo) -> operações planejadas desde o último "plano_completo"
+        for record in records:
+            event = record.get('evento')
+            if event == "planejado":
+                if record.get('grupo') is not None:
+                    planned.setdefault((record['etapa'], self._key(record['grupo'])), []).append(record)
+                self._next_id = max(self._next_id, record['id'] + 1)
+            elif event in ("concluido", "ignorado"):
+                self._finished.add(record['id'])
+            elif event == "plano_inicio":
+                # Um plano regravado após uma interrupção substitui o que ficou incompleto
+                planned[(record['etapa'], self._key(record['grupo']))] = []
+            elif event == "plano_completo":
+                key = (record['etapa'], self._key(record['grupo']))
+                ops = self._partial_plans.pop(key, []) + planned.pop(key, [])
+                if record.get('parcial'):
+                    self._partial_plans[key] = ops
+                else:
+                    self._plans[key] = ops
+            elif event == "grupo_concluido":
+                self._groups_done.add((record['etapa'], self._key(record['grupo'])))
+            elif event == "fim":
+                self._stages_finished.add(record['etapa'])
+
+    def _write(self, record, sync=False):
+        record = dict(record, execucao=self.run_id)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def begin(self, stage):
+        self.stage = stage
+        self._write({'evento': "inicio", 'etapa': stage, 'em': time.time()})
+
+    def end(self, stage):
+        self._write({'evento': "fim", 'etapa': stage, 'em': time.time()}, sync=True)
+
+    def stage_finished(self, stage):
+        """Indica se a etapa já foi concluída na execução retomada."""
+        return stage in self._stages_finished
+
+    def is_group_done(self, group):
+        return (self.stage, self._key(group)) in self._groups_done
+
+    def pending_plan(self, group):
+        """Operações ainda não concluídas do plano completo de um grupo (None se o plano não chegou a ser gravado)."""
+        ops = self._plans.get((self.stage, self._key(group)))
+        if ops is None:
+            return None
+        return self.unfinished(ops)
+
+    def unfinished(self, ops):
+        """Operações de ops ainda não concluídas nem ignoradas."""
+        return [op for op in ops if op['id'] not in self._finished]
+
+    def partial_plan(self, group):
+        """Operações dos lotes já gravados de um plano interrompido antes do último lote (None se não houver)."""
+        return self._partial_plans.get((self.stage, self._key(group)))
+
+    def _new_id(self):
+        with self._lock:
+            op_id = self._next_id
+            self._next_id += 1
+        return op_id
+
+    def plan(self, group, op, origin, destination=None, **details):
+        """Grava uma operação como planejada e retorna o seu identificador."""
+        op_id = self._new_id()
+        self._write(dict(details, evento="planejado", id=op_id, etapa=self.stage, grupo=group,
+                         op=op, origem=origin, destino=destination))
+        return op_id
+
+    def plan_batch(self, group, ops, partial=False):
+        """Grava um plano inteiro (dicionários com op, origem, destino...) entre "plano_inicio" e "plano_completo".
+
+        Com partial, grava um lote intermediário: o plano do grupo continua nos lotes seguintes.
+        Retorna os identificadores das operações, na mesma ordem.
+        """
+        op_ids = []
+        self._write({'evento': "plano_inicio", 'etapa': self.stage, 'grupo': group})
+        for op in ops:
+            details = dict(op)
+            op_ids.append(self.plan(group, details.pop('op'), details.pop('origem'), details.pop('destino', None), **details))
+        completed = {'evento': "plano_completo", 'etapa': self.stage, 'grupo': group}
+        if partial:
+            completed['parcial'] = True
+        self._write(completed, sync=True)
+        return op_ids
+
+    def done(self, op_id):
+        self._write({'evento': "concluido", 'id': op_id})
+
+    def skipped(self, op_id):
+        self._write({'evento': "ignorado", 'id': op_id})
+
+    def failed(self, op_id, error):
+        self._write({'evento': "erro", 'id': op_id, 'erro': str(error)})
+
+    def undone(self, op_id):
+        self._write({'evento': "desfeito", 'id': op_id})
+
+    def group_done(self, group):
+        self._write({'evento': "grupo_concluido", 'etapa': self.stage, 'grupo': group})
+
+    def run_undone(self):
+        """Marca a execução como desfeita (não será mais retomada)."""
+        self._write({'evento': "execucao_desfeita"}, sync=True)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+# Diário do processo coordenador (aberto sob demanda)
+_journal = None
+
+def get_journal():
+    """Retorna o diário de operações, abrindo-o sob demanda (None se desativado)."""
+    global _journal
+    if _journal is None:
+        _journal = False
+        if JOURNAL_ENABLED:
+            try:
+                _journal = OperationJournal(JOURNAL_PATH, resume=JOURNAL_RESUME)
+            except Exception as e:
+                logger.warning(f"Diário de operações indisponível ({JOURNAL_PATH}): {e}")
+    return _journal or None
+
+def replay_operations(journal, ops):
+    """Conclui operações pendentes de um plano do diário (retomada), sem nova varredura nem extração.
+
+    Retorna a contagem ("moved", "files", "folders", "bytes", "error"...).
+    """
+    statuses = Counter()
+    manifest = get_manifest()
+    members = {}
+    for op in ops:
+        origin, destination = op['origem'], op['destino']
+        if op['op'] == "extract":
+            # Membros de arquivos compactados: relidos do arquivo (grupo do plano), já com o destino definido
+            members.setdefault(op['grupo'], {})[origin] = op
+        elif op['op'] == "delete":
+            statuses.update(delete_tree(origin, contents_only=op.get('somente_conteudo', False),
+                                        keep=op.get('manter', ()), op_id=op['id']))
+        elif op['op'] == "move":
+            if not os.path.lexists(origin) and os.path.lexists(destination):
+                # Movido antes da interrupção, sem o registro de conclusão
+                journal.done(op['id'])
+                statuses["moved"] += 1
+                continue
+            try:
+                file_stat = os.stat(origin)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                if os.path.lexists(destination):
+                    raise FileExistsError(f"Destino já existe: {destination}")
+                shutil.move(origin, destination)
+            except Exception as e:
+                logger.error(f"Erro ao retomar movimentação {origin} -> {destination}: {e}")
+                journal.failed(op['id'], e)
+                statuses["error"] += 1
+                continue
+            if manifest is not None and op.get('tipo'):
+                manifest.record(origin, file_stat, op.get('hash'), op['tipo'], op.get('subtipo'), destination)
+            journal.done(op['id'])
+            logger.info(f"Movimentação retomada do diário: {origin} -> {destination}")
+            statuses["moved"] += 1
+
+    for archive_path, pending in members.items():
+        try:
+            archive_mtime = os.stat(archive_path).st_mtime
+        except OSError:
+            archive_mtime = time.time()
+        for member in iter_archive_members(archive_path, archive_path, archive_mtime):
+            op = pending.pop(member.path, None)
+            if op is None:
+                continue
+            try:
+                os.makedirs(os.path.dirname(op['destino']), exist_ok=True)
+                with open(op['destino'], 'xb') as file:
+                    file.write(member.data)
+            except FileExistsError:
+                pass  # Gravado antes da interrupção
+            except Exception as e:
+                logger.error(f"Erro ao retomar gravação de {member.path}: {e}")
+                journal.failed(op['id'], e)
+                statuses["error"] += 1
+                continue
+            if manifest is not None and op.get('tipo'):
+                manifest.record(member.path, member, op.get('hash'), op['tipo'], op.get('subtipo'), op['destino'])
+            journal.done(op['id'])
+            statuses["moved"] += 1
+        for op in pending.values():
+            logger.error(f"Membro não encontrado ao retomar o diário: {op['origem']}")
+            journal.failed(op['id'], "membro não encontrado")
+            statuses["error"] += 1
+    if manifest is not None:
+        manifest.flush()
+    return statuses
+
+def undo_last_run(run_id=None):
+    """Desfaz uma execução do diário (padrão: a última ainda não desfeita): as movimentações voltam à
+    origem, na ordem inversa.
+
+    Membros de arquivos compactados gravados no destino são apagados; deleções não podem ser desfeitas.
+    """
+    records = list(OperationJournal.read(JOURNAL_PATH))
+    if not records:
+        print(f"Diário de operações vazio ou inexistente: {JOURNAL_PATH}")
+        return
+    undone_runs = {record.get('execucao') for record in records if record.get('evento') == "execucao_desfeita"}
+    if run_id is None:
+        # Desfazer de novo volta mais uma execução: as já desfeitas são puladas
+        run_id = next((record.get('execucao') for record in reversed(records)
+                       if record.get('execucao') not in undone_runs), None)
+        if run_id is None:
+            print(f"Todas as execuções do diário já foram desfeitas: {JOURNAL_PATH}")
+            return
+    elif run_id in undone_runs:
+        print(f"Execução {run_id} já foi desfeita")
+        return
+    elif not any(record.get('execucao') == run_id for record in records):
+        print(f"Execução {run_id} não encontrada no diário: {JOURNAL_PATH}")
+        return
+    planned = {}
+    completed = []
+    undone = set()
+    for record in records:
+        if record.get('execucao') != run_id:
+            continue
+        event = record.get('evento')
+        if event == "planejado":
+            planned[record['id']] = record
+        elif event == "concluido":
+            completed.append(record['id'])
+        elif event == "desfeito":
+            undone.add(record['id'])
+
+    journal = OperationJournal(JOURNAL_PATH, run_id=run_id)
+    manifest = get_manifest()
+    statuses = Counter()
+    for op_id in reversed(completed):
+        op = planned.get(op_id)
+        if op is None or op_id in undone:
+            continue
+        origin, destination = op['origem'], op['destino']
+        try:
+            if op['op'] == "delete":
+                print(f"Deleção não pode ser desfeita: {origin}")
+                statuses["irreversible"] += 1
+                continue
+            if op['op'] == "extract":
+                if os.path.lexists(destination):
+                    os.unlink(destination)
+            elif not os.path.lexists(destination) or os.path.lexists(origin):
+                print(f"Ignorado (destino ausente ou origem ocupada): {destination} -> {origin}")
+                statuses["skipped"] += 1
+                continue
+            else:
+                os.makedirs(os.path.dirname(origin), exist_ok=True)
+                shutil.move(destination, origin)
+        except Exception as e:
+            print(f"ERRO ao desfazer {op['op']} {origin}: {e}")
+            statuses["error"] += 1
+            continue
+        if manifest is not None and op.get('tipo'):
+            manifest.forget(origin)
+        journal.undone(op_id)
+        statuses["undone"] += 1
+    journal.run_undone()
+    journal.close()
+    if manifest is not None:
+        manifest.flush()
+    print(f"Execução {run_id} desfeita: {statuses['undone']} operação(ões) desfeita(s), "
+          f"{statuses['irreversible']} deleção(ões) irreversível(is), {statuses['skipped']} ignorada(s), {statuses['error']} erro(s)")
+
+class ArchiveMember:
+    """Membro de um arquivo compactado lido em memória.
+
+    path é o caminho virtual (arquivo.zip/pasta/membro.xml); st_size e st_mtime permitem usar
+    o membro no lugar do os.stat() de um arquivo comum (plano de movimentação e manifesto).
+    """
+
+    __slots__ = ('path', 'data', 'st_size', 'st_mtime')
+
+    def __init__(self, path, data, mtime):
+        self.path = path
+        self.data = data
+        self.st_size = len(data)
+        self.st_mtime = mtime
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+def _open_archive(source, archive_path):
+    """Abre um ZIP/RAR a partir de um caminho ou objeto de arquivo."""
+    file_extension = os.path.splitext(archive_path)[1].lower()
+    if file_extension == '.zip':
+        return zipfile.ZipFile(source, 'r')
+    if file_extension == '.rar':
+        return rarfile.RarFile(source, 'r')
+    return None
+
+# Função para ler os membros de arquivos ZIP e RAR sem descompactá-los em disco
+def iter_archive_members(source, archive_path, archive_mtime, depth=0, budget=None):
+    """Gera os membros (ArchiveMember) de um ZIP/RAR, inclusive de arquivos compactados aninhados.
+
+    Os arquivos compactados aninhados também são gerados (vão para REVISÃO MANUAL, como o de origem).
+    """
+    member_limit = ARCHIVE_MEMBER_MAX_MB * 1024 * 1024
+    if budget is None:
+        budget = [ARCHIVE_MAX_TOTAL_MB * 1024 * 1024]
+    archive = None
+    try:
+        archive = _open_archive(source, archive_path)
+        if archive is None:
+            return
+        infos = archive.infolist()
+    except Exception as e:
+        # Falha ao abrir o próprio arquivo compactado (os membros são tratados um a um abaixo)
+        logger.error(f"Erro ao descompactar {archive_path}: {e}")
+        if archive is not None:
+            archive.close()
+        return
+    with archive:
+        for info in infos:
+            if info.is_dir():
+                continue
+            member_name = info.filename.replace('\\', '/').strip('/')
+            member_path = os.path.join(archive_path, *member_name.split('/'))
+            if info.file_size > member_limit or info.file_size > budget[0]:
+                logger.warning(f"Membro ignorado (limite de tamanho do arquivo compactado): {member_path}")
+                continue
+            # O tamanho declarado no cabeçalho não é confiável: a leitura também é limitada
+            try:
+                with archive.open(info) as member_file:
+                    data = member_file.read(min(member_limit, budget[0]) + 1)
+            except Exception as e:
+                # Membro corrompido, criptografado ou truncado: os demais continuam sendo lidos
+                logger.error(f"Erro ao descompactar o membro {member_path}: {e}")
+                continue
+            if len(data) > min(member_limit, budget[0]):
+                logger.warning(f"Membro ignorado (limite de tamanho do arquivo compactado): {member_path}")
+                continue
+            budget[0] -= len(data)
+            try:
+                mtime = time.mktime(tuple(info.date_time) + (0, 0, -1))
+            except (TypeError, ValueError, OverflowError):
+                mtime = archive_mtime
+            member = ArchiveMember(member_path, data, mtime)
+            yield member
+
+            if member_path.lower().endswith(ARCHIVE_EXTENSIONS):
+                if depth + 1 >= ARCHIVE_MAX_DEPTH:
+                    logger.warning(f"Arquivo compactado aninhado além do limite de profundidade: {member_path}")
+                    continue
+                yield from iter_archive_members(io.BytesIO(data), member_path, mtime, depth + 1, budget)
+    logger.info(f"Arquivo compactado lido: {archive_path}")
+
+# Expressão do cabeçalho com o número de colunas das planilhas (ver extract_text)
+NUM_COLUMNS_PATTERN = re.compile(r"NUM_COLUMNS: (\d+)")
+TPNF_PATTERN = re.compile(r"<tpNF>\s*(\d)\s*</tpNF>")
+TPNF_PATTERN_LOWER = re.compile(r"<tpnf>\s*(\d)\s*</tpnf>")
+
+class KeywordHits:
+    """Consulta palavras-chave em um texto, percorrendo o texto no máximo uma vez por palavra."""
+
+    __slots__ = ('text', '_hits')
+
+    def __init__(self, text):
+        self.text = text
+        self._hits = {}
+
+    def __contains__(self, keyword):
+        hit = self._hits.get(keyword)
+        if hit is None:
+            hit = self._hits[keyword] = keyword in self.text
+        return hit
+
+    def any(self, keywords):
+        """Indica se alguma das palavras-chave ocorre no texto."""
+        return any(keyword in self for keyword in keywords)
+
+class GatedPattern:
+    """Expressão regular precompilada, avaliada apenas quando um literal obrigatório ocorre no texto.
+
+    A busca de substring do Python é muito mais rápida que uma regex com limites de palavra
+    ou alternativas, então o literal descarta a maioria dos textos sem percorrer a regex.
+    """
+
+    def __init__(self, pattern, required_literals):
+        self.regex = re.compile(pattern)
+        self.required_literals = tuple(required_literals)
+
+    def search(self, hits):
+        return hits.any(self.required_literals) and self.regex.search(hits.text) is not None
+
+class ClassificationRule:
+    """Regra da tabela de classificação: todas as condições informadas precisam ser atendidas."""
+
+    FIELDS = ('descricao', 'tipo', 'subtipo', 'subclassificador', 'extensoes', 'colunas',
+              'conteudo', 'nome', 'conteudo_todos', 'excluir_conteudo', 'excluir_nome')
+
+    def __init__(self, spec):
+        unknown = set(spec) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Campos desconhecidos na regra {spec.get('descricao', spec.get('tipo'))}: {sorted(unknown)}")
+        if 'tipo' not in spec:
+            raise ValueError(f"Regra sem 'tipo': {spec}")
+        self.description = spec.get('descricao', spec['tipo'])
+        self.doc_type = spec['tipo']
+        self.doc_subtype = spec.get('subtipo')
+        self.subclassifier = spec.get('subclassificador')
+        if self.subclassifier is not None and self.subclassifier not in SUBCLASSIFIERS:
+            raise ValueError(f"Subclassificador desconhecido na regra {self.description}: {self.subclassifier}")
+        self.extensions = frozenset(spec['extensoes']) if 'extensoes' in spec else None
+        self.min_columns, self.max_columns = spec.get('colunas') or (None, None)
+        self.content = tuple(spec.get('conteudo', ()))
+        self.name = tuple(spec.get('nome', ()))
+        self.content_all = tuple(tuple(group) for group in spec.get('conteudo_todos', ()))
+        self.exclude_content = tuple(spec.get('excluir_conteudo', ()))
+        self.exclude_name = tuple(spec.get('excluir_nome', ()))
+
+    def matches(self, file_extension, num_columns, content, name):
+        if self.extensions is not None and file_extension not in self.extensions:
+            return False
+        if self.min_columns is not None and num_columns < self.min_columns:
+            return False
+        if self.max_columns is not None and num_columns > self.max_columns:
+            return False
+        # Palavras-chave no conteúdo OU no nome do arquivo
+        if (self.content or self.name) and not (content.any(self.content) or name.any(self.name)):
+            return False
+        if not all(content.any(group) for group in self.content_all):
+            return False
+        if content.any(self.exclude_content) or name.any(self.exclude_name):
+            return False
+        return True
+
+    def is_ruled_out(self, file_extension, num_columns, content, name):
+        """Indica se a regra não pode ser atendida mesmo com o restante do texto do documento.
+
+        Extensão, número de colunas, nome e exclusões já encontradas não mudam com mais texto;
+        as palavras-chave de conteúdo ainda podem aparecer.
+        """
+        if self.extensions is not None and file_extension not in self.extensions:
             return True
-        elif file_extension == '.rar':
-            with rarfile.RarFile(file_path, 'r') as rar_ref:
-                rar_ref.extractall(extract_dir)
-            logger.info(f"Arquivo RAR extraído: {file_path}")
+        if self.min_columns is not None and num_columns < self.min_columns:
             return True
-        return False
+        if self.max_columns is not None and num_columns > self.max_columns:
+            return True
+        return content.any(self.exclude_content) or name.any(self.exclude_name)
+
+class RuleSet:
+    """Tabela de regras compilada a partir de regras_classificacao.json."""
+
+    # Altere ao mudar a estrutura das classes acima para invalidar o cache .pickle
+    COMPILER_VERSION = 3
+
+    def __init__(self, data, signature):
+        self.signature = signature
+        self.folder_structure = {doc_type: tuple(subtypes) for doc_type, subtypes in data['estrutura_pastas'].items()}
+        self.type_markers = tuple(f"[{doc_type}]" for doc_type in self.folder_structure)
+        self.folders_to_contabil = tuple(data['pastas_contabil'])
+        self.folders_to_fiscal = tuple(data['pastas_fiscal'])
+        self.default_type = data['tipo_padrao']
+        self.rules = tuple(ClassificationRule(spec) for spec in data['regras'])
+
+        nota_fiscal = data['nota_fiscal']
+        self.nf_debito_keywords = tuple(nota_fiscal['nota_debito'])
+        self.nf_entrada_patterns = tuple(GatedPattern(p['regex'], p['literais']) for p in nota_fiscal['padroes_entrada'])
+        self.nf_saida_patterns = tuple(GatedPattern(p['regex'], p['literais']) for p in nota_fiscal['padroes_saida'])
+        self.nf_default_subtype = nota_fiscal['subtipo_padrao']
+        self.dacte_default_subtype = data['dacte']['subtipo_padrao']
+
+        self.page_stages = tuple(data['extracao_progressiva']['paginas_por_estagio'])
+
+        for rule in self.rules:
+            if rule.doc_type not in self.folder_structure:
+                raise ValueError(f"Tipo '{rule.doc_type}' da regra {rule.description} não existe em estrutura_pastas")
+        for folder_name in self.folders_to_contabil + self.folders_to_fiscal:
+            if folder_name not in self.type_markers:
+                logger.warning(f"Pasta '{folder_name}' de pastas_contabil/pastas_fiscal não corresponde a nenhum tipo de estrutura_pastas")
+
+def _rules_signature(path):
+    file_stat = os.stat(path)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+# Função para carregar as regras de classificação
+def load_rules(path=RULES_PATH, cache_path=RULES_CACHE_PATH):
+    """Carrega a tabela de regras, usando a versão compilada em cache quando o JSON não mudou."""
+    signature = _rules_signature(path)
+    try:
+        with open(cache_path, 'rb') as file:
+            compiler_version, cached = pickle.load(file)
+        if compiler_version == RuleSet.COMPILER_VERSION and cached.signature == signature:
+            return cached
+    except Exception:
+        # Cache ausente, de outra versão ou corrompido: recompilar a partir do JSON
+        pass
+
+    with open(path, 'r', encoding='utf-8') as file:
+        rules = RuleSet(json.load(file), signature)
+
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as file:
+            pickle.dump((RuleSet.COMPILER_VERSION, rules), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except (OSError, pickle.PicklingError) as e:
+        logger.warning(f"Não foi possível gravar o cache das regras ({cache_path}): {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    return rules
+
+def get_rules():
+    """Retorna a tabela de regras carregada no processo atual."""
+    return _rules
+
+def reload_rules_if_changed():
+    """Recarrega as regras se o arquivo JSON foi alterado desde o último carregamento."""
+    global _rules
+    try:
+        if _rules_signature(RULES_PATH) == _rules.signature:
+            return False
+        _rules = load_rules()
+        logger.info(f"Regras de classificação recarregadas de {RULES_PATH}")
+        return True
     except Exception as e:
-        logger.error(f"Erro ao descompactar {file_path}: {e}")
+        logger.error(f"Erro ao recarregar regras de classificação; mantendo as regras atuais: {e}")
         return False
 
+def _classify_nota_fiscal(file_path, file_extension, content, file_name, rules, xml_fields=None, data=None):
+    """Define o subtipo de uma nota fiscal (data: conteúdo do membro de arquivo compactado)."""
+    logger.info(f"[NF] Arquivo identificado como NOTA FISCAL: {file_name}")
+
+    # Caso seja uma Nota de Débito
+    if content.any(rules.nf_debito_keywords):
+        logger.info(f"[NF] Classificado como NOTA DE DEBITO")
+        return "NOTA DE DEBITO"
+
+    # Verificação de tipo via tag <tpNF> para XML/HTML
+    if file_extension in ['.xml', '.html']:
+        tpnf_value = None
+        if xml_fields and 'tpNF' in xml_fields:
+            # Campo já lido na extração do XML (parse_xml_fields)
+            tpnf_value = xml_fields['tpNF']
+        elif file_extension == '.xml' and content.text:
+            # O texto extraído do XML é o próprio XML
+            match = TPNF_PATTERN_LOWER.search(content.text)
+            tpnf_value = match.group(1) if match else None
+        else:
+            try:
+                with open_source(file_path, data) as f:
+                    raw_text = f.read().decode('utf-8', errors='ignore')
+                match = TPNF_PATTERN.search(raw_text)
+                tpnf_value = match.group(1) if match else None
+            except Exception as e:
+                logger.warning(f"[NF] Falha ao ler tag <tpNF>: {e}")
+        if tpnf_value == '1':
+            logger.info(f"[NF] Tag <tpNF> = 1 -> ENTRADA")
+            return "ENTRADA"
+        elif tpnf_value == '0':
+            logger.info(f"[NF] Tag <tpNF> = 0 -> SAIDA")
+            return "SAIDA"
+
+    # Verificações textuais
+    if any(pattern.search(content) for pattern in rules.nf_entrada_patterns):
+        logger.info(f"[NF] Conteúdo indica ENTRADA")
+        return "ENTRADA"
+
+    if any(pattern.search(content) for pattern in rules.nf_saida_patterns):
+        logger.info(f"[NF] Conteúdo indica SAIDA")
+        return "SAIDA"
+
+    logger.info(f"[NF] Nenhum padrão de entrada/saída detectado -> classificado como {rules.nf_default_subtype}")
+    return rules.nf_default_subtype
+
+def _classify_dacte(file_path, file_extension, content, file_name, rules, xml_fields=None, data=None):
+    """Define o subtipo de um DACTE pelo CNPJ do emissor (data: conteúdo do membro de arquivo compactado)."""
+    logger.info(f"[DACTE] Arquivo identificado como DACTE: {file_name}")
+
+    if file_extension == '.xml':
+        try:
+            if xml_fields is None:
+                with open_source(file_path, data) as file:
+                    xml_fields = parse_xml_fields(file)
+            cnpj_emissor = xml_fields.get('emit_cnpj')
+            if cnpj_emissor:
+                client_cnpj = extract_cnpj_from_path(file_path)
+                if cnpj_emissor == client_cnpj:
+                    logger.info(f"[DACTE] Classificado como SAIDA (CNPJ emissor igual ao cliente): {file_name}")
+                    return "SAIDA"
+                else:
+                    logger.info(f"[DACTE] Classificado como ENTRADA (CNPJ emissor diferente): {file_name}")
+                    return "ENTRADA"
+        except Exception as e:
+            logger.warning(f"[DACTE] Erro ao processar XML: {e}")
+
+    # Caso não consiga acessar XML ou não seja XML, assume o subtipo padrão (ENTRADA) como padrão seguro
+    logger.info(f"[DACTE] Classificação padrão como {rules.dacte_default_subtype} (fallback): {file_name}")
+    return rules.dacte_default_subtype
+
+# Subclassificadores que podem ser referenciados pelas regras ("subclassificador")
+SUBCLASSIFIERS = {
+    'nota_fiscal': _classify_nota_fiscal,
+    'dacte': _classify_dacte,
+}
+# Subclassificadores que dependem do texto extraído do documento
+CONTENT_SUBCLASSIFIERS = {'nota_fiscal'}
+
 # Função para classificar documentos
-def classify_document(file_path, file_content, file_name):
-    """Classifica o documento com base no conteúdo e nome do arquivo."""
+def classify_document(file_path, file_content, file_name, xml_fields=None, data=None):
+    """Classifica o documento aplicando a tabela de regras, na ordem de prioridade.
+
+    xml_fields são os campos já lidos do XML na extração (ver parse_xml_fields); sem eles,
+    o XML é lido novamente quando necessário (de data, em membros de arquivos compactados).
+    """
+    rules = get_rules()
     
     # Normalizar conteúdo e nome para facilitar a busca
-    content_lower = file_content.lower() if file_content else ""
-    name_lower = file_name.lower()
+    file_content = file_content or ""
+    content = KeywordHits(file_content.lower())
+    name = KeywordHits(file_name.lower())
     
     # Extrair extensão do arquivo
     file_extension = os.path.splitext(file_path)[1].lower()
@@ -161,169 +1950,57 @@ def classify_document(file_path, file_content, file_name):
     # Verificar número de colunas em tabelas (para Excel)
     num_columns = 0
     if "NUM_COLUMNS:" in file_content:
-        match = re.search(r"NUM_COLUMNS: (\d+)", file_content)
+        match = NUM_COLUMNS_PATTERN.search(file_content)
         if match:
             num_columns = int(match.group(1))
     
-    # Classificação por regras específicas
-    
-    # A. Classificação de "CONTA CORRENTE"
-    if file_extension in ['.ofx', '.ofc']:
-        return "EXTRATO", "CONTA CORRENTE"
+    # A primeira regra atendida define o tipo do documento
+    for rule in rules.rules:
+        if rule.matches(file_extension, num_columns, content, name):
+            if rule.subclassifier is not None:
+                subclassify = SUBCLASSIFIERS[rule.subclassifier]
+                return rule.doc_type, subclassify(file_path, file_extension, content, file_name, rules, xml_fields, data)
+            return rule.doc_type, rule.doc_subtype
     
-    if num_columns <= 6 and num_columns > 0:
-        if "extrato de conta" in content_lower or "lançamento" in content_lower:
-            return "EXTRATO", "CONTA CORRENTE"
-        if any(keyword in content_lower for keyword in ["Inter", "CC_", "CEF"]) and any(keyword in content_lower for keyword in ["Extrato Bradesco", "Extrato Inter", "Extrato Itau", "Extrato banco", "Extrato Bancario", "Saldo"]):
-            return "EXTRATO", "CONTA CORRENTE"
-    
-        # Verificar se há 17 dias do mesmo mês no conteúdo
-    months_pattern = r'(janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)'
-    if re.search(months_pattern, content_lower):
-        # Implementação simplificada - na prática precisaria de uma análise mais detalhada
-        return "EXTRATO", "CONTA CORRENTE"
-    
-    # B. Classificação de "APLICAÇÃO FINANCEIRA"
-    if ("irrf" in content_lower and "i.r." in content_lower) and num_columns >= 7:
-        return "EXTRATO", "APLICAÇÃO FINANCEIRA"
-    
-    if "cdb" in name_lower:
-        return "EXTRATO", "APLICAÇÃO FINANCEIRA"
-    
-    # C. Classificação de "BOLETO"
-    if num_columns <= 2 and num_columns > 0:
-        if "extrato" not in content_lower:
-            return "BOLETO", None
-    
-    # D. Classificação de "NOTA FISCAL"
-    nf_keywords_content = [
-        "danfe", "prefeitura", "nota fiscal", "nf", "nfe", "nf-e", "autnfe", 
-        "tomador", "fornecedor", "classificação", "classificacao", 
-        "documento auxiliar", "chave de acesso", "autorização de uso", "serie", 
-        "danfse"
-    ]
-    nf_keywords_filename = ["nfe", "nf-e", "nf", "autnfe", "danfe", "-can"]
+    # Se chegou até aqui, não foi possível classificar
+    return rules.default_type, None
 
-    if any(kw in content_lower for kw in nf_keywords_content) or any(kw in name_lower for kw in nf_keywords_filename):
-        logger.info(f"[NF] Arquivo identificado como NOTA FISCAL: {file_name}")
+# Função para classificar com parte do conteúdo
+def classify_partial(file_path, file_content, file_name, xml_fields=None, data=None):
+    """Classifica com apenas parte do conteúdo (ou nenhum), se o restante não puder mudar o resultado.
 
-        # Caso seja uma Nota de Débito
-        if "nota de débito" in content_lower or "nota de debito" in content_lower:
-            logger.info(f"[NF] Classificado como NOTA DE DEBITO")
-            return "NOTA FISCAL", "NOTA DE DEBITO"
+    Retorna (doc_type, doc_subtype), ou None quando é preciso extrair mais. A regra atendida só
+    decide se todas as regras de maior prioridade já estiverem descartadas (ver
+    ClassificationRule.is_ruled_out) e se mais texto não puder excluí-la (excluir_conteudo) nem mudar
+    o subtipo (subclassificadores de CONTENT_SUBCLASSIFIERS). Assim, o resultado é sempre o mesmo de
+    classify_document com o texto completo.
+    """
+    rules = get_rules()
+    file_content = file_content or ""
+    content = KeywordHits(file_content.lower())
+    name = KeywordHits(file_name.lower())
+    file_extension = os.path.splitext(file_path)[1].lower()
+    # Somente planilhas têm colunas (NUM_COLUMNS, ver extract_text)
+    if file_extension in ['.xlsx', '.xls']:
+        return None
 
-        # Verificação de tipo via tag <tpNF> para XML/HTML
-        if file_extension in ['.xml', '.html']:
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    raw_text = f.read()
-                match = re.search(r"<tpNF>\s*(\d)\s*</tpNF>", raw_text)
-                if match:
-                    tpnf_value = match.group(1)
-                    if tpnf_value == '1':
-                        logger.info(f"[NF] Tag <tpNF> = 1 -> ENTRADA")
-                        return "NOTA FISCAL", "ENTRADA"
-                    elif tpnf_value == '0':
-                        logger.info(f"[NF] Tag <tpNF> = 0 -> SAIDA")
-                        return "NOTA FISCAL", "SAIDA"
-            except Exception as e:
-                logger.warning(f"[NF] Falha ao ler tag <tpNF>: {e}")
+    for rule in rules.rules:
+        if rule.matches(file_extension, 0, content, name):
+            if rule.exclude_content or rule.subclassifier in CONTENT_SUBCLASSIFIERS:
+                return None
+            if rule.subclassifier is not None:
+                subclassify = SUBCLASSIFIERS[rule.subclassifier]
+                return rule.doc_type, subclassify(file_path, file_extension, content, file_name, rules, xml_fields, data)
+            return rule.doc_type, rule.doc_subtype
+        if not rule.is_ruled_out(file_extension, 0, content, name):
+            # Uma regra de maior prioridade ainda pode ser atendida pelo restante do texto
+            return None
 
-        # Verificações textuais
-        entrada_patterns = [
-            r'\bentrada\b',
-            r'tipo\s*de\s*opera[çc][ãa]o\s*:\s*entrada',
-            r'1\s*-\s*entrada'
-        ]
-        saida_patterns = [
-            r'\bsa[íi]da\b',
-            r'tipo\s*de\s*opera[çc][ãa]o\s*:\s*sa[íi]da',
-            r'0\s*-\s*sa[íi]da'
-        ]
-
-        for pattern in entrada_patterns:
-            if re.search(pattern, content_lower):
-                logger.info(f"[NF] Conteúdo indica ENTRADA")
-                return "NOTA FISCAL", "ENTRADA"
-
-        for pattern in saida_patterns:
-            if re.search(pattern, content_lower):
-                logger.info(f"[NF] Conteúdo indica SAIDA")
-                return "NOTA FISCAL", "SAIDA"
-
-        logger.info(f"[NF] Nenhum padrão de entrada/saída detectado -> classificado como SERVIÇO")
-        return "NOTA FISCAL", "SERVIÇO"
-
-    # F. Classificação de "DACTE"
-    dacte_keywords = ["dacte", "cte", "ct-e", "ct_e"]
-    if any(kw in name_lower for kw in dacte_keywords) or any(kw in content_lower for kw in dacte_keywords):
-        logger.info(f"[DACTE] Arquivo identificado como DACTE: {file_name}")
-
-        if file_extension == '.xml':
-            try:
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-                client_cnpj = extract_cnpj_from_path(file_path)
-                for elem in root.iter():
-                    if elem.tag.lower().endswith("emit"):
-                        for sub in elem.iter():
-                            if sub.tag.lower().endswith("cnpj"):
-                                cnpj_emissor = sub.text.strip().replace(".", "").replace("/", "").replace("-", "")
-                                if cnpj_emissor == client_cnpj:
-                                    logger.info(f"[DACTE] Classificado como SAIDA (CNPJ emissor igual ao cliente): {file_name}")
-                                    return "DACTE", "SAIDA"
-                                else:
-                                    logger.info(f"[DACTE] Classificado como ENTRADA (CNPJ emissor diferente): {file_name}")
-                                    return "DACTE", "ENTRADA"
-            except Exception as e:
-                logger.warning(f"[DACTE] Erro ao processar XML: {e}")
-
-        # Caso não consiga acessar XML ou não seja XML, assume ENTRADA como padrão seguro
-        logger.info(f"[DACTE] Classificação padrão como ENTRADA (fallback): {file_name}")
-        return "DACTE", "ENTRADA"
-
-    # G. Classificação de "FATURA"
-    fatura_keywords = ["fatura", "recibo", "energia", "light", "vivo", "claro", "tim", "água", "agua"]
-    if (any(keyword in content_lower for keyword in fatura_keywords) or 
-        any(keyword in name_lower for keyword in fatura_keywords)):
-        # Verificar se não é "faturamento"
-        if not any(word in content_lower for word in ["faturamento", "mento"]) and not any(word in name_lower for word in ["faturamento", "mento"]):
-            return "FATURA", None
-    
-    # H. Classificação de "FATURAMENTO"
-    faturamento_keywords = ["faturamento", "faturamento_"]
-    if any(keyword in name_lower for keyword in faturamento_keywords):
-        return "FATURAMENTO", None
-    
-    # I. Classificação de "INFORME DE RENDIMENTOS"
-    informe_keywords = ["dirf_", "informe de rendimento", "informe de rendimentos", "informe_rendimentos", "informe rendimentos"]
-    if (any(keyword in content_lower for keyword in informe_keywords) or 
-        any(keyword in name_lower for keyword in informe_keywords)):
-        if "extrato" not in content_lower:
-            return "INFORME DE RENDIMENTOS", None
-    
-    # J. Classificação de "RELATÓRIOS"
-    relatorio_keywords = ["relatorio", "relatório", "relatórios"]
-    if (any(keyword in content_lower for keyword in relatorio_keywords) or 
-        any(keyword in name_lower for keyword in relatorio_keywords)):
-        if "extrato" not in content_lower:
-            return "RELATORIOS", None
-    
-    # K. Classificação de "COMPROVANTES"
-    comprovante_keywords = ["comprovante", "comprovantes"]
-    if (any(keyword in content_lower for keyword in comprovante_keywords) or 
-        any(keyword in name_lower for keyword in comprovante_keywords)):
-        if "extrato" not in content_lower:
-            return "COMPROVANTES", None
-    
-    # L. Classificação de "SPEDS"
-    sped_keywords = ["sped"]
-    if (any(keyword in content_lower for keyword in sped_keywords) or 
-        any(keyword in name_lower for keyword in sped_keywords)):
-        return "SPEDs", None
-    
-    # Se chegou até aqui, não foi possível classificar
-    return "REVISÃO MANUAL", None
+    # Sem regra atendida, o tipo padrão só vale com o texto completo
+    return None
+
+# Regras em uso neste processo (carregadas na importação)
+_rules = load_rules()
 
 # Função para extrair CNPJ do caminho do arquivo
 def extract_cnpj_from_path(file_path):
@@ -361,29 +2038,12 @@ def create_folder_structure(client_path):
         month_path = os.path.join(year_path, f"[{month_folder}]")
         os.makedirs(month_path, exist_ok=True)
         
-        # Criar pastas para cada tipo de documento
-        document_types = [
-            "EXTRATO", "BOLETO", "NOTA FISCAL", "DACTE", "FATURA", 
-            "FATURAMENTO", "INFORME DE RENDIMENTOS", "RELATORIOS", 
-            "COMPROVANTES", "SPEDs", "REVISÃO MANUAL"
-        ]
-        
-        for doc_type in document_types:
+        # Criar pastas para cada tipo de documento e suas subpastas específicas
+        for doc_type, subtypes in get_rules().folder_structure.items():
             type_path = os.path.join(month_path, f"[{doc_type}]")
             os.makedirs(type_path, exist_ok=True)
-            
-            # Criar subpastas específicas
-            if doc_type == "EXTRATO":
-                os.makedirs(os.path.join(type_path, "[CONTA CORRENTE]"), exist_ok=True)
-                os.makedirs(os.path.join(type_path, "[APLICAÇÃO FINANCEIRA]"), exist_ok=True)
-            elif doc_type == "NOTA FISCAL":
-                os.makedirs(os.path.join(type_path, "[ENTRADA]"), exist_ok=True)
-                os.makedirs(os.path.join(type_path, "[SAIDA]"), exist_ok=True)
-                os.makedirs(os.path.join(type_path, "[SERVIÇO]"), exist_ok=True)
-                os.makedirs(os.path.join(type_path, "[NOTA DE DEBITO]"), exist_ok=True)
-            elif doc_type == "DACTE":
-                os.makedirs(os.path.join(type_path, "[ENTRADA]"), exist_ok=True)
-                os.makedirs(os.path.join(type_path, "[SAIDA]"), exist_ok=True)
+            for subtype in subtypes:
+                os.makedirs(os.path.join(type_path, f"[{subtype}]"), exist_ok=True)
         
         logger.info(f"Estrutura de pastas criada para: {client_path}")
         return year_path, month_path
@@ -391,68 +2051,256 @@ def create_folder_structure(client_path):
         logger.error(f"Erro ao criar estrutura de pastas: {e}")
         return None, None
 
-# Função para mover arquivo para a pasta correta
-def move_file_to_destination(file_path, client_path, doc_type, doc_subtype, file_date=None):
-    """Move o arquivo para a pasta de destino correta."""
-    try:
-        # Determinar ano e mês com base na data do arquivo
-        if file_date:
-            year_folder = str(file_date.year)
-            month_folder = file_date.strftime("%m - %B")
-        else:
-            # Usar data de modificação do arquivo
-            file_mod_time = os.path.getmtime(file_path)
-            file_date = datetime.datetime.fromtimestamp(file_mod_time)
-            year_folder = str(file_date.year)
-            month_folder = file_date.strftime("%m - %B")
-        
-        # Verificar se o ano é 2025 ou posterior
-        if int(year_folder) < 2025:
-            year_folder = "2025"  # Forçar para 2025 conforme requisito
-        
-        # Criar caminhos das pastas
-        year_path = os.path.join(client_path, f"[{year_folder}]")
-        month_path = os.path.join(year_path, f"[{month_folder}]")
-        type_path = os.path.join(month_path, f"[{doc_type}]")
-        
-        # Garantir que as pastas existam
-        os.makedirs(year_path, exist_ok=True)
-        os.makedirs(month_path, exist_ok=True)
-        os.makedirs(type_path, exist_ok=True)
-        
-        # Determinar caminho final com base no subtipo
-        if doc_subtype and doc_type in ["EXTRATO", "NOTA FISCAL", "DACTE"]:
-            final_path = os.path.join(type_path, f"[{doc_subtype}]")
-            os.makedirs(final_path, exist_ok=True)
-        else:
-            final_path = type_path
-        
-        # Mover o arquivo
-        file_name = os.path.basename(file_path)
-        destination = os.path.join(final_path, file_name)
-        
-        # Verificar se o arquivo já existe no destino
-        if os.path.exists(destination):
+# Função para mover arquivo para a pasta correta
+def destination_folder(client_path, doc_type, doc_subtype, file_date):
+    """Calcula a pasta de destino de um documento (sem acessar o disco)."""
+    if FINAL_LAYOUT:
+        return final_destination_folder(client_path, doc_type, doc_subtype)
+
+    # Determinar ano e mês com base na data do documento
+    year_folder = str(file_date.year)
+    month_folder = file_date.strftime("%m - %B")
+
+    # Verificar se o ano é 2025 ou posterior
+    if int(year_folder) < 2025:
+        year_folder = "2025"  # Forçar para 2025 conforme requisito
+
+    # Criar caminhos das pastas
+    year_path = os.path.join(client_path, f"[{year_folder}]")
+    month_path = os.path.join(year_path, f"[{month_folder}]")
+    type_path = os.path.join(month_path, f"[{doc_type}]")
+
+    # Determinar caminho final com base no subtipo
+    if doc_subtype and get_rules().folder_structure.get(doc_type):
+        return os.path.join(type_path, f"[{doc_subtype}]")
+    return type_path
+
+def final_destination_folder(client_path, doc_type, doc_subtype):
+    """Pasta de destino no layout final (FINAL_LAYOUT): [2025]/[FISCAL|CONTABIL]/[TIPO]/[SUBTIPO] ou [2025]/[TIPO]."""
+    rules = get_rules()
+    type_folder = f"[{doc_type}]"
+    year_path = os.path.join(client_path, FINAL_YEAR_FOLDER)
+    if type_folder in rules.folders_to_fiscal:
+        type_path = os.path.join(year_path, FINAL_FISCAL_FOLDER, type_folder)
+    elif type_folder in rules.folders_to_contabil:
+        type_path = os.path.join(year_path, FINAL_CONTABIL_FOLDER, type_folder)
+    else:
+        # REVISÃO MANUAL (e tipos fora das duas listas) ficam direto em [2025]
+        type_path = os.path.join(year_path, type_folder)
+
+    if doc_subtype and rules.folder_structure.get(doc_type):
+        return os.path.join(type_path, f"[{doc_subtype}]")
+    return type_path
+
+class MovePlan:
+    """Plano de movimentação (origem -> destino) executado em lote.
+
+    As pastas de destino distintas são criadas uma única vez e as colisões de nome são
+    resolvidas em memória a partir de uma listagem por pasta, em vez de makedirs/exists por arquivo.
+    """
+
+    def __init__(self, client_path, group=None):
+        self.client_path = client_path
+        # Grupo do plano no diário de operações (diretório processado ou arquivo compactado)
+        self.group = group or client_path
+        # (origem, stat ou ArchiveMember, resultado da classificação, pasta de destino)
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, file_path, file_stat, result):
+        """Inclui um arquivo no plano; file_stat pode ser um ArchiveMember (gravado direto no destino)."""
+        # Sem data identificada no documento, vale a data de modificação do arquivo
+        file_date = result.get('file_date') or datetime.datetime.fromtimestamp(file_stat.st_mtime)
+        folder = destination_folder(self.client_path, result['doc_type'], result['doc_subtype'], file_date)
+        self.entries.append((file_path, file_stat, result, folder))
+
+    def _resolve_destinations(self):
+        """Define o caminho final de cada arquivo, renomeando em memória os que colidem."""
+        suffix = int(time.time())
+        taken = {}
+        destinations = []
+        for file_path, _, _, folder in self.entries:
+            names = taken.get(folder)
+            if names is None:
+                try:
+                    names = {os.path.normcase(name) for name in os.listdir(folder)}
+                except OSError:
+                    names = set()
+                taken[folder] = names
+            file_name = os.path.basename(file_path)
             base_name, ext = os.path.splitext(file_name)
-            destination = os.path.join(final_path, f"{base_name}_{int(time.time())}{ext}")
-        
-        shutil.move(file_path, destination)
-        logger.info(f"Arquivo movido: {file_path} -> {destination}")
-        return True
-    except Exception as e:
-        logger.error(f"Erro ao mover arquivo {file_path}: {e}")
-        return False
+            candidate = file_name
+            counter = 1
+            while os.path.normcase(candidate) in names:
+                candidate = f"{base_name}_{suffix}{ext}" if counter == 1 else f"{base_name}_{suffix}_{counter}{ext}"
+                counter += 1
+            names.add(os.path.normcase(candidate))
+            destinations.append(os.path.join(folder, candidate))
+        return destinations
+
+    def execute(self, dry_run=False, partial=False):
+        """Executa (ou apenas simula) as movimentações e retorna as linhas do relatório.
+
+        O plano inteiro é gravado no diário de operações antes da primeira movimentação;
+        partial indica um lote intermediário do plano do grupo (ver OperationJournal.plan_batch).
+        """
+        destinations = self._resolve_destinations()
+        journal = get_journal() if not dry_run else None
+        op_ids = [None] * len(self.entries)
+        if journal is not None:
+            op_ids = journal.plan_batch(self.group, [
+                {'op': "extract" if isinstance(file_stat, ArchiveMember) else "move", 'origem': file_path,
+                 'destino': destination, 'tipo': result['doc_type'], 'subtipo': result['doc_subtype'],
+                 'hash': result['content_hash']}
+                for (file_path, file_stat, result, _), destination in zip(self.entries, destinations)
+            ], partial=partial)
+        failed_folders = set()
+        if not dry_run:
+            for folder in sorted({entry[3] for entry in self.entries}):
+                try:
+                    os.makedirs(folder, exist_ok=True)
+                except OSError as e:
+                    logger.error(f"Erro ao criar pasta {folder}: {e}")
+                    failed_folders.add(folder)
+
+        manifest = get_manifest()
+        report = []
+        for (file_path, file_stat, result, folder), destination, op_id in zip(self.entries, destinations, op_ids):
+            if dry_run:
+                status = "planejado"
+                logger.info(f"[DRY RUN] Arquivo seria movido: {file_path} -> {destination}")
+            elif folder in failed_folders:
+                status = "erro"
+                if journal is not None:
+                    journal.failed(op_id, f"Pasta de destino não criada: {folder}")
+            else:
+                try:
+                    if isinstance(file_stat, ArchiveMember):
+                        # Membros de arquivos compactados só são gravados em disco aqui, já no destino
+                        with open(destination, 'xb') as file:
+                            file.write(file_stat.data)
+                        file_stat.data = None
+                    else:
+                        shutil.move(file_path, destination)
+                    status = "movido"
+                    logger.info(f"Arquivo movido: {file_path} -> {destination}")
+                except Exception as e:
+                    status = "erro"
+                    logger.error(f"Erro ao mover arquivo {file_path}: {e}")
+                    if journal is not None:
+                        journal.failed(op_id, e)
+                if status == "movido" and manifest is not None:
+                    manifest.record(file_path, file_stat, result['content_hash'], result['doc_type'],
+                                    result['doc_subtype'], destination)
+                if status == "movido" and journal is not None:
+                    journal.done(op_id)
+            file_date = result.get('file_date')
+            report.append({
+                'origem': file_path,
+                'destino': destination,
+                'tipo': result['doc_type'],
+                'subtipo': result['doc_subtype'] or "",
+                'data_documento': file_date.strftime("%d/%m/%Y") if file_date else "",
+                'status': status,
+            })
+        self.entries = []
+        return report
+
+def export_move_plan(report, report_path):
+    """Grava o plano de movimentação em CSV (separador ';', como o Excel em português espera)."""
+    fields = ['origem', 'destino', 'tipo', 'subtipo', 'data_documento', 'status']
+    try:
+        with open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, delimiter=';')
+            writer.writeheader()
+            writer.writerows(report)
+        logger.info(f"Plano de movimentação exportado: {report_path} ({len(report)} arquivos)")
+    except OSError as e:
+        logger.error(f"Erro ao exportar plano de movimentação {report_path}: {e}")
+
+# Funções executadas nos processos de trabalho
+def _worker_settings(workers=1):
+    """Configurações do coordenador que precisam ser replicadas nos processos de trabalho."""
+    return {
+        'EXTRACTION_CACHE_ENABLED': EXTRACTION_CACHE_ENABLED,
+        'LAZY_EXTRACTION': LAZY_EXTRACTION,
+        # Um motor de OCR por núcleo no total, dividido entre os processos
+        'OCR_ENGINES': OCR_ENGINES or max(1, (os.cpu_count() or 1) // workers),
+        'OCR_PREPROCESS': OCR_PREPROCESS,
+        'OCR_TARGET_DPI': OCR_TARGET_DPI,
+        'PDF_BACKEND': PDF_BACKEND,
+    }
+
+def _init_worker(log_queue, settings):
+    """Inicializa um processo de trabalho, encaminhando os logs ao coordenador."""
+    globals().update(settings)
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        # Fecha o arquivo de log herdado/reaberto no import (spawn no Windows): só o coordenador grava nele
+        handler.close()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
+
+def _extract_and_classify(file_path, file_name, rules_signature=None, data=None, content_hash=None):
+    """Extrai o texto e classifica o documento (executado em um processo de trabalho).
+
+    Com data, classifica um membro de arquivo compactado em memória (file_path é o caminho virtual).
+    content_hash evita recalcular o hash já obtido pelo coordenador (modo incremental).
+    """
+    # O coordenador informa a versão das regras em uso; recarregar se este processo estiver desatualizado
+    if rules_signature is not None and rules_signature != get_rules().signature:
+        reload_rules_if_changed()
+    try:
+        if content_hash is None:
+            content_hash = hashlib.sha256(data).hexdigest() if data is not None else compute_file_hash(file_path)
+    except OSError as e:
+        logger.warning(f"Não foi possível calcular o hash de {file_path}: {e}")
+        content_hash = None
+    if LAZY_EXTRACTION:
+        doc_type, doc_subtype, file_content, metadata = classify_lazily(file_path, file_name, content_hash, data)
+    else:
+        file_content, metadata = extract_content_cached(file_path, content_hash, data)
+        doc_type, doc_subtype = classify_document(file_path, file_content, file_name, metadata.get('xml'), data)
+    # Data do documento (emissão, competência, período); sem ela, vale a data de modificação do arquivo
+    file_date = document_date(file_content, metadata)
+    return {'doc_type': doc_type, 'doc_subtype': doc_subtype, 'content_hash': content_hash, 'file_date': file_date}
 
 # Função principal para processar todos os clientes
-def process_all_clients():
+def process_all_clients(workers=NUM_WORKERS):
     """Processa todos os clientes no diretório base."""
+    executor = None
+    log_listener = None
+    # Linhas do plano de movimentação de todos os diretórios processados
+    report = []
+    journal = get_journal() if not MOVE_DRY_RUN else None
+    if journal is not None:
+        if journal.stage_finished("classificacao"):
+            logger.info("Classificação já concluída na execução retomada do diário de operações")
+            return
+        journal.begin("classificacao")
     try:
+        # Com mais de um processo, extração/OCR e classificação rodam em paralelo
+        # e este processo (coordenador) fica responsável apenas pelas movimentações
+        if workers and workers > 1:
+            log_queue = multiprocessing.Queue()
+            log_listener = logging.handlers.QueueListener(log_queue, *logger.handlers)
+            log_listener.start()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(log_queue, _worker_settings(workers)))
+            logger.info(f"Processamento paralelo ativado com {workers} processos")
+
         # Listar todas as pastas de clientes
         client_folders = [f for f in os.listdir(BASE_PATH) if os.path.isdir(os.path.join(BASE_PATH, f))]
         
         for client_folder in client_folders:
             client_path = os.path.join(BASE_PATH, client_folder)
             logger.info(f"Processando cliente: {client_folder}")
+
+            # Regras alteradas durante a execução passam a valer a partir deste grupo de clientes
+            reload_rules_if_changed()
             
             # Verificar se existem pastas de CNPJ
             cnpj_folders = [f for f in os.listdir(client_path) if os.path.isdir(os.path.join(client_path, f)) and re.search(r'\d{14}', f.replace('.', '').replace('/', '').replace('-', ''))]
@@ -460,77 +2308,340 @@ def process_all_clients():
             # Se não houver pastas de CNPJ, criar estrutura na raiz
             if not cnpj_folders:
                 logger.info(f"Nenhuma pasta de CNPJ encontrada para {client_folder}. Criando estrutura na raiz.")
-                year_path, month_path = create_folder_structure(client_path)
-                process_directory(client_path, client_path)
+                if not MOVE_DRY_RUN and not FINAL_LAYOUT:
+                    year_path, month_path = create_folder_structure(client_path)
+                process_directory(client_path, client_path, executor, report)
             else:
                 # Processar cada pasta de CNPJ
                 for cnpj_folder in cnpj_folders:
                     cnpj_path = os.path.join(client_path, cnpj_folder)
                     logger.info(f"Processando CNPJ: {cnpj_folder}")
                     
-                    # Criar estrutura de pastas
-                    year_path, month_path = create_folder_structure(cnpj_path)
+                    # Criar estrutura de pastas (no layout final, o plano cria apenas as pastas de destino usadas)
+                    if not MOVE_DRY_RUN and not FINAL_LAYOUT:
+                        year_path, month_path = create_folder_structure(cnpj_path)
                     
                     # Processar arquivos na pasta do CNPJ
-                    process_directory(cnpj_path, cnpj_path)
+                    process_directory(cnpj_path, cnpj_path, executor, report)
         
         logger.info("Processamento concluído para todos os clientes.")
+        if journal is not None:
+            journal.end("classificacao")
+        if _ocr_service is not None and _ocr_service_pid == os.getpid():
+            _ocr_service.log_metrics()
     except Exception as e:
         logger.error(f"Erro ao processar clientes: {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if log_listener is not None:
+            log_listener.stop()
+        report_path = MOVE_PLAN_REPORT_PATH or (DEFAULT_MOVE_PLAN_REPORT_PATH if MOVE_DRY_RUN else None)
+        if report_path:
+            export_move_plan(report, report_path)
 
 # Função para processar um diretório
-def process_directory(directory, client_path):
-    """Processa todos os arquivos em um diretório e suas subpastas."""
+def process_directory(directory, client_path, executor=None, report=None):
+    """Processa todos os arquivos em um diretório e suas subpastas.
+
+    As movimentações são acumuladas em um plano e executadas em lote ao final;
+    as linhas do plano são acrescentadas a report, quando informado. Na retomada pelo diário de
+    operações, um diretório concluído é ignorado e um plano já gravado é terminado sem nova varredura.
+    """
+    journal = get_journal() if not MOVE_DRY_RUN else None
+    if journal is not None:
+        if journal.is_group_done(directory):
+            logger.info(f"Diretório já concluído na execução retomada: {directory}")
+            return
+        ops = journal.pending_plan(directory)
+        if ops is not None:
+            logger.info(f"Retomando {len(ops)} movimentação(ões) pendente(s) do diário em {directory}")
+            replay_operations(journal, ops)
+            journal.group_done(directory)
+            return
+
+    # Arquivos enviados aos processos de trabalho: future -> (caminho do arquivo, stat)
+    pending = {}
+    plan = MovePlan(client_path, group=directory)
+    walked = False
+    manifest = get_manifest() if INCREMENTAL else None
+    unchanged = 0
+    type_markers = get_rules().type_markers
+    # Layout final: pastas de origem percorridas, removidas ao final se ficarem vazias (em vez da limpeza posterior)
+    final_year_norm = os.path.normcase(os.path.join(client_path, FINAL_YEAR_FOLDER))
+    source_folders = []
     try:
         for root, dirs, files in os.walk(directory):
             # Verificar se estamos em uma pasta de destino (criada pelo script)
-            if any(marker in root for marker in ["[EXTRATO]", "[BOLETO]", "[NOTA FISCAL]", "[DACTE]", 
-                                               "[FATURA]", "[FATURAMENTO]", "[INFORME DE RENDIMENTOS]", 
-                                               "[RELATORIOS]", "[COMPROVANTES]", "[SPEDs]", "[REVISÃO MANUAL]"]):
+            if any(marker in root for marker in type_markers):
+                dirs.clear()
                 continue
+            # Pastas de destino não são listadas (poda no próprio os.walk)
+            dirs[:] = [d for d in dirs if not any(marker in d for marker in type_markers)]
+            root_norm = os.path.normcase(root)
+            if FINAL_LAYOUT and root != directory and root_norm != final_year_norm and not root_norm.startswith(final_year_norm + os.sep):
+                source_folders.append(root)
             
             for file in files:
                 file_path = os.path.join(root, file)
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError as e:
+                    logger.warning(f"Não foi possível acessar {file_path}: {e}")
+                    continue
+
+                # Modo incremental: arquivo inalterado desde o registro no manifesto tem o hash conhecido sem leitura;
+                # os demais têm o hash calculado pelo processo de trabalho, na mesma leitura da extração
+                content_hash = manifest.find_hash(file_path, file_stat) if manifest is not None else None
+                if content_hash is not None:
+                    unchanged += 1
                 
                 # Verificar se é um arquivo compactado
-                if file.lower().endswith(('.zip', '.rar')):
-                    # Criar pasta temporária para extração
-                    extract_dir = os.path.join(root, f"temp_extract_{int(time.time())}")
-                    os.makedirs(extract_dir, exist_ok=True)
-                    
-                    # Extrair arquivos
-                    if extract_compressed_files(file_path, extract_dir):
-                        # Processar arquivos extraídos
-                        process_directory(extract_dir, client_path)
-                        
-                        # Remover pasta temporária após processamento
-                        try:
-                            shutil.rmtree(extract_dir)
-                        except:
-                            logger.warning(f"Não foi possível remover pasta temporária: {extract_dir}")
+                if file.lower().endswith(ARCHIVE_EXTENSIONS):
+                    # Classificar os membros em memória, gravando cada um apenas no destino
+                    process_archive(file_path, file_stat, client_path, executor, report)
                     
                     # Mover o arquivo compactado para REVISÃO MANUAL
-                    move_file_to_destination(file_path, client_path, "REVISÃO MANUAL", None)
+                    plan.add(file_path, file_stat, {'doc_type': "REVISÃO MANUAL", 'doc_subtype': None, 'content_hash': None})
+                elif executor is not None:
+                    # Extração e classificação ficam a cargo dos processos de trabalho
+                    pending[executor.submit(_extract_and_classify, file_path, file, get_rules().signature,
+                                            content_hash=content_hash)] = (file_path, file_stat)
                 else:
-                    # Extrair conteúdo do arquivo
-                    file_content = extract_text(file_path)
-                    
-                    # Classificar documento
-                    doc_type, doc_subtype = classify_document(file_path, file_content, file)
+                    # Extrair conteúdo do arquivo e classificar documento
+                    result = _extract_and_classify(file_path, file, content_hash=content_hash)
                     
-                    # Mover para pasta correta
-                    move_file_to_destination(file_path, client_path, doc_type, doc_subtype)
+                    # Incluir no plano de movimentação
+                    plan.add(file_path, file_stat, result)
+        walked = True
     except Exception as e:
         logger.error(f"Erro ao processar diretório {directory}: {e}")
+    finally:
+        # As movimentações são planejadas e executadas apenas pelo coordenador
+        for future in as_completed(pending):
+            file_path, file_stat = pending[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Erro ao classificar arquivo {file_path}: {e}")
+                continue
+            plan.add(file_path, file_stat, result)
+
+        if len(plan):
+            rows = plan.execute(dry_run=MOVE_DRY_RUN)
+            if report is not None:
+                report.extend(rows)
+
+        if not MOVE_DRY_RUN:
+            remove_empty_folders(source_folders)
+        if journal is not None and walked:
+            journal.group_done(directory)
+
+        manifest = get_manifest()
+        if manifest is not None:
+            manifest.flush()
+        if unchanged:
+            logger.info(f"{unchanged} arquivos inalterados desde o registro no manifesto, sem leitura para o hash (modo incremental) em {directory}")
+
+def remove_empty_folders(folders):
+    """Remove as pastas que ficaram vazias, das mais profundas para as mais rasas (pastas com conteúdo são mantidas)."""
+    for folder in reversed(folders):
+        try:
+            os.rmdir(folder)
+            logger.info(f"Pasta de origem vazia removida: {folder}")
+        except OSError:
+            pass
+
+def _is_client_copy(destination, client_path):
+    """Indica se o destino registrado no manifesto ainda existe na pasta do cliente."""
+    client_norm = os.path.normcase(os.path.abspath(client_path))
+    destination_norm = os.path.normcase(os.path.abspath(destination))
+    return destination_norm.startswith(client_norm + os.sep) and os.path.lexists(destination)
+
+# Função para processar os membros de um arquivo compactado
+def process_archive(archive_path, archive_stat, client_path, executor=None, report=None):
+    """Classifica os membros de um ZIP/RAR lidos em memória e grava cada um diretamente no destino.
+
+    O plano é executado em lotes de até ARCHIVE_BATCH_MB de conteúdo, o que limita a memória usada pelo
+    coordenador e pelos processos de trabalho. No modo incremental, um membro cujo conteúdo já foi
+    gravado para o mesmo cliente (mesmo hash no manifesto, cópia ainda no destino) não é gravado de novo.
+    """
+    journal = get_journal() if not MOVE_DRY_RUN else None
+    # Membros de lotes já gravados em uma execução interrompida (retomada)
+    skip = set()
+    if journal is not None:
+        # Retomada: membros já gravados não são gravados de novo; um plano gravado é terminado sem reclassificar
+        if journal.is_group_done(archive_path):
+            return
+        ops = journal.pending_plan(archive_path)
+        if ops is not None:
+            replay_operations(journal, ops)
+            journal.group_done(archive_path)
+            return
+        ops = journal.partial_plan(archive_path)
+        if ops is not None:
+            # Leitura interrompida: os lotes gravados são terminados e o restante do arquivo é classificado
+            replay_operations(journal, journal.unfinished(ops))
+            skip = {op['origem'] for op in ops}
+
+    plan = MovePlan(client_path, group=archive_path)
+    manifest = get_manifest() if INCREMENTAL else None
+    batch_limit = ARCHIVE_BATCH_MB * 1024 * 1024
+    pending = {}
+    pending_bytes = 0
+    known = 0
+
+    def flush(partial):
+        # Os membros enviados aos processos de trabalho entram no plano antes de executá-lo
+        for future in as_completed(pending):
+            member = pending[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Erro ao classificar arquivo {member.path}: {e}")
+                continue
+            plan.add(member.path, member, result)
+        pending.clear()
+        if len(plan):
+            rows = plan.execute(dry_run=MOVE_DRY_RUN, partial=partial)
+            if report is not None:
+                report.extend(rows)
+
+    read = False
+    try:
+        for member in iter_archive_members(archive_path, archive_path, archive_stat.st_mtime):
+            if member.path in skip:
+                continue
+            if pending_bytes >= batch_limit:
+                flush(partial=True)
+                pending_bytes = 0
+            pending_bytes += member.st_size
+            if member.path.lower().endswith(ARCHIVE_EXTENSIONS):
+                # Arquivos compactados aninhados: conteúdo já gerado pelo iterador, o próprio arquivo vai para revisão
+                plan.add(member.path, member, {'doc_type': "REVISÃO MANUAL", 'doc_subtype': None, 'content_hash': None})
+                continue
+
+            # Modo incremental: conteúdo já gravado para este cliente (cópia ainda no destino) não é gravado de novo
+            content_hash = None
+            if manifest is not None:
+                content_hash = hashlib.sha256(member.data).hexdigest()
+                row = manifest.find_by_hash(content_hash)
+                if row is not None and _is_client_copy(row[2], client_path):
+                    logger.info(f"Membro com conteúdo já gravado em {row[2]}, ignorado: {member.path}")
+                    member.data = None
+                    known += 1
+                    continue
+
+            if executor is not None:
+                future = executor.submit(_extract_and_classify, member.path, member.name, get_rules().signature,
+                                         member.data, content_hash)
+                pending[future] = member
+            else:
+                plan.add(member.path, member, _extract_and_classify(member.path, member.name, data=member.data,
+                                                                    content_hash=content_hash))
+        read = True
+    except Exception as e:
+        logger.error(f"Erro ao processar arquivo compactado {archive_path}: {e}")
+    finally:
+        # Sem a leitura completa, o último lote também é parcial: a retomada lê o restante do arquivo
+        flush(partial=not read)
+        if journal is not None and read:
+            journal.group_done(archive_path)
+        if known:
+            logger.info(f"{known} membros com conteúdo já gravado para o cliente não foram gravados de novo (modo incremental) em {archive_path}")
+
+# Função para localizar no manifesto o destino de um arquivo já processado
+def find_processed_file(file_ref):
+    """Exibe para onde um arquivo (caminho, nome ou hash) foi movido."""
+    manifest = get_manifest()
+    if manifest is None:
+        print("Manifesto indisponível.")
+        return
+    rows = manifest.find(file_ref)
+    if not rows:
+        print(f"Nenhum registro encontrado para: {file_ref}")
+        return
+    for origem, doc_type, doc_subtype, destino, processado_em in rows:
+        data = datetime.datetime.fromtimestamp(processado_em).strftime("%d/%m/%Y %H:%M:%S")
+        tipo = f"{doc_type}/{doc_subtype}" if doc_subtype else doc_type
+        print(f"{origem} -> {destino} [{tipo}] em {data}")
 
 
 # Executar o processamento
 if __name__ == "__main__":
-    logger.info("Iniciando processamento de documentos")
-    process_all_clients()
-    logger.info("Processamento concluído")
+    parser = argparse.ArgumentParser(description="Classificação e organização de documentos contábeis/fiscais")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Número de processos para extração/OCR e classificação (padrão: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Desativa o cache persistente de extração de texto")
+    parser.add_argument("--ocr-engines", type=int, default=OCR_ENGINES,
+                        help="Motores Tesseract por processo (padrão: núcleos divididos entre os processos)")
+    parser.add_argument("--ocr-dpi", type=int, default=OCR_TARGET_DPI,
+                        help="Resolução alvo das páginas antes do OCR (padrão: %(default)s; ver benchmark_extracao.py)")
+    parser.add_argument("--no-ocr-preprocess", action="store_true",
+                        help="Envia as imagens ao OCR sem pré-processamento")
+    parser.add_argument("--pdf-backend", choices=['auto', 'pypdfium2', 'pdfminer', 'pypdf2'], default=PDF_BACKEND,
+                        help="Biblioteca de leitura de PDF (padrão: %(default)s, pypdfium2 se instalado)")
+    parser.add_argument("--no-lazy", action="store_true",
+                        help="Extrai sempre o documento inteiro antes de classificar (desativa a extração progressiva)")
+    parser.add_argument("--full", action="store_true",
+                        help="Reprocessa todos os arquivos, ignorando o modo incremental do manifesto")
+    parser.add_argument("--dry-run", action="store_true",
+                        help=f"Apenas monta o plano de movimentação, sem mover arquivos nem criar pastas (relatório em {DEFAULT_MOVE_PLAN_REPORT_PATH})")
+    parser.add_argument("--plan-report", metavar="ARQUIVO",
+                        help="Exporta o plano de movimentação (origem -> destino) em CSV")
+    parser.add_argument("--where", metavar="ARQUIVO",
+                        help="Consulta no manifesto para onde um arquivo (caminho, nome ou hash) foi movido")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Retoma a última execução do diário de operações ({JOURNAL_PATH}), sem repetir o que foi concluído")
+    parser.add_argument("--undo", nargs="?", const="", metavar="EXECUCAO",
+                        help="Desfaz as movimentações de uma execução do diário de operações "
+                             "(padrão: a última ainda não desfeita)")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="Não grava o diário de operações")
+    parser.add_argument("--final-layout", action="store_true",
+                        help=f"Move cada arquivo direto para {FINAL_YEAR_FOLDER}/{FINAL_FISCAL_FOLDER}|{FINAL_CONTABIL_FOLDER}, "
+                             "sem as etapas seguintes de reorganização e limpeza")
+    args, _ = parser.parse_known_args()
+    if args.no_cache:
+        EXTRACTION_CACHE_ENABLED = False
+    if args.no_lazy:
+        LAZY_EXTRACTION = False
+    if args.ocr_engines:
+        OCR_ENGINES = args.ocr_engines
+    OCR_TARGET_DPI = args.ocr_dpi
+    PDF_BACKEND = args.pdf_backend
+    if args.no_ocr_preprocess:
+        OCR_PREPROCESS = False
+    if args.full:
+        INCREMENTAL = False
+    if args.dry_run:
+        MOVE_DRY_RUN = True
+    if args.plan_report:
+        MOVE_PLAN_REPORT_PATH = args.plan_report
+    if args.final_layout:
+        FINAL_LAYOUT = True
+    if args.resume:
+        JOURNAL_RESUME = True
+    if args.no_journal:
+        JOURNAL_ENABLED = False
+
+    if args.where:
+        # Apenas consulta: não executa as etapas seguintes do script
+        find_processed_file(args.where)
+        sys.exit(0)
+    elif args.undo is not None:
+        undo_last_run(args.undo or None)
+        sys.exit(0)
+    else:
+        logger.info("Iniciando processamento de documentos")
+        process_all_clients(workers=args.workers)
+        logger.info("Processamento concluído")
 
-print("Programa de classificação e organização de documentos concluído!")
+        print("Programa de classificação e organização de documentos concluído!")
+        if FINAL_LAYOUT:
+            # Arquivos já no layout final: a reorganização e a limpeza seguintes não são necessárias
+            sys.exit(0)
 
 # --- Configuração ---
 # !!! ATENÇÃO: MUDE PARA False PARA EXECUTAR AS OPERAÇÕES REAIS !!!
@@ -544,102 +2655,471 @@ FISCAL_FOLDER_NAME = "[FISCAL]"
 CONTABIL_FOLDER_NAME = "[CONTABIL]"
 MANUAL_REVIEW_FOLDER_NAME = "[REVISÃO MANUAL]"
 
-FOLDERS_TO_CONTABIL = [
-    "[BOLETO]",
-    "[COMPROVANTES]",
-    "[EXTRATO]",
-    "[FATURAMENTO]",
-    "[INFORME DE RENDIMENTO]",
-]
-FOLDERS_TO_FISCAL = [
-    "[DACTE]",
-    "[FATURA]",
-    "[NOTA FISCAL]",
-    "[RELATORIOS]",
-    "[SPEDs]",
-]
+# Pastas de CNPJ reorganizadas em paralelo (threads). O trabalho é quase todo I/O de metadados
+# no compartilhamento de rede, dominado pela latência; 1 = sequencial, com a saída em tempo real
+REORG_WORKERS = 8
+
+# Arquivos apagados em paralelo pelo motor de deleção (threads compartilhadas por todas as limpezas).
+# Em compartilhamento de rede, cada unlink é uma ida e volta ao servidor
+DELETE_WORKERS = 16
+
+# As listas de pastas destinadas a [CONTABIL] e [FISCAL] ficam em regras_classificacao.json
+# ("pastas_contabil" e "pastas_fiscal")
 
 # --- Funções Auxiliares ---
+# Pool do motor de deleção (iniciado sob demanda)
+_delete_executor = None
+_delete_executor_lock = threading.Lock()
+
+def get_delete_executor():
+    """Retorna o pool de threads do motor de deleção, compartilhado por todas as limpezas."""
+    global _delete_executor
+    with _delete_executor_lock:
+        if _delete_executor is None:
+            _delete_executor = ThreadPoolExecutor(max_workers=DELETE_WORKERS, thread_name_prefix="delete")
+        return _delete_executor
+
+def make_writable(path):
+    """Remove a proteção de um item: atributo somente leitura no Windows, permissão de escrita do dono nos demais."""
+    mode = stat.S_IMODE(os.lstat(path).st_mode)
+    os.chmod(path, mode | (stat.S_IRWXU if os.path.isdir(path) else stat.S_IWRITE))
+
+def fix_permissions_and_retry(func, path, exc):
+    """Handler de erros do shutil.rmtree (onexc/onerror) e do motor de deleção.
+
+    Em erro de permissão, libera o item e a pasta pai e repete a remoção; itens que já não existem são ignorados.
+    """
+    if isinstance(exc, FileNotFoundError):
+        return
+    if not isinstance(exc, PermissionError) or func not in (os.unlink, os.remove, os.rmdir):
+        raise exc
+    make_writable(os.path.dirname(path))
+    if not os.path.islink(path):
+        make_writable(path)
+    func(path)
+
+def rmtree_writable(path):
+    """shutil.rmtree com a correção de permissões no próprio item que falhou."""
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(path, onexc=fix_permissions_and_retry)
+    else:
+        shutil.rmtree(path, onerror=lambda func, error_path, exc_info: fix_permissions_and_retry(func, error_path, exc_info[1]))
+
+def _scandir_writable(folder_path):
+    try:
+        with os.scandir(folder_path) as entries:
+            return list(entries)
+    except PermissionError:
+        make_writable(folder_path)
+        with os.scandir(folder_path) as entries:
+            return list(entries)
+
+def _unlink(file_path):
+    """Apaga um arquivo (em uma thread do pool); retorna a exceção em caso de erro."""
+    try:
+        try:
+            os.unlink(file_path)
+        except OSError as e:
+            fix_permissions_and_retry(os.unlink, file_path, e)
+    except Exception as e:
+        return e
+    return None
+
+def _remove_folder(folder):
+    """Remove uma pasta já esvaziada (em uma thread do pool); retorna a exceção em caso de erro.
+
+    Pastas que não puderam ser listadas (ou que receberam itens novos) são removidas pelo rmtree_writable.
+    """
+    folder_path, listed = folder
+    try:
+        if not listed:
+            rmtree_writable(folder_path)
+            return None
+        try:
+            os.rmdir(folder_path)
+        except PermissionError as e:
+            fix_permissions_and_retry(os.rmdir, folder_path, e)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            rmtree_writable(folder_path)
+    except Exception as e:
+        return e
+    return None
+
+def delete_tree(path, contents_only=False, keep=(), dry_run=None, op_id=None):
+    """Motor de deleção usado por todas as limpezas (pastas [FISCAL]/[CONTABIL], pastas rogue e o limpador).
+
+    Percorre a árvore uma única vez com os.scandir, de onde vêm também os tamanhos dos arquivos,
+    apaga os arquivos em paralelo (DELETE_WORKERS) e remove as pastas de baixo para cima, um nível
+    por vez. Erros de permissão são corrigidos no próprio item (fix_permissions_and_retry). Com
+    contents_only, apenas o conteúdo de path é apagado, exceto os nomes em keep. Com dry_run
+    (padrão: DRY_RUN), nada é apagado e a contagem é apenas simulada. Fora da simulação, a deleção
+    é gravada no diário de operações (op_id: operação já planejada, ex.: no plano de uma pasta de CNPJ).
+
+    Retorna um Counter com "files", "folders", "bytes" (espaço liberado) e "error".
+    """
+    if dry_run is None:
+        dry_run = DRY_RUN
+    journal = get_journal() if not dry_run else None
+    if journal is not None and op_id is None:
+        op_id = journal.plan(None, "delete", path, somente_conteudo=contents_only, manter=list(keep))
+    stats = _delete_tree(path, contents_only, keep, dry_run)
+    if journal is not None:
+        if stats["error"]:
+            journal.failed(op_id, f"{stats['error']} item(ns) não removido(s)")
+        else:
+            journal.done(op_id)
+    return stats
+
+def _delete_tree(path, contents_only, keep, dry_run):
+    stats = Counter()
+    keep = {os.path.normcase(name) for name in keep}
+    files = []    # (caminho, tamanho)
+    folders = {}  # profundidade -> [(caminho, listada)]
+
+    if not os.path.lexists(path):
+        return stats
+    if os.path.islink(path) or not os.path.isdir(path):
+        if not contents_only:
+            files.append((path, os.lstat(path).st_size))
+    else:
+        pending = [(path, 0)]
+        while pending:
+            folder_path, depth = pending.pop()
+            try:
+                entries = _scandir_writable(folder_path)
+                listed = True
+            except OSError as e:
+                if depth == 0 and contents_only:
+                    print(f"    ERRO ao listar {folder_path}: {e}")
+                    stats["error"] += 1
+                    return stats
+                entries = []
+                listed = False
+            if depth or not contents_only:
+                folders.setdefault(depth, []).append((folder_path, listed))
+            for entry in entries:
+                if depth == 0 and os.path.normcase(entry.name) in keep:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, depth + 1))
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    size = 0
+                files.append((entry.path, size))
+
+    if dry_run:
+        stats["files"] += len(files)
+        stats["bytes"] += sum(size for _, size in files)
+        stats["folders"] += sum(len(level) for level in folders.values())
+        return stats
+
+    executor = get_delete_executor()
+    # Pastas acima de um item que não pôde ser apagado não são removidas (o erro já foi contado)
+    blocked = set()
+
+    def block(failed_path):
+        parent = os.path.dirname(failed_path)
+        while parent not in blocked and parent != os.path.dirname(parent):
+            blocked.add(parent)
+            parent = os.path.dirname(parent)
+
+    for (file_path, size), error in zip(files, executor.map(_unlink, [file_path for file_path, _ in files])):
+        if error is None:
+            stats["files"] += 1
+            stats["bytes"] += size
+        else:
+            print(f"    ERRO ao deletar {file_path}: {error}")
+            stats["error"] += 1
+            block(file_path)
+
+    for depth in sorted(folders, reverse=True):
+        level = [folder for folder in folders[depth] if folder[0] not in blocked]
+        for (folder_path, _), error in zip(level, executor.map(_remove_folder, level)):
+            if error is None:
+                stats["folders"] += 1
+            else:
+                print(f"    ERRO ao deletar {folder_path}: {error}")
+                stats["error"] += 1
+                block(folder_path)
+    return stats
+
+def format_size(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+def describe_deletion(stats):
+    """Resumo de uma contagem do delete_tree para as mensagens."""
+    return f"{stats['files']} arquivo(s), {stats['folders']} pasta(s), {format_size(stats['bytes'])}"
+
 def clear_folder_contents(folder_path):
-    """Deleta todo o conteúdo de uma pasta (arquivos e subpastas)."""
+    """Deleta todo o conteúdo de uma pasta (arquivos e subpastas) com o motor de deleção.
+
+    Retorna a contagem do delete_tree ("files", "folders", "bytes", "error").
+    """
     if not os.path.exists(folder_path):
         print(f"    AVISO: Tentativa de limpar conteúdo de pasta inexistente: {folder_path}")
-        return
-    if not os.listdir(folder_path): # Verifica se a pasta já está vazia
-        #print(f"    INFO: Pasta já está vazia: {folder_path}") # Log opcional
-        return
+        return Counter()
 
-    for item_name in os.listdir(folder_path):
-        item_path = os.path.join(folder_path, item_name)
-        try:
-            if os.path.isfile(item_path) or os.path.islink(item_path):
-                if not DRY_RUN:
-                    os.unlink(item_path)
-                print(f"    {'[DRY RUN] ' if DRY_RUN else ''}Deletado arquivo: {item_path}")
-            elif os.path.isdir(item_path):
-                if not DRY_RUN:
-                    shutil.rmtree(item_path)
-                print(f"    {'[DRY RUN] ' if DRY_RUN else ''}Deletada pasta: {item_path}")
-        except Exception as e:
-            print(f"    ERRO ao deletar {item_path}: {e}")
+    stats = delete_tree(folder_path, contents_only=True) # DRY_RUN é verificado dentro
+    if stats["files"] or stats["folders"]:
+        print(f"    {'[DRY RUN] ' if DRY_RUN else ''}Deletado conteúdo de {folder_path}: {describe_deletion(stats)}")
+    return stats
 
-def safe_move_folder(src_path, dest_parent_path):
-    """Move uma pasta de origem para uma pasta de destino pai."""
-    if not os.path.exists(src_path):
+def normalize_path(path):
+    """Normaliza um caminho para comparações (absoluto e, no Windows, sem diferença de maiúsculas)."""
+    return os.path.normcase(os.path.abspath(path))
 
-        return
-    if not os.path.isdir(src_path):
+
+class FolderTreeIndex:
+    """Índice da árvore de uma pasta de CNPJ, montado por index_cnpj_folder em uma única passada com os.scandir.
+
+    Os caminhos são normalizados uma única vez, e as consultas do planejamento (pastas a deletar/mover)
+    e da execução (existência da origem e do destino) são feitas em dicionários/conjuntos, sem novas
+    chamadas ao sistema de arquivos. Movimentações e deleções executadas (ou simuladas no DRY_RUN)
+    atualizam o índice.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.dirs = {}          # caminho normalizado -> caminho, das pastas conhecidas
+        self.children = {}      # caminho normalizado -> nomes normalizados do conteúdo (pastas listadas)
+        self.delete_rogue = {}  # [FISCAL]/[CONTABIL] fora de [2025]: caminho normalizado -> caminho
+        self.move = {}          # caminho normalizado da origem -> (origem, pasta pai de destino)
+        self._normalized = {}
+
+    def norm(self, path):
+        """Caminho normalizado, calculado uma única vez por caminho."""
+        path_norm = self._normalized.get(path)
+        if path_norm is None:
+            path_norm = self._normalized[path] = normalize_path(path)
+        return path_norm
+
+    def add_dir(self, path, path_norm):
+        self._normalized[path] = path_norm
+        self.dirs[path_norm] = path
+
+    def is_dir(self, path):
+        return self.norm(path) in self.dirs
+
+    def exists(self, path):
+        """Existência de um caminho pelo conteúdo indexado da pasta pai (ou no disco, se ela não foi listada)."""
+        path_norm = self.norm(path)
+        if path_norm in self.dirs:
+            return True
+        names = self.children.get(os.path.dirname(path_norm))
+        if names is None:
+            return os.path.exists(path)
+        return os.path.basename(path_norm) in names
+
+    def record_delete(self, path):
+        path_norm = self.norm(path)
+        self.dirs.pop(path_norm, None)
+        self.children.get(os.path.dirname(path_norm), set()).discard(os.path.basename(path_norm))
+
+    def record_move(self, src_path, dest_parent_path):
+        self.record_delete(src_path)
+        folder_name = os.path.basename(src_path)
+        dest_parent_norm = self.norm(dest_parent_path)
+        dest_norm = os.path.join(dest_parent_norm, os.path.normcase(folder_name))
+        if dest_parent_norm in self.children:
+            self.children[dest_parent_norm].add(os.path.normcase(folder_name))
+        self.add_dir(os.path.join(dest_parent_path, folder_name), dest_norm)
+
+    def rogue_folders(self):
+        """Pastas rogue a deletar, das mais profundas para as mais rasas."""
+        return sorted(self.delete_rogue.values(), key=len, reverse=True)
+
+
+def safe_move_folder(src_path, dest_parent_path, index=None, op_id=None):
+    """Move uma pasta de origem para uma pasta de destino pai (com index, as verificações usam o FolderTreeIndex).
+
+    Fora do DRY_RUN, o resultado é gravado no diário de operações (op_id: operação já planejada).
+    Retorna o status: "moved", "skipped" ou "error".
+    """
+    journal = get_journal() if not DRY_RUN else None
+    if journal is not None and op_id is None:
+        op_id = journal.plan(None, "move", src_path, os.path.join(dest_parent_path, os.path.basename(src_path)))
+    status = _move_folder(src_path, dest_parent_path, index)
+    if journal is not None:
+        if status == "moved":
+            journal.done(op_id)
+        elif status == "skipped":
+            journal.skipped(op_id)
+        else:
+            journal.failed(op_id, f"Não foi possível mover {src_path} para {dest_parent_path}")
+    return status
+
+def _move_folder(src_path, dest_parent_path, index):
+    exists = index.exists if index is not None else os.path.exists
+    is_dir = index.is_dir if index is not None else os.path.isdir
+    norm = index.norm if index is not None else os.path.abspath
+
+    if not exists(src_path):
+
+        return "skipped"
+    if not is_dir(src_path):
         print(f"    AVISO: Item de origem não é uma pasta: {src_path}")
-        return
+        return "skipped"
 
     folder_name = os.path.basename(src_path)
     final_dest_path = os.path.join(dest_parent_path, folder_name)
 
     # Verificação para não mover uma pasta para dentro dela mesma ou para o mesmo local exato
-    if os.path.abspath(src_path) == os.path.abspath(final_dest_path):
+    if norm(src_path) == norm(final_dest_path):
         #print(f"    INFO: Origem e destino são os mesmos, não é necessário mover: {src_path}") # Log opcional
-        return
+        return "skipped"
     
     # Se a pasta de origem já estiver no local de destino correto (mesmo pai)
-    if os.path.abspath(os.path.dirname(src_path)) == os.path.abspath(dest_parent_path):
+    if norm(os.path.dirname(src_path)) == norm(dest_parent_path):
         #print(f"    INFO: Pasta {folder_name} já está em {dest_parent_path}. Nenhuma ação de movimentação necessária.") # Log opcional
-        return
+        return "skipped"
 
-    if os.path.exists(final_dest_path):
+    if exists(final_dest_path):
         print(f"    ERRO CRÍTICO AO MOVER: Destino final já existe! {final_dest_path}. Não foi possível mover {src_path}.")
         print(f"    Esta situação pode ocorrer se duas pastas com o mesmo nome de fontes diferentes tentarem ser movidas para o mesmo local,")
         print(f"    ou se a limpeza inicial das pastas [2025]/[FISCAL] e [2025]/[CONTABIL] não foi suficiente.")
         print(f"    VERIFIQUE MANUALMENTE. Regra 9 impede a sobrescrita de conteúdo existente nas pastas alvo de movimentação (itens 2 e 3).")
-        return
+        return "error"
 
     try:
         if not DRY_RUN:
             os.makedirs(dest_parent_path, exist_ok=True) # Garante que o diretório pai de destino exista
             shutil.move(src_path, dest_parent_path) # shutil.move(src, dst_dir) move src para dentro de dst_dir
+        if index is not None:
+            index.record_move(src_path, dest_parent_path)
         print(f"    {'[DRY RUN] ' if DRY_RUN else ''}Movida pasta: {src_path} -> {dest_parent_path}")
+        return "moved"
     except Exception as e:
         print(f"    ERRO ao mover {src_path} para {dest_parent_path}: {e}")
+        return "error"
 
-def safe_delete_folder(folder_path):
-    """Deleta uma pasta de forma segura."""
-    if not os.path.exists(folder_path):
+def safe_delete_folder(folder_path, index=None, op_id=None):
+    """Deleta uma pasta de forma segura com o motor de deleção (com index, as verificações usam o FolderTreeIndex).
+
+    op_id é a operação já planejada no diário de operações, se houver.
+    Retorna a contagem do delete_tree ("files", "folders", "bytes", "error") ou {"skipped": 1}.
+    """
+    exists = index.exists if index is not None else os.path.exists
+    is_dir = index.is_dir if index is not None else os.path.isdir
+    journal = get_journal() if not DRY_RUN else None
+
+    if not exists(folder_path):
         #print(f"    AVISO: Tentativa de deletar pasta inexistente: {folder_path}") # Pode ser normal se já foi deletada como parte de um pai
-        return
-    if not os.path.isdir(folder_path):
+        if journal is not None and op_id is not None:
+            journal.skipped(op_id)
+        return Counter(skipped=1)
+    if not is_dir(folder_path):
         print(f"    AVISO: Item a ser deletado não é uma pasta: {folder_path}")
-        return
+        if journal is not None and op_id is not None:
+            journal.skipped(op_id)
+        return Counter(skipped=1)
     try:
-        if not DRY_RUN:
-            shutil.rmtree(folder_path)
-        print(f"    {'[DRY RUN] ' if DRY_RUN else ''}Deletada pasta (rogue/fora de {YEAR_FOLDER_NAME}): {folder_path}")
+        stats = delete_tree(folder_path, op_id=op_id) # DRY_RUN é verificado dentro
     except Exception as e:
         print(f"    ERRO ao deletar pasta {folder_path}: {e}")
+        if journal is not None and op_id is not None:
+            journal.failed(op_id, e)
+        return Counter(error=1)
+    if stats["error"]:
+        print(f"    ERRO ao deletar pasta {folder_path}: {stats['error']} item(ns) não removido(s)")
+        return stats
+    if index is not None:
+        index.record_delete(folder_path)
+    print(f"    {'[DRY RUN] ' if DRY_RUN else ''}Deletada pasta (rogue/fora de {YEAR_FOLDER_NAME}): {folder_path} ({describe_deletion(stats)})")
+    return stats
 
 
 # --- Lógica Principal de Processamento ---
+def index_cnpj_folder(cnpj_folder_path, year_folder_path, fiscal_in_2025_path, contabil_in_2025_path):
+    """Indexa a árvore de uma pasta de CNPJ com os.scandir e planeja as deleções/movimentações (FolderTreeIndex)."""
+    rules = get_rules()
+    index = FolderTreeIndex(cnpj_folder_path)
+    fiscal_norm = index.norm(fiscal_in_2025_path)
+    contabil_norm = index.norm(contabil_in_2025_path)
+    destinations = {
+        CONTABIL_FOLDER_NAME: contabil_norm,
+        FISCAL_FOLDER_NAME: fiscal_norm,
+    }
+
+    # Pilha em vez de recursão; as pastas que serão movidas/deletadas não são percorridas
+    pending = [(cnpj_folder_path, index.norm(cnpj_folder_path))]
+    index.add_dir(*pending[0])
+    while pending:
+        root, root_norm = pending.pop()
+        names = index.children[root_norm] = set()
+        try:
+            with os.scandir(root) as entries:
+                entries = list(entries)
+        except OSError as e:
+            print(f"    ERRO ao listar {root}: {e}")
+            continue
+
+        # Não processar nada que já esteja dentro das pastas finais [FISCAL] ou [CONTABIL] em [2025]:
+        # apenas o conteúdo é indexado, para a verificação de destino já existente
+        is_final_folder = root_norm == fiscal_norm or root_norm == contabil_norm
+
+        subfolders = []
+        for entry in entries:
+            folder_name = entry.name
+            names.add(os.path.normcase(folder_name))
+            try:
+                if is_final_folder or not entry.is_dir():
+                    continue
+            except OSError:
+                continue
+            current_folder_path = entry.path
+            current_folder_norm = os.path.join(root_norm, os.path.normcase(folder_name))
+            index.add_dir(current_folder_path, current_folder_norm)
+
+            # Item 1.C: Identificar [FISCAL] e [CONTABIL] fora de [2025] para deleção.
+            if folder_name in destinations and current_folder_norm != destinations[folder_name]:
+                index.delete_rogue[current_folder_norm] = current_folder_path
+                continue # Não descer mais nesta pasta, pois será deletada
+
+            # Itens 2, 3, 4: Identificar pastas para mover
+            dest_parent_path = None
+            if folder_name in rules.folders_to_contabil:
+                dest_parent_path = contabil_in_2025_path
+            elif folder_name in rules.folders_to_fiscal:
+                dest_parent_path = fiscal_in_2025_path
+            elif folder_name == MANUAL_REVIEW_FOLDER_NAME:
+                dest_parent_path = year_folder_path
+
+            # Só marcar para mover se a pasta PAI atual (root) não for já a pasta PAI de destino.
+            if dest_parent_path and root_norm != index.norm(dest_parent_path):
+                index.move.setdefault(current_folder_norm, (current_folder_path, dest_parent_path))
+                continue # Não descer mais nesta pasta, pois ela será movida
+
+            # Como no os.walk, links para pastas não são percorridos
+            if not entry.is_symlink():
+                subfolders.append((current_folder_path, current_folder_norm))
+        pending.extend(reversed(subfolders))
+
+    return index
+
+
 def process_cnpj_folder(cnpj_folder_path):
-    """Processa uma única pasta de CNPJ."""
+    """Processa uma única pasta de CNPJ. Retorna a contagem das operações ("moved", "files", "folders", "bytes", "error"...).
+
+    Na retomada pelo diário de operações, uma pasta concluída é ignorada e um plano já gravado é
+    terminado a partir do diário, sem limpar [FISCAL]/[CONTABIL] de novo nem reindexar.
+    """
     print(f"\n--- Processando pasta CNPJ: {cnpj_folder_path} ---")
+    statuses = Counter()
+    journal = get_journal() if not DRY_RUN else None
+    if journal is not None:
+        if journal.is_group_done(cnpj_folder_path):
+            print("  Pasta já concluída na execução retomada (diário de operações).")
+            return statuses
+        ops = journal.pending_plan(cnpj_folder_path)
+        if ops is not None:
+            print(f"  Retomando {len(ops)} operação(ões) pendente(s) do diário de operações...")
+            statuses.update(replay_operations(journal, ops))
+            journal.group_done(cnpj_folder_path)
+            return statuses
 
     # Item 7 & 1.B.III: Criar a pasta [2025]
     year_folder_path = os.path.join(cnpj_folder_path, YEAR_FOLDER_NAME)
@@ -656,75 +3136,88 @@ def process_cnpj_folder(cnpj_folder_path):
     for target_structured_folder in [fiscal_in_2025_path, contabil_in_2025_path]:
         if os.path.exists(target_structured_folder):
             print(f"  Pasta {os.path.basename(target_structured_folder)} existe em {year_folder_path}. Limpando conteúdo (Item 1.A)...")
-            clear_folder_contents(target_structured_folder) # DRY_RUN é verificado dentro
+            statuses.update(clear_folder_contents(target_structured_folder)) # DRY_RUN é verificado dentro
         else:
             if not DRY_RUN:
                 os.makedirs(target_structured_folder, exist_ok=True)
             print(f"  {'[DRY RUN] ' if DRY_RUN else ''}Criada pasta: {target_structured_folder} (Item 1.B)")
     
-    actions_to_take = {
-        "delete_rogue": [], 
-        "move": []          
-    }
-
-    # Usamos topdown=True para poder modificar dirnames e evitar descer em pastas que serão movidas/deletadas
-    for root, dirnames, filenames in os.walk(cnpj_folder_path, topdown=True):
-        
-        # Não processar nada que já esteja dentro das pastas finais [FISCAL] ou [CONTABIL] em [2025]
-        if os.path.abspath(root) == os.path.abspath(fiscal_in_2025_path) or \
-           os.path.abspath(root) == os.path.abspath(contabil_in_2025_path):
-            dirnames[:] = [] 
-            continue
-        
-        # Iterar sobre uma cópia de dirnames porque podemos modificá-la de trás para frente
-        for d_idx in range(len(dirnames) - 1, -1, -1): 
-            folder_name = dirnames[d_idx]
-            current_folder_path = os.path.join(root, folder_name)
-
-            # Item 1.C: Identificar [FISCAL] e [CONTABIL] fora de [2025] para deleção.
-            is_fiscal_folder = (folder_name == FISCAL_FOLDER_NAME)
-            is_contabil_folder = (folder_name == CONTABIL_FOLDER_NAME)
+    # Planejamento em uma única passada; o mesmo índice é usado na execução
+    index = index_cnpj_folder(cnpj_folder_path, year_folder_path, fiscal_in_2025_path, contabil_in_2025_path)
+    rogue_folders = index.rogue_folders()
+    moves = list(index.move.values())
 
-            if (is_fiscal_folder and os.path.abspath(current_folder_path) != os.path.abspath(fiscal_in_2025_path)) or \
-               (is_contabil_folder and os.path.abspath(current_folder_path) != os.path.abspath(contabil_in_2025_path)):
-                if current_folder_path not in actions_to_take["delete_rogue"]: # Evitar duplicatas
-                    actions_to_take["delete_rogue"].append(current_folder_path)
-                del dirnames[d_idx] # Não descer mais nesta pasta, pois será deletada
-                continue # Processada para deleção, não considerar para mover
+    # O plano inteiro vai para o diário antes da primeira deleção/movimentação
+    delete_ids = [None] * len(rogue_folders)
+    move_ids = [None] * len(moves)
+    if journal is not None:
+        op_ids = journal.plan_batch(cnpj_folder_path,
+            [{'op': "delete", 'origem': folder_path} for folder_path in rogue_folders] +
+            [{'op': "move", 'origem': src_path, 'destino': os.path.join(dest_parent_path, os.path.basename(src_path))}
+             for src_path, dest_parent_path in moves])
+        delete_ids, move_ids = op_ids[:len(rogue_folders)], op_ids[len(rogue_folders):]
 
-            # Itens 2, 3, 4: Identificar pastas para mover
-            dest_parent_path = None
-            if folder_name in FOLDERS_TO_CONTABIL:
-                dest_parent_path = contabil_in_2025_path
-            elif folder_name in FOLDERS_TO_FISCAL:
-                dest_parent_path = fiscal_in_2025_path
-            elif folder_name == MANUAL_REVIEW_FOLDER_NAME:
-                dest_parent_path = year_folder_path
-            
-            if dest_parent_path:
-                # Só marcar para mover se a pasta PAI atual (root) não for já a pasta PAI de destino.
-                if os.path.abspath(root) != os.path.abspath(dest_parent_path):
-                    is_already_listed_to_move = any(op[0] == current_folder_path for op in actions_to_take["move"])
-                    if not is_already_listed_to_move:
-                        actions_to_take["move"].append((current_folder_path, dest_parent_path))
-                    del dirnames[d_idx] # Não descer mais nesta pasta, pois ela será movida
-    
     # Executar deleções (pastas rogue) - mais profundas primeiro (ordenando pelo comprimento do caminho)
-    actions_to_take["delete_rogue"].sort(key=len, reverse=True)
-    if actions_to_take["delete_rogue"]:
+    if rogue_folders:
         print(f"  Deletando pastas [FISCAL]/[CONTABIL] encontradas fora de '{YEAR_FOLDER_NAME}' (Item 1.C)...")
-        for folder_path in actions_to_take["delete_rogue"]:
-            safe_delete_folder(folder_path)
+        for folder_path, op_id in zip(rogue_folders, delete_ids):
+            statuses.update(safe_delete_folder(folder_path, index, op_id))
 
     # Executar movimentações
-    if actions_to_take["move"]:
+    if moves:
         print(f"  Movendo pastas para suas localizações designadas (Itens 2, 3, 4)...")
-        for src_path, dest_parent_path in actions_to_take["move"]:
-            safe_move_folder(src_path, dest_parent_path)
+        for (src_path, dest_parent_path), op_id in zip(moves, move_ids):
+            statuses[safe_move_folder(src_path, dest_parent_path, index, op_id)] += 1
 
+    if journal is not None:
+        journal.group_done(cnpj_folder_path)
+    return statuses
 
-def main():
-    """Função principal para percorrer as pastas dos clientes."""
+
+class GroupedOutput:
+    """Substituto de sys.stdout que agrupa a saída por thread.
+
+    O que uma thread imprime dentro de capture() vai para um buffer próprio, impresso de uma vez
+    depois; fora de capture(), a saída segue direto para o stdout original.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer if buffer is not None else self._stream).write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    @contextlib.contextmanager
+    def capture(self):
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+
+def process_cnpj_folder_grouped(cnpj_folder_path, output):
+    """Executa process_cnpj_folder em uma thread do pool; retorna (saída, contagem por status)."""
+    with output.capture() as buffer:
+        try:
+            statuses = process_cnpj_folder(cnpj_folder_path)
+        except Exception as e:
+            print(f"  ERRO ao processar pasta CNPJ {cnpj_folder_path}: {e}")
+            statuses = Counter(error=1)
+    return buffer.getvalue(), statuses
+
+
+def main(workers=REORG_WORKERS):
+    """Função principal para percorrer as pastas dos clientes (com workers > 1, as pastas de CNPJ são processadas em paralelo)."""
     print("Iniciando script de organização de pastas de clientes.")
     if DRY_RUN:
         print("*" * 60)
@@ -738,29 +3231,86 @@ def main():
         print(f"ERRO CRÍTICO: O caminho base '{BASE_PATH}' não existe. Verifique a configuração.")
         return
 
-    # Nível 1: Pastas de "grupo de clientes" (ex: ftp4idistribuidora)
-    for client_group_name in os.listdir(BASE_PATH):
-        client_group_path = os.path.join(BASE_PATH, client_group_name)
-        if not os.path.isdir(client_group_path):
-            print(f"Item ignorado (não é diretório): {client_group_path}")
-            continue
-        
-        print(f"\n>> Processando grupo de clientes: {client_group_name}")
+    journal = get_journal() if not DRY_RUN else None
+    if journal is not None:
+        if journal.stage_finished("reorganizacao"):
+            print("Reorganização já concluída na execução retomada (diário de operações).")
+            return
+        journal.begin("reorganizacao")
+
+    totals = Counter()
+    folders_with_errors = []
+    processed = 0
 
-        # Nível 2: Pastas de "CNPJ - ID - Nome_do_Cliente"
-        for cnpj_id_name_folder_name in os.listdir(client_group_path):
-            cnpj_folder_path = os.path.join(client_group_path, cnpj_id_name_folder_name)
-            if not os.path.isdir(cnpj_folder_path):
-                print(f"  Item ignorado (não é diretório): {cnpj_folder_path}")
+    def collect(cnpj_folder_path, statuses):
+        nonlocal processed
+        processed += 1
+        totals.update(statuses)
+        if statuses["error"]:
+            folders_with_errors.append((cnpj_folder_path, statuses["error"]))
+
+    # Em paralelo, cada pasta de CNPJ tem a sua saída agrupada e impressa ao concluir
+    output = GroupedOutput(sys.stdout) if workers > 1 else None
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    futures = {}
+    if output is not None:
+        sys.stdout = output
+    try:
+        # Nível 1: Pastas de "grupo de clientes" (ex: ftp4idistribuidora)
+        for client_group_name in os.listdir(BASE_PATH):
+            client_group_path = os.path.join(BASE_PATH, client_group_name)
+            if not os.path.isdir(client_group_path):
+                print(f"Item ignorado (não é diretório): {client_group_path}")
                 continue
             
-            process_cnpj_folder(cnpj_folder_path)
+            print(f"\n>> Processando grupo de clientes: {client_group_name}")
+            reload_rules_if_changed()
+
+            # Nível 2: Pastas de "CNPJ - ID - Nome_do_Cliente"
+            for cnpj_id_name_folder_name in os.listdir(client_group_path):
+                cnpj_folder_path = os.path.join(client_group_path, cnpj_id_name_folder_name)
+                if not os.path.isdir(cnpj_folder_path):
+                    print(f"  Item ignorado (não é diretório): {cnpj_folder_path}")
+                    continue
+                
+                if executor is None:
+                    collect(cnpj_folder_path, process_cnpj_folder(cnpj_folder_path))
+                else:
+                    futures[executor.submit(process_cnpj_folder_grouped, cnpj_folder_path, output)] = cnpj_folder_path
+
+        if futures:
+            print(f"\n{len(futures)} pasta(s) de CNPJ em processamento ({workers} em paralelo)...")
+        for future in as_completed(futures):
+            text, statuses = future.result()
+            print(text, end="")
+            collect(futures[future], statuses)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if output is not None:
+            sys.stdout = output._stream
+
+    if journal is not None:
+        journal.end("reorganizacao")
 
     print("\n" + "="*30 + " PROCESSO DE ORGANIZAÇÃO CONCLUÍDO " + "="*30)
+    print(f"Pastas de CNPJ processadas: {processed}")
+    print(f"Pastas movidas: {totals['moved']}")
+    print(f"Arquivos deletados: {totals['files']}")
+    print(f"Pastas deletadas: {totals['folders']}")
+    print(f"Espaço liberado: {format_size(totals['bytes'])}")
+    print(f"Erros: {totals['error']}")
+    for cnpj_folder_path, errors in folders_with_errors:
+        print(f"  {errors} erro(s) em: {cnpj_folder_path}")
     if DRY_RUN:
         print("Lembre-se: Nenhuma alteração real foi feita (DRY RUN).")
 
 if __name__ == "__main__":
+    reorg_parser = argparse.ArgumentParser(description="Reorganização das pastas de CNPJ em [2025]/[FISCAL|CONTABIL]")
+    reorg_parser.add_argument("--reorg-workers", type=int, default=REORG_WORKERS,
+                              help="Pastas de CNPJ reorganizadas em paralelo (padrão: %(default)s; 1 = sequencial)")
+    reorg_args, _ = reorg_parser.parse_known_args()
+
     if not DRY_RUN:
         print("!"*70)
         print("!!! ATENÇÃO MODO REAL ATIVADO !!!")
@@ -772,130 +3322,47 @@ if __name__ == "__main__":
         if confirm == "SIM_EU_TENHO_CERTEZA":
             print("\nConfirmação recebida. Iniciando operações reais em 5 segundos...")
             time.sleep(5)
-            main()
+            main(workers=reorg_args.reorg_workers)
         else:
             print("\nOperação cancelada pelo usuário. Nenhuma alteração foi feita.")
     else:
-        main()
+        main(workers=reorg_args.reorg_workers)
 
 
 def forcar_remocao(path):
     """
-    Força a remoção de arquivos/pastas mesmo com proteção.
+    Força a remoção de arquivos/pastas mesmo com proteção (motor de deleção, respeita o DRY_RUN).
     """
     try:
-        # Remove atributo somente leitura
-        os.chmod(path, stat.S_IWRITE)
-        
-        if os.path.isfile(path):
-            os.remove(path)
-        elif os.path.isdir(path):
-            shutil.rmtree(path)
-        return True
-    except:
+        return not delete_tree(path)["error"]
+    except Exception:
         return False
 
 def limpar_pasta_forcado(diretorio_pai):
     """
     Remove TUDO do diretório pai exceto a pasta [2025].
-    Usa métodos mais agressivos.
+    Uma única passada pela árvore; itens protegidos (somente leitura) são liberados no próprio item.
+    Retorna True se todos os itens foram removidos.
     """
     print(f"\n🎯 LIMPANDO: {diretorio_pai}")
     
     try:
-        # Listar tudo no diretório
-        todos_itens = os.listdir(diretorio_pai)
-        print(f"📋 Itens encontrados: {todos_itens}")
-        
-        removidos = 0
-        falhas = 0
-        
-        for item_name in todos_itens:
-            # NUNCA remover a pasta [2025]
-            if item_name == '[2025]':
-                print(f"✅ PRESERVANDO: {item_name}")
-                continue
-            
-            item_path = os.path.join(diretorio_pai, item_name)
-            print(f"🗑️ REMOVENDO: {item_name}")
-            
-            # Método 1: Tentar remoção normal
-            try:
-                if os.path.isfile(item_path):
-                    os.remove(item_path)
-                    print(f"   ✅ Arquivo removido: {item_name}")
-                    removidos += 1
-                    continue
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-                    print(f"   ✅ Pasta removida: {item_name}")
-                    removidos += 1
-                    continue
-            except:
-                pass
-            
-            # Método 2: Forçar remoção alterando permissões
-            try:
-                if os.path.isdir(item_path):
-                    # Para pastas, alterar permissões recursivamente
-                    for root, dirs, files in os.walk(item_path):
-                        for d in dirs:
-                            try:
-                                os.chmod(os.path.join(root, d), stat.S_IWRITE)
-                            except:
-                                pass
-                        for f in files:
-                            try:
-                                os.chmod(os.path.join(root, f), stat.S_IWRITE)
-                            except:
-                                pass
-                    
-                    # Alterar permissão da pasta principal
-                    os.chmod(item_path, stat.S_IWRITE)
-                    shutil.rmtree(item_path)
-                    print(f"   ✅ Pasta removida (método 2): {item_name}")
-                    removidos += 1
-                    continue
-                else:
-                    # Para arquivos
-                    os.chmod(item_path, stat.S_IWRITE)
-                    os.remove(item_path)
-                    print(f"   ✅ Arquivo removido (método 2): {item_name}")
-                    removidos += 1
-                    continue
-            except:
-                pass
-            
-            # Método 3: Usando subprocess para del/rmdir (Windows)
-            if os.name == 'nt':  # Windows
-                try:
-                    import subprocess
-                    if os.path.isdir(item_path):
-                        subprocess.run(['rmdir', '/s', '/q', item_path], shell=True, check=True)
-                        print(f"   ✅ Pasta removida (cmd): {item_name}")
-                        removidos += 1
-                        continue
-                    else:
-                        subprocess.run(['del', '/f', '/q', f'"{item_path}"'], shell=True, check=True)
-                        print(f"   ✅ Arquivo removido (cmd): {item_name}")
-                        removidos += 1
-                        continue
-                except:
-                    pass
-            
-            # Se chegou aqui, não conseguiu remover
-            print(f"   ❌ FALHA ao remover: {item_name}")
-            falhas += 1
+        # NUNCA remover a pasta [2025]
+        print(f"✅ PRESERVANDO: [2025]")
+        resultado = delete_tree(diretorio_pai, contents_only=True, keep=('[2025]',))
+        falhas = resultado["error"]
         
-        print(f"📊 RESULTADO: {removidos} removidos, {falhas} falhas")
+        print(f"📊 RESULTADO: {'[DRY RUN] ' if DRY_RUN else ''}{describe_deletion(resultado)} removidos, {falhas} falhas")
         
         if falhas == 0:
             print("🎉 SUCESSO TOTAL! Todos os itens foram removidos!")
         else:
             print(f"⚠️ {falhas} itens não puderam ser removidos")
+        return falhas == 0
             
     except Exception as e:
         print(f"❌ ERRO CRÍTICO ao processar {diretorio_pai}: {e}")
+        return False
 
 def main():
     pasta_raiz = r"C:\Users\lauro\Desktop\amostragem"
@@ -904,6 +3371,8 @@ def main():
     print("🔥 LIMPADOR AGRESSIVO DE DIRETÓRIOS [2025] 🔥")
     print("=" * 70)
     print(f"📂 Pasta raiz: {pasta_raiz}")
+    if DRY_RUN:
+        print("⚠️ DRY RUN: nada será removido (mude DRY_RUN para False no script)")
     print()
     
     if not os.path.exists(pasta_raiz):
@@ -926,9 +3395,24 @@ def main():
     print(f"\n🎯 Total de diretórios para processar: {len(pastas_2025_encontradas)}")
     print("\n🚀 INICIANDO LIMPEZA AGRESSIVA...")
     
+    # Diário de operações: na retomada, diretórios já limpos são ignorados
+    journal = get_journal() if not DRY_RUN else None
+    if journal is not None:
+        if journal.stage_finished("limpeza"):
+            print("✅ Limpeza já concluída na execução retomada (diário de operações)")
+            return
+        journal.begin("limpeza")
+    
     # Processar cada diretório que contém [2025]
     for diretorio in pastas_2025_encontradas:
-        limpar_pasta_forcado(diretorio)
+        if journal is not None and journal.is_group_done(diretorio):
+            print(f"\n⏭️ Já limpo na execução retomada: {diretorio}")
+            continue
+        if limpar_pasta_forcado(diretorio) and journal is not None:
+            journal.group_done(diretorio)
+    
+    if journal is not None:
+        journal.end("limpeza")
     
     print("\n" + "=" * 70)
     print("🏁 PROCESSO CONCLUÍDO!")